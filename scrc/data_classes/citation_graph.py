@@ -0,0 +1,165 @@
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class CsrGraph:
+    """
+    Directed graph in compressed sparse row form with integer node ids:
+    the targets of the source node i are indices[indptr[i]:indptr[i + 1]]
+    """
+    indptr: np.ndarray
+    indices: np.ndarray
+    num_targets: int
+
+    @classmethod
+    def from_edges(cls, sources: np.ndarray, targets: np.ndarray, num_sources: int, num_targets: int) -> 'CsrGraph':
+        """Builds the graph from the two arrays of the edges (duplicate edges are kept)"""
+        sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(num_sources + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_sources), out=indptr[1:])
+        return cls(indptr=indptr, indices=targets[order], num_targets=num_targets)
+
+    @property
+    def num_sources(self) -> int:
+        return len(self.indptr) - 1
+
+    def neighbors(self, node: int) -> np.ndarray:
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def out_degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def in_degree(self) -> np.ndarray:
+        return np.bincount(self.indices, minlength=self.num_targets)
+
+    def transpose(self) -> 'CsrGraph':
+        sources = np.repeat(np.arange(self.num_sources), self.out_degree())
+        return CsrGraph.from_edges(self.indices, sources, self.num_targets, self.num_sources)
+
+
+@dataclass
+class CitationGraph:
+    """
+    Citation and appeal graph of the whole corpus.
+    The decisions are identified by dense integer node ids sorted by (language, database id).
+    citations:  decision -> cited ruling (index into rulings)
+    appeals:    decision of the higher court -> decision of the lower court it references
+    referenced_chambers are all the lower court chambers referenced by a higher court (even if nothing matched)
+    """
+    decision_langs: np.ndarray
+    decision_ids: np.ndarray
+    decision_chambers: np.ndarray
+    decision_dates: np.ndarray  # datetime64[D], NaT if unknown
+    rulings: np.ndarray
+    citations: CsrGraph
+    appeals: CsrGraph
+    referenced_chambers: np.ndarray = field(default_factory=lambda: np.array([], dtype=str))
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def num_decisions(self) -> int:
+        return len(self.decision_ids)
+
+    def get_nodes(self, lang: str, ids) -> np.ndarray:
+        """Returns the node ids of the decisions with the given database ids of a language (-1 if not in the graph)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        start = np.searchsorted(self.decision_langs, lang, side='left')
+        end = np.searchsorted(self.decision_langs, lang, side='right')
+        lang_ids = self.decision_ids[start:end]
+        positions = np.searchsorted(lang_ids, ids)
+        found = positions < len(lang_ids)
+        found[found] = lang_ids[positions[found]] == ids[found]
+        return np.where(found, start + positions, -1)
+
+    def get_citation_counts(self) -> pd.Series:
+        """Returns how often each ruling is cited in the corpus (the in-degree of the rulings)"""
+        return pd.Series(self.citations.in_degree(), index=self.rulings).sort_values(ascending=False)
+
+    def get_appeal_counts(self) -> np.ndarray:
+        """Returns for every decision by how many decisions of a higher court it is referenced"""
+        return self.appeals.in_degree()
+
+    def get_appeal_chain(self, node: int) -> List[int]:
+        """Returns the node and all the lower court decisions it (transitively) references, highest instance first"""
+        chain, queue, seen = [], deque([node]), {node}
+        while queue:
+            current = queue.popleft()
+            chain.append(current)
+            for lower_node in self.appeals.neighbors(current):
+                if lower_node not in seen:
+                    seen.add(lower_node)
+                    queue.append(int(lower_node))
+        return chain
+
+    def get_decisions_in_date_window(self, chamber: str, date, window_days: int = 0) -> np.ndarray:
+        """Returns the nodes of the decisions of the chamber at most window_days away from the date"""
+        _, right_positions = date_window_join(np.array([chamber], dtype=object),
+                                              np.array([date], dtype='datetime64[D]'),
+                                              self.decision_chambers, self.decision_dates, window_days)
+        return right_positions
+
+    def save(self, path: Path):
+        np.savez(path,
+                 decision_langs=self.decision_langs, decision_ids=self.decision_ids,
+                 decision_chambers=self.decision_chambers.astype(str), decision_dates=self.decision_dates,
+                 rulings=self.rulings.astype(str),
+                 citations_indptr=self.citations.indptr, citations_indices=self.citations.indices,
+                 appeals_indptr=self.appeals.indptr, appeals_indices=self.appeals.indices,
+                 referenced_chambers=self.referenced_chambers.astype(str),
+                 stats_keys=np.array(list(self.stats.keys()), dtype=str),
+                 stats_values=np.array(list(self.stats.values()), dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: Path) -> 'CitationGraph':
+        with np.load(path) as arrays:
+            decision_chambers = arrays['decision_chambers'].astype(object)
+            decision_chambers[decision_chambers == 'None'] = None
+            num_decisions = len(arrays['decision_ids'])
+            return cls(decision_langs=arrays['decision_langs'], decision_ids=arrays['decision_ids'],
+                       decision_chambers=decision_chambers, decision_dates=arrays['decision_dates'],
+                       rulings=arrays['rulings'],
+                       citations=CsrGraph(arrays['citations_indptr'], arrays['citations_indices'],
+                                          len(arrays['rulings'])),
+                       appeals=CsrGraph(arrays['appeals_indptr'], arrays['appeals_indices'], num_decisions),
+                       referenced_chambers=arrays['referenced_chambers'],
+                       stats=dict(zip(arrays['stats_keys'].tolist(), arrays['stats_values'].tolist())))
+
+
+def date_window_join(left_keys: np.ndarray, left_dates: np.ndarray, right_keys: np.ndarray, right_dates: np.ndarray,
+                     window_days: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Joins the left and the right entries with equal keys and dates at most window_days apart in one vectorised pass.
+    Entries with a missing key or date are never joined.
+    :return:    the positions of the joined entries in the left and the right arrays
+    """
+    left_dates = np.asarray(left_dates, dtype='datetime64[D]')
+    right_dates = np.asarray(right_dates, dtype='datetime64[D]')
+    codes, _ = pd.factorize(np.concatenate([np.asarray(left_keys, dtype=object), np.asarray(right_keys, dtype=object)]))
+    left_codes, right_codes = codes[:len(left_keys)], codes[len(left_keys):]
+
+    valid_right = np.flatnonzero((right_codes >= 0) & ~np.isnat(right_dates))
+    right_days = right_dates[valid_right].astype(np.int64)
+    # sort the right entries by key and date so that each window is a contiguous range
+    order = valid_right[np.lexsort((right_days, right_codes[valid_right]))]
+    offset = 2 ** 31  # the days since 1970 are way smaller than that
+    right_composite = right_codes[order].astype(np.int64) * 2 ** 32 + right_dates[order].astype(np.int64) + offset
+
+    valid_left = np.flatnonzero((left_codes >= 0) & ~np.isnat(left_dates))
+    left_composite = left_codes[valid_left].astype(np.int64) * 2 ** 32 + left_dates[valid_left].astype(np.int64) \
+                     + offset
+    lower = np.searchsorted(right_composite, left_composite - window_days, side='left')
+    upper = np.searchsorted(right_composite, left_composite + window_days, side='right')
+
+    counts = upper - lower
+    left_positions = np.repeat(valid_left, counts)
+    range_starts = np.repeat(lower, counts)
+    range_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_positions = order[range_starts + range_offsets]
+    return left_positions, right_positions
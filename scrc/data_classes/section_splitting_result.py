@@ -0,0 +1,22 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from scrc.enums.section import Section
+from scrc.enums.section_splitting_status import SectionSplittingStatus
+
+
+@dataclass
+class SectionSplittingResult:
+    """
+    The (possibly partial) sections of one decision.
+    If the splitting got stuck, stuck_section is the last section reached
+    and stuck_paragraph_index the index of the paragraph where this section started.
+    """
+    paragraphs_by_section: Dict[Section, List[str]] = field(default_factory=dict)
+    status: SectionSplittingStatus = SectionSplittingStatus.COMPLETE
+    stuck_section: Optional[Section] = None
+    stuck_paragraph_index: Optional[int] = None
+
+    @property
+    def is_complete(self) -> bool:
+        return self.status == SectionSplittingStatus.COMPLETE
@@ -1,5 +1,7 @@
 import configparser
 import inspect
+import multiprocessing
+import re
 from collections import Counter
 
 from root import ROOT_DIR
@@ -8,7 +10,8 @@ from scrc.utils.log_utils import get_logger
 import numpy as np
 import pandas as pd
 
-from scrc.utils.main_utils import get_config, string_contains_one_of_list
+from scrc.utils.aho_corasick import AhoCorasick
+from scrc.utils.main_utils import get_config
 from scrc.utils.term_definitions_converter import TermDefinitionsConverter
 
 
@@ -29,47 +32,75 @@ class CitationDatasetCreator(DatasetCreator):
 
 
     def get_dataset(self, feature_col, lang, save_reports):
-        df = self.get_df(self.get_engine(self.db_scrc), feature_col, 'citations', lang, save_reports)
+        engine = self.get_engine(self.db_scrc)
 
         this_function_name = inspect.currentframe().f_code.co_name
         folder = self.create_dir(self.datasets_subdir, this_function_name)
 
+        # first pass over the citations only to count them
+        citation_counters = self.count_citations(engine, lang)
+
         # calculate most common BGE citations
-        most_common_rulings = self.get_most_common_citations(df, folder, 'rulings')
+        most_common_rulings = self.get_most_common_citations(citation_counters, folder, 'rulings')
 
         # list with only the most common laws
-        most_common_laws = self.get_most_common_citations(df, folder, 'laws')
+        most_common_laws = self.get_most_common_citations(citation_counters, folder, 'laws')
 
         law_abbr_by_lang = self.get_law_abbr_by_lang()
 
         #  IMPORTANT: we need to take care of the fact that the laws are named differently in each language but refer to the same law!
-        def replace_citations(series, ref_mask_token="<ref>"):
-            # TODO think about splitting laws and rulings into two separate labels
-            labels = set()
-            for law in series.citations['laws']:
-                citation = law['text']
-                found_string_in_list = string_contains_one_of_list(citation, list(law_abbr_by_lang[lang].keys()))
-                if found_string_in_list:
-                    series.text = series.text.replace(citation, ref_mask_token)
-                    labels.add(law_abbr_by_lang['de'][found_string_in_list])
-            for ruling in series.citations['rulings']:
-                citation = ruling['text']
-                if string_contains_one_of_list(citation, most_common_rulings):
-                    series.text = series.text.replace(citation, ref_mask_token)
-                    labels.add(citation)
-            series['label'] = list(labels)
-            return series
-
-        df = df.apply(replace_citations, axis='columns')
-        df = df.rename(columns={"text": "text"})  # normalize column names
-        labels, _ = list(np.unique(np.hstack(df.label), return_index=True))
-        return df, labels
-
-    def get_most_common_citations(self, df, folder, type, plot_n_most_common=10):
+        # therefore the laws are labelled with the id of the law, which is the same for the abbreviations of all languages
+        citation_masker = CitationMasker(law_abbrs=list(law_abbr_by_lang[lang].keys()),
+                                         law_labels=law_abbr_by_lang[lang],
+                                         rulings=most_common_rulings)
+
+        # second pass to mask the citations chunk by chunk
+        # the pool is started once per language and every worker receives the masker only once
+        with multiprocessing.Pool(self.num_cpus, initializer=init_citation_masking_worker,
+                                  initargs=(citation_masker,)) as pool:
+            for df in self.get_df(engine, feature_col, 'citations', lang, save_reports):
+                df['text'], df['label'] = self.mask_citations(df, pool)
+                df = df.rename(columns={"text": "text"})  # normalize column names
+                yield df
+
+    def mask_citations(self, df, pool):
+        """
+        Masks the citations of the df in the process pool (only the texts and citations are sent to the workers)
+        :param df:      the df containing the columns text and citations
+        :param pool:    the pool whose workers have been initialized with the citation masker of the language
+        :return:        the masked texts and the labels
+        """
+        texts, citations = df.text.tolist(), df.citations.tolist()
+        batch_size = max(-(-len(texts) // self.num_cpus), 1)  # one batch per cpu
+        batches = [(texts[i:i + batch_size], citations[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        results = [result for batch_results in pool.map(mask_citations_of_batch, batches)
+                   for result in batch_results]
+        masked_texts = [text for text, _ in results]
+        labels = [labels for _, labels in results]
+        return masked_texts, labels
+
+    def count_citations(self, engine, lang):
+        """
+        Counts the citations of each type (rulings/laws) by streaming only the citations column
+        :param engine:  the engine of the database
+        :param lang:    the language of the table
+        :return:        a dict containing a Counter of the citation texts per type
+        """
+        citation_counters = {'rulings': Counter(), 'laws': Counter()}
+        for df in self.select(engine, lang, columns="citations", where="citations IS NOT NULL",
+                              chunksize=self.get_chunksize()):
+            for citations in df.citations:
+                for type, counter in citation_counters.items():
+                    counter.update(type_citation['text'] for type_citation in citations[type])
+            if self.debug:
+                break  # the first chunk is enough for testing
+        return citation_counters
+
+    def get_most_common_citations(self, citation_counters, folder, type, plot_n_most_common=10):
         """
         Retrieves the most common citations of a given type (rulings/laws).
         Additionally plots the plot_n_most_common most common citations
-        :param df:
+        :param citation_counters:   the citation counters per type as returned by count_citations
         :param folder:
         :param type:
         :return:
@@ -77,11 +108,7 @@ class CitationDatasetCreator(DatasetCreator):
         valid_types = ['rulings', 'laws']
         if type not in valid_types:
             raise ValueError(f"Please supply a valid citation type from {valid_types}")
-        type_citations = []
-        for citations in df.citations:
-            for type_citation in citations[type]:
-                type_citations.append(type_citation['text'])
-        most_common_with_frequency = Counter(type_citations).most_common(self.num_ruling_citations)
+        most_common_with_frequency = citation_counters[type].most_common(self.num_ruling_citations)
 
         # Plot the 10 most common citations
         # remove BGG articles because they are obvious
@@ -94,17 +121,66 @@ class CitationDatasetCreator(DatasetCreator):
         return list(dict(most_common_with_frequency).keys())
 
     def get_law_abbr_by_lang(self):
-        term_definitions = TermDefinitionsConverter().extract_term_definitions()
-        law_abbr_by_lang = {lang: dict() for lang in self.languages}
-
-        for definition in term_definitions:
-            for lang in definition['languages']:
-                if lang in self.languages:
-                    for entry in definition['languages'][lang]:
-                        if entry['type'] == 'ab':  # ab stands for abbreviation
-                            # append the string of the abbreviation as key and the id as value
-                            law_abbr_by_lang[lang][entry['text']] = definition['id']
-        return law_abbr_by_lang
+        law_abbreviation_index = TermDefinitionsConverter().get_law_abbreviation_index()
+        # the abbreviations of each language with the id of the law as value
+        return {lang: law_abbreviation_index['abbr_to_id'][lang] for lang in self.languages}
+
+
+class CitationMasker:
+    """
+    Masks the citations of a decision and extracts them as labels.
+    The law abbreviations and the rulings are matched with an Aho-Corasick automaton built once per language,
+    and all the citations of a decision are masked in a single pass over its text.
+    """
+
+    def __init__(self, law_abbrs: list, law_labels: dict, rulings: list, ref_mask_token="<ref>"):
+        self.law_matcher = AhoCorasick(law_abbrs)
+        self.law_labels = law_labels
+        self.ruling_matcher = AhoCorasick(rulings)
+        self.ref_mask_token = ref_mask_token
+
+    def mask(self, text: str, citations: dict):
+        """
+        Masks the laws with a known abbreviation and the most common rulings
+        :param text:        the text of the decision
+        :param citations:   the citations extracted from the decision
+        :return:            the masked text and the labels
+        """
+        # TODO think about splitting laws and rulings into two separate labels
+        labels, to_mask = set(), set()
+        for law in citations['laws']:
+            citation = law['text']
+            found_abbr = self.law_matcher.first_contained(citation) if citation else None
+            if found_abbr:
+                to_mask.add(citation)
+                labels.add(self.law_labels[found_abbr])
+        for ruling in citations['rulings']:
+            citation = ruling['text']
+            if citation and self.ruling_matcher.first_contained(citation):
+                to_mask.add(citation)
+                labels.add(citation)
+        if to_mask:
+            # the longest citations first so that a citation containing another one is masked entirely
+            pattern = "|".join(re.escape(citation) for citation in sorted(to_mask, key=len, reverse=True))
+            text = re.sub(pattern, lambda _: self.ref_mask_token, text)
+        return text, list(labels)
+
+
+# the citation masker of a masking worker process (set by init_citation_masking_worker)
+worker_citation_masker = None
+
+
+def init_citation_masking_worker(citation_masker: CitationMasker):
+    """Installs the citation masker once per worker process of the masking pool"""
+    global worker_citation_masker
+    worker_citation_masker = citation_masker
+
+
+def mask_citations_of_batch(batch):
+    """Masks the citations of a batch of decisions (needs to be on the module level to be used in a process pool)"""
+    texts, citations = batch
+    return [worker_citation_masker.mask(text, decision_citations)
+            for text, decision_citations in zip(texts, citations)]
 
 
 if __name__ == '__main__':
@@ -1,9 +1,11 @@
 import configparser
+from collections import Counter
 
 from root import ROOT_DIR
 from scrc.dataset_creation.dataset_creator import DatasetCreator
+from scrc.preprocessors.citation_graph_builder import CitationGraphBuilder
 from scrc.utils.log_utils import get_logger
-import pandas as pd
+import numpy as np
 
 from scrc.utils.main_utils import get_config
 
@@ -28,65 +30,60 @@ class CriticalityDatasetCreator(DatasetCreator):
         self.dataset_name = "criticality_prediction"
         # TODO wait for section splitting in other courts for facts and considerations to be enabled
         self.feature_cols = ['text']  # ['facts', 'considerations', 'text']
+        self.labels = ['non-critical', 'critical']
 
-    def get_dataset(self, feature_col, lang):
-        engine = self.get_engine(self.db_scrc)
-
-        origin_chambers, supreme_court_df = self.query_supreme_court(engine, lang)
+        self.citation_graph_builder = CitationGraphBuilder(config)
 
-        df = pd.DataFrame()
-        for origin_chamber in origin_chambers:
-            origin_chamber_df = self.query_origin_chamber(feature_col, engine, lang, origin_chamber, supreme_court_df)
-            df = df.append(origin_chamber_df)
-        labels = ['non-critical', 'critical']
-
-        return df, labels
+    def get_dataset(self, feature_col, lang, save_reports):
+        engine = self.get_engine(self.db_scrc)
 
-    def query_origin_chamber(self, feature_col, engine, lang, origin_chamber, supreme_court_df):
-        self.logger.info(f"Processing origin chamber {origin_chamber}")
-        columns = ['id', 'chamber', 'date', 'extract(year from date) as year', feature_col]
-        try:
-            lower_court_df = next(self.select(engine, lang,
-                                              columns=",".join(columns),
-                                              where=f"chamber = '{origin_chamber}'",
-                                              order_by="date",
-                                              chunksize=self.get_chunksize()))
-            lower_court_df = self.clean_df(lower_court_df, feature_col)
-        except StopIteration:
-            self.logger.error(f"No lower court rulings found for chamber {origin_chamber}. Returning empty dataframe.")
-            return pd.DataFrame()
+        # the references of the supreme court to the lower court decisions are joined in the citation graph
+        citation_graph = self.citation_graph_builder.get_graph()
+        origin_chambers = citation_graph.referenced_chambers.tolist()
+        self.logger.info(f"Found supreme court rulings with references to lower court rulings "
+                         f"from chambers {origin_chambers}")
         # Include all decisions from the lower court with matching chamber and date: We have two error sources here:
         # 1. More than one decision at a given date in the lower court => too many decisions included
         # 2. Decision referenced from supreme court is not published in the lower court => not enough decisions included
-        sc_origin_chamber_df = supreme_court_df[supreme_court_df.origin_chamber.str.fullmatch(origin_chamber)]
-        date_match = lower_court_df.date.astype(str).isin(list(sc_origin_chamber_df.origin_date.astype(str)))
-        critical_df = lower_court_df[date_match]
-        critical_df['label'] = 'critical'
-        non_critical_df = lower_court_df[~date_match]
-        non_critical_df['label'] = 'non-critical'
-
-        self.logger.info(f"# critical decisions: {len(critical_df.index)}")
-        self.logger.info(f"# non-critical decisions: {len(non_critical_df.index)}")
-
-        return critical_df.append(non_critical_df)
-
-    def query_supreme_court(self, engine, lang):
-        origin_chamber = "lower_court::json#>>'{chamber}' AS origin_chamber"
-        origin_date = "lower_court::json#>>'{date}' AS origin_date"
-        origin_file_number = "lower_court::json#>>'{file_number}' AS origin_file_number"
-        try:
-            supreme_court_df = next(self.select(engine, lang,
-                                                columns=f"{origin_chamber}, {origin_date}, {origin_file_number}",
-                                                where="court = 'CH_BGer'",
-                                                order_by="origin_date",
-                                                chunksize=self.get_chunksize()))
-        except StopIteration:
-            raise ValueError("No supreme court rulings found")
-        supreme_court_df = supreme_court_df.dropna(subset=['origin_date', 'origin_chamber'])
-        origin_chambers = list(supreme_court_df.origin_chamber.unique())
-        self.logger.info(f"Found supreme court rulings with references to lower court rulings "
-                         f"from chambers {origin_chambers}")
-        return origin_chambers, supreme_court_df
+        self.logger.info(f"# references matching more than one lower court decision: "
+                         f"{citation_graph.stats.get('num_ambiguous_references')}")
+        self.logger.info(f"# references without a published lower court decision: "
+                         f"{citation_graph.stats.get('num_unmatched_references')}")
+        if not origin_chambers:
+            return
+
+        yield from self.query_lower_courts(feature_col, engine, lang, origin_chambers, citation_graph)
+
+    def query_lower_courts(self, feature_col, engine, lang, origin_chambers, citation_graph):
+        """
+        Streams the decisions of all the referenced lower court chambers in one query and labels them
+        with the appeals of the citation graph
+        """
+        columns = ['id', 'chamber', 'date', 'extract(year from date) as year', feature_col]
+        chambers = ", ".join(f"'{chamber}'" for chamber in origin_chambers)
+        appeal_counts = citation_graph.get_appeal_counts()
+
+        num_critical, num_non_critical = Counter(), Counter()
+        for lower_court_df in self.select(engine, lang, columns=",".join(columns),
+                                          where=f"chamber IN ({chambers})", chunksize=self.get_chunksize()):
+            lower_court_df = self.clean_df(lower_court_df, feature_col)
+            nodes = citation_graph.get_nodes(lang, lower_court_df.index)
+            # decisions added after the graph was built are not in the graph yet (node -1)
+            critical = (nodes >= 0) & (appeal_counts[nodes] > 0)
+            lower_court_df['label'] = np.where(critical, 'critical', 'non-critical')
+
+            num_critical.update(lower_court_df.chamber[critical])
+            num_non_critical.update(lower_court_df.chamber[~critical])
+            yield lower_court_df
+            if self.debug:
+                break  # the first chunk is enough for testing
+
+        for origin_chamber in origin_chambers:
+            if num_critical[origin_chamber] + num_non_critical[origin_chamber] == 0:
+                self.logger.error(f"No lower court rulings found for chamber {origin_chamber}.")
+                continue
+            self.logger.info(f"Chamber {origin_chamber}: # critical decisions: {num_critical[origin_chamber]}, "
+                             f"# non-critical decisions: {num_non_critical[origin_chamber]}")
 
 
 if __name__ == '__main__':
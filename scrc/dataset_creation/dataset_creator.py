@@ -1,6 +1,5 @@
 import abc
-import copy
-import math
+import shutil
 from collections import Counter
 from pathlib import Path
 from typing import Union
@@ -9,9 +8,10 @@ import seaborn as sns
 import plotly.express as px
 import matplotlib.pyplot as plt
 
-import dask.dataframe as dd
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from scrc.preprocessors.abstract_preprocessor import AbstractPreprocessor
 from scrc.utils.log_utils import get_logger
@@ -130,15 +130,24 @@ class DatasetCreator(AbstractPreprocessor):
         self.seed = 42
         self.minFeatureColLength = 100  # characters
         self.debug_chunksize = 2e2
-        self.real_chunksize = 2e5
+        self.real_chunksize = 1e4
 
         self.debug = False
         self.split_type = None  # to be overridden
         self.dataset_name = None  # to be overridden
         self.feature_cols = ["text"]  # to be overridden
+        self.labels = None  # to be overridden if the labels are known in advance, otherwise collected from the data
+
+        # the small columns kept in memory for the reports (everything except the text)
+        self.report_cols = ['year', 'legal_area', 'origin_region', 'origin_canton', 'origin_court', 'origin_chamber',
+                            'num_tokens_spacy', 'num_tokens_bert', 'label']
 
     @abc.abstractmethod
     def get_dataset(self, feature_col, lang, save_reports):
+        """
+        Streams the dataset from the database
+        :return:    a generator of dfs containing (at least) the columns text and label, indexed by the decision id
+        """
         pass
 
     def get_chunksize(self):
@@ -161,97 +170,101 @@ class DatasetCreator(AbstractPreprocessor):
         self.logger.info(message)
 
         if datasets:
-            lang_splits = {lang: dict() for lang in self.languages}
             for feature_col in datasets:
                 self.logger.info(f"Processing dataset feature col {feature_col}")
                 feature_col_folder = self.create_dir(dataset_folder, feature_col)
+                huggingface_dir = None
+                if huggingface:
+                    huggingface_dir = self.create_dir(feature_col_folder, 'huggingface')
+                    self.remove_split_files(huggingface_dir)  # the languages are appended one after the other
                 for lang in self.languages:
                     self.logger.info(f"Processing language {lang}")
                     lang_folder = self.create_dir(feature_col_folder, lang)
-                    df, labels = self.get_dataset(feature_col, lang, save_reports)
-                    df = df.sample(frac=1).reset_index(drop=True)  # shuffle dataset to make sampling easier
-                    splits = self.save_dataset(df, labels, lang_folder, self.split_type,
-                                               sub_datasets=sub_datasets, kaggle=kaggle, save_reports=save_reports)
-                    lang_splits[lang] = splits
-
-                if huggingface:
-                    self.logger.info("Generating huggingface dataset")
-                    self.save_huggingface_dataset(lang_splits, feature_col_folder)
+                    dfs = self.get_dataset(feature_col, lang, save_reports)
+                    self.save_dataset(dfs, lang, lang_folder, self.split_type,
+                                      sub_datasets=sub_datasets, kaggle=kaggle, save_reports=save_reports,
+                                      huggingface_dir=huggingface_dir)
 
                 self.mark_as_processed(processed_file_path, feature_col)
+            self.close_token_counting_pool()  # started if tokens had to be counted for the reports
         else:
             self.logger.info("All parts have been computed already.")
 
-    def save_huggingface_dataset(self, lang_splits, feature_col_folder):
-        huggingface_dir = self.create_dir(feature_col_folder, 'huggingface')
-
+    def save_huggingface_splits(self, folder, lang, huggingface_dir):
+        """
+        Appends the splits of a language to the huggingface jsonl files.
+        The records are derived from the parquet files of the splits with vectorised column operations.
+        :param folder:          where the parquet files of the splits are saved
+        :param lang:            the language of the splits
+        :param huggingface_dir: where to append the huggingface files
+        :return:
+        """
+        columns = ['id', 'year', 'legal_area', 'origin_region', 'origin_canton', 'label', 'text']
         for split in ['train', 'val', 'test']:
-            records = []
-            for lang in self.languages:
-                # df = pd.read_csv(f'{feature_col_folder}/{lang}/{split}.csv', index_col='id')
-                df = lang_splits[lang][split]
-
-                tuple_iterator = zip(df.index, df['year'], df['legal_area'], df['origin_region'],
-                                     df['origin_canton'], df['label'], df['text'])
-                for case_id, year, legal_area, region, canton, label, text in tuple_iterator:
-                    if not isinstance(canton, str) and (canton is None or math.isnan(canton)):
-                        canton = 'n/a'
-                    if not isinstance(region, str) and (region is None or math.isnan(region)):
-                        region = 'n/a'
-                    if not isinstance(legal_area, str) and (legal_area is None or math.isnan(legal_area)):
-                        legal_area = 'n/a'
-                    record = {
-                        'id': case_id,
-                        'year': year,
+            with open(huggingface_dir / f'{split}.jsonl', 'a') as out_file:
+                for df in self.read_parquet_split(folder, split, columns):
+                    records = pd.DataFrame({
+                        'id': df.index.to_numpy(),
+                        'year': df.year.to_numpy(),
                         'language': lang,
-                        'region': ' '.join(region.split('_')),
-                        'canton': canton,
-                        'legal area': ' '.join(legal_area.split('_')),
-                        'label': label,
-                        'text': text,
-                    }
-
-                    records.append(record)
-            with open(f'{huggingface_dir}/{split}.jsonl', 'w') as out_file:
-                for record in records:
-                    out_file.write(json.dumps(record) + '\n')
+                        'region': df.origin_region.fillna('n/a').str.replace('_', ' ').to_numpy(),
+                        'canton': df.origin_canton.fillna('n/a').to_numpy(),
+                        'legal area': df.legal_area.fillna('n/a').str.replace('_', ' ').to_numpy(),
+                        'label': df.label.to_numpy(),
+                        'text': df.text.to_numpy(),
+                    })
+                    # older pandas versions do not end the last line with a newline
+                    out_file.write(records.to_json(orient='records', lines=True).rstrip('\n') + '\n')
 
     def get_df(self, engine, feature_col, label_col, lang, save_reports):
+        """
+        Streams the decisions with the feature_col and the label_col from the database
+        :return:    a generator of cleaned dfs indexed by the decision id
+        """
         self.logger.info("Started loading the data from the database")
         origin_canton = "lower_court::json#>>'{canton}' AS origin_canton"
         origin_court = "lower_court::json#>>'{court}' AS origin_court"
         origin_chamber = "lower_court::json#>>'{chamber}' AS origin_chamber"
         origin_date = "lower_court::json#>>'{date}' AS origin_date"
         origin_file_number = "lower_court::json#>>'{file_number}' AS origin_file_number"
-        columns = f"{feature_col}, {label_col}, extract(year from date) as year, chamber, " \
+        columns = f"id, {feature_col}, {label_col}, extract(year from date) as year, chamber, " \
                   f"{origin_canton}, {origin_court}, {origin_chamber}, {origin_date}, {origin_file_number}"
+        if save_reports:
+            # the token counts are precomputed by the NlpPipelineRunner (count_tokens_only)
+            # if it has not been run yet, all the tokens are counted below
+            existing_columns = self.get_columns(engine, lang)
+            for num_tokens_col, alias in zip(self.get_num_tokens_columns(feature_col),
+                                             ['num_tokens_spacy', 'num_tokens_bert']):
+                columns += f", {num_tokens_col if num_tokens_col in existing_columns else 'NULL::bigint'} AS {alias}"
         where = f"{feature_col} IS NOT NULL AND {feature_col} != '' AND {label_col} IS NOT NULL"
-        order_by = "year"
-        df = next(self.select(engine, lang, columns=columns, where=where, order_by=order_by,
-                              chunksize=self.get_chunksize()))
-        df = self.clean_df(df, feature_col)
-        df['legal_area'] = df.chamber.apply(get_legal_area)
-        df['origin_region'] = df.origin_canton.apply(get_region)
-
-        if save_reports:  # only calculate this if we save the reports because it takes a long time
-            # TODO precompute this in previous step after section splitting for each section
-            # calculate both the num_tokens for regular words and subwords for the feature_col (not only the entire text)
-            spacy_tokenizer, bert_tokenizer = self.get_tokenizers(lang)
-            self.logger.debug("Started tokenizing with spacy")
-            df['num_tokens_spacy'] = [len(result) for result in spacy_tokenizer.pipe(df[feature_col], batch_size=100)]
-            self.logger.debug("Started tokenizing with bert")
-            df['num_tokens_bert'] = [len(input_id) for input_id in bert_tokenizer(df[feature_col].tolist()).input_ids]
+        for df in self.select(engine, lang, columns=columns, where=where, chunksize=self.get_chunksize()):
+            df = self.clean_df(df, feature_col)
+            df['legal_area'] = df.chamber.apply(get_legal_area)
+            df['origin_region'] = df.origin_canton.apply(get_region)
 
-        self.logger.info("Finished loading the data from the database")
+            if save_reports:
+                # only tokenize the entries which have not been counted yet (e.g. added after the counting)
+                missing = df.num_tokens_spacy.isna() | df.num_tokens_bert.isna()
+                if missing.any():
+                    self.logger.info(f"Counting the tokens of {missing.sum()} entries without precomputed token counts")
+                    num_tokens_spacy, num_tokens_bert = self.count_tokens(df.loc[missing, feature_col].tolist(), lang)
+                    df.loc[missing, 'num_tokens_spacy'] = num_tokens_spacy
+                    df.loc[missing, 'num_tokens_bert'] = num_tokens_bert
+                df.num_tokens_spacy = df.num_tokens_spacy.astype(int)
+                df.num_tokens_bert = df.num_tokens_bert.astype(int)
+
+            yield df
+            if self.debug:
+                break  # the first chunk is enough for testing
 
-        return df
+        self.logger.info("Finished loading the data from the database")
 
     def clean_df(self, df, column):
         # replace empty and whitespace strings with nan so that they can be removed
         df[column] = df[column].replace(r'^\s+$', np.nan, regex=True)
         df[column] = df[column].replace('', np.nan)
         df = df.dropna(subset=[column])  # drop null values not recognized by sql where clause
-        df = df.reset_index(drop=True)  # reindex to get nice indices
+        df = df.set_index('id')  # index by the decision id so that it can be identified in the splits
         if self.split_type == "date-stratified":
             df = df.dropna(subset=['year'])  # make sure that each entry has an associated year
         df.year = df.year.astype(int)  # convert from float to nicer int
@@ -262,106 +275,228 @@ class DatasetCreator(AbstractPreprocessor):
         # df = df[df[column].str.len() > self.minFeatureColLength]
         return df
 
-    def save_dataset(self, df: pd.DataFrame, labels: list, folder: Path,
+    def save_dataset(self, dfs, lang: str, folder: Path,
                      split_type="date-stratified", split=(0.7, 0.1, 0.2),
-                     sub_datasets=False, kaggle=False, save_reports=False):
+                     sub_datasets=False, kaggle=False, save_reports=False, huggingface_dir: Path = None):
         """
-        creates all the files necessary for a kaggle dataset from a given df
-        :param df:          needs to contain the columns text and label
-        :param labels:      all the labels
+        Streams the dfs into the split files and creates all the files necessary for a kaggle dataset.
+        Each row is assigned to its split independently of the other rows,
+        so only the current chunk (and the small report columns) are held in memory.
+        The rows are only shuffled within each chunk (ordered by the seeded hash of their id),
+        the chunks are written in the order they come from the database. So unlike a global shuffle,
+        consecutive rows of the split files come from the same chunk.
+        :param dfs:         generator of dfs which need to contain the columns text and label
+        :param lang:        the language of the dataset
         :param folder:      where to save the files
         :param split_type:  "date-stratified" or "random"
         :param split:       how to split the data into train, val and test set: needs to sum up to 1
         :param sub_datasets:whether or not to create the special sub dataset for testing of biases
         :param kaggle:      whether or not to create the special kaggle dataset
         :param save_reports:whether or not to compute and save reports
+        :param huggingface_dir: where to append the huggingface files (None to skip them)
         :return:
         """
-        splits = self.create_splits(df, split, split_type, include_all=save_reports)
-        self.save_labels(labels, folder / 'labels.json')
-        self.save_splits(splits, labels, folder, save_reports=save_reports)
+        self.remove_split_files(folder)  # the chunks are appended to the split files
+        kaggle_dir = self.create_dir(folder, 'kaggle') if kaggle else None
+        sub_datasets_dir = self.create_dir(folder, 'sub_datasets') if sub_datasets else None
+
+        labels = set()
+        report_dfs = {'train': [], 'val': [], 'test': []}
+        parquet_writers = dict()
+        for df in dfs:
+            if df.empty:
+                continue  # e.g. a chunk whose entries have all been removed while cleaning
+            # shuffle the chunk to make sampling easier (by the seeded hash, so the order does not depend on the chunks)
+            df = df.iloc[np.argsort(self.hash_to_unit_interval(df.index, self.seed), kind='stable')]
+            labels.update(np.hstack(df.label))
+            splits = self.create_splits(df, split, split_type)
+            self.save_splits(splits, folder)
+            self.save_parquet_splits(splits, folder, parquet_writers)
+
+            if save_reports or sub_datasets:
+                for split_name, split_df in splits.items():
+                    report_dfs[split_name].append(split_df[[col for col in self.report_cols if col in split_df]])
 
-        if sub_datasets:
-            sub_datasets_dict = self.create_sub_datasets(splits, split_type)
-            sub_datasets_dir = self.create_dir(folder, 'sub_datasets')
-            for category, sub_dataset_category in sub_datasets_dict.items():
-                self.logger.info(f"Processing sub dataset category {category}")
-                category_dir = self.create_dir(sub_datasets_dir, category)
-                for sub_dataset, sub_dataset_splits in sub_dataset_category.items():
-                    sub_dataset_dir = self.create_dir(category_dir, sub_dataset)
-                    self.save_splits(sub_dataset_splits, labels, sub_dataset_dir, save_csvs=['test'])
+            if sub_datasets:
+                self.save_sub_datasets(self.create_sub_datasets(splits, split_type), sub_datasets_dir,
+                                       save_csvs=['test'])
+
+        for parquet_writer in parquet_writers.values():
+            parquet_writer.close()
 
         if kaggle:
             # save special kaggle files
-            kaggle_splits = self.prepare_kaggle_splits(splits)
-            kaggle_dir = self.create_dir(folder, 'kaggle')
-            self.save_splits(kaggle_splits, labels, kaggle_dir, save_reports=save_reports)
+            self.save_kaggle_splits(folder, kaggle_dir)
+
+        if huggingface_dir:
+            self.save_huggingface_splits(folder, lang, huggingface_dir)
+
+        labels = self.labels or sorted(labels)
+        self.save_labels(labels, folder / 'labels.json')
+        if kaggle:
+            self.save_labels(labels, kaggle_dir / 'labels.json')
+
+        report_splits = {split_name: pd.concat(split_dfs) if split_dfs else pd.DataFrame(columns=self.report_cols)
+                         for split_name, split_dfs in report_dfs.items()}
+        report_splits['all'] = pd.concat(report_splits.values())
+        if save_reports:
+            self.save_split_reports(report_splits, folder)
+        if sub_datasets:
+            sub_datasets_dict = self.create_sub_datasets(report_splits, split_type)
+            self.save_sub_datasets(sub_datasets_dict, sub_datasets_dir, save_csvs=False, labels=labels)
 
         self.logger.info(f"Saved dataset files to {folder}")
-        return splits
 
-    def prepare_kaggle_splits(self, splits):
+    def save_sub_datasets(self, sub_datasets_dict, sub_datasets_dir, save_csvs, labels=None):
+        """Saves the csvs or (if labels are given) the labels and the reports of the sub datasets"""
+        for category, sub_dataset_category in sub_datasets_dict.items():
+            self.logger.debug(f"Processing sub dataset category {category}")
+            category_dir = self.create_dir(sub_datasets_dir, category)
+            for sub_dataset, sub_dataset_splits in sub_dataset_category.items():
+                sub_dataset_dir = self.create_dir(category_dir, sub_dataset)
+                if save_csvs:
+                    self.save_splits(sub_dataset_splits, sub_dataset_dir, save_csvs=save_csvs)
+                if labels is not None:
+                    self.save_labels(labels, sub_dataset_dir / 'labels.json')
+                    self.save_split_reports(sub_dataset_splits, sub_dataset_dir)
+
+    def save_kaggle_splits(self, folder: Path, kaggle_dir: Path):
+        """
+        Derives the kaggle files from the splits saved in the folder without copying the texts in memory
+        :param folder:      where the splits are saved
+        :param kaggle_dir:  where to save the kaggle files
+        :return:
+        """
         self.logger.info("Saving the data in kaggle format")
-        # deepcopy splits so we don't mess with the original dict
-        kaggle_splits = copy.deepcopy(splits)
-        # create solution file
-        kaggle_splits['solution'] = kaggle_splits['test'].drop('text', axis='columns')  # drop text
-        # rename according to kaggle conventions
-        kaggle_splits['solution'] = kaggle_splits['solution'].rename(columns={"label": "Expected"})
+        for split in ['train', 'val']:
+            if (folder / f'{split}.csv').exists():
+                shutil.copyfile(folder / f'{split}.csv', kaggle_dir / f'{split}.csv')
+
+        columns = self.get_parquet_columns(folder, 'test')
         # create test file
-        kaggle_splits['test'] = kaggle_splits['test'].drop('label', axis='columns')  # drop label
-        # create sampleSubmission file
-        # rename according to kaggle conventions
-        sample_submission = kaggle_splits['solution'].rename(columns={"Expected": "Predicted"})
-        # set to random value
-        sample_submission['Predicted'] = np.random.choice(kaggle_splits['solution']['Expected'],
-                                                          size=len(kaggle_splits['solution']))
-        kaggle_splits['sample_submission'] = sample_submission
-        return kaggle_splits
-
-    def save_splits(self, splits: dict, labels: list, folder: Path,
-                    save_reports=True, save_csvs: Union[list, bool] = True):
-        """
-        Saves the splits to the filesystem and generates reports
+        for df in self.read_parquet_split(folder, 'test', [col for col in columns if col != 'label']):  # drop label
+            self.save_splits({'test': df}, kaggle_dir)
+        # create solution file
+        for df in self.read_parquet_split(folder, 'test', [col for col in columns if col != 'text']):  # drop text
+            # rename according to kaggle conventions
+            solution = df.rename(columns={"label": "Expected"})
+            # create sampleSubmission file
+            # rename according to kaggle conventions
+            sample_submission = solution.rename(columns={"Expected": "Predicted"})
+            # set to random value
+            sample_submission['Predicted'] = np.random.choice(solution['Expected'], size=len(solution))
+            self.save_splits({'solution': solution, 'sample_submission': sample_submission}, kaggle_dir)
+
+    def save_parquet_splits(self, splits: dict, folder: Path, parquet_writers: dict):
+        """
+        Appends the splits to the parquet files in the folder (one row group per chunk).
+        The parquet files can be loaded directly (memory mapped) with huggingface datasets.
         :param splits:          the splits dictionary to be saved
-        :param labels:          the labels to be saved
         :param folder:          where to save the splits
-        :param save_reports:    whether to save reports
-        :param save_csvs:       whether to save csv files
+        :param parquet_writers: the open parquet writers of the splits (created with the schema of the first chunk)
+        :return:
+        """
+        for split, df in splits.items():
+            if df.empty:
+                continue
+            if split not in parquet_writers:
+                schema = self.get_arrow_schema(df)
+                parquet_writers[split] = pq.ParquetWriter(str(folder / f'{split}.parquet'), schema)
+            table = pa.Table.from_pandas(df, schema=parquet_writers[split].schema, preserve_index=True)
+            parquet_writers[split].write_table(table)
+
+    @staticmethod
+    def get_arrow_schema(df: pd.DataFrame) -> pa.Schema:
+        """
+        Infers the arrow schema of the df.
+        Columns which only contain null values in the df are assumed to be strings, so that later chunks fit as well.
+        """
+        schema = pa.Table.from_pandas(df, preserve_index=True).schema
+        for i, field in enumerate(schema):
+            if pa.types.is_null(field.type):
+                schema = schema.set(i, field.with_type(pa.string()))
+            elif pa.types.is_list(field.type) and pa.types.is_null(field.type.value_type):
+                schema = schema.set(i, field.with_type(pa.list_(pa.string())))
+        return schema
+
+    @staticmethod
+    def get_parquet_columns(folder: Path, split: str) -> list:
+        """Returns the columns (including the id) of the parquet file of the split"""
+        path = folder / f'{split}.parquet'
+        if not path.exists():
+            return []
+        return pq.ParquetFile(str(path)).schema_arrow.names
+
+    def read_parquet_split(self, folder: Path, split: str, columns: list = None):
+        """
+        Streams the parquet file of the split in batches
+        :param folder:  where the parquet file is saved
+        :param split:   the name of the split
+        :param columns: the columns to be read (all if None)
+        :return:        a generator of dfs indexed by the id
+        """
+        path = folder / f'{split}.parquet'
+        if not path.exists():
+            return  # empty split
+        if columns is not None and 'id' not in columns:
+            columns = ['id'] + columns
+        for batch in pq.ParquetFile(str(path)).iter_batches(batch_size=self.get_chunksize(), columns=columns):
+            df = batch.to_pandas()
+            if 'id' in df.columns:
+                df = df.set_index('id')
+            for field in batch.schema:
+                if pa.types.is_list(field.type) and field.name in df.columns:
+                    df[field.name] = df[field.name].apply(list)  # arrow returns numpy arrays for lists
+            yield df
+
+    def save_splits(self, splits: dict, folder: Path, save_csvs: Union[list, bool] = True):
+        """
+        Appends the splits to the csv files in the folder
+        :param splits:          the splits dictionary to be saved
+        :param folder:          where to save the splits
+        :param save_csvs:       whether to save csv files (or a list of the splits to be saved)
+        :return:
+        """
+        for split, df in splits.items():
+            if isinstance(save_csvs, list) and split not in save_csvs:
+                continue  # Only save if the split is in the list
+            if not save_csvs or df.empty:
+                continue
+            path = folder / f'{split}.csv'
+            df.to_csv(path, mode='a', header=not path.exists(), index_label='id')
+
+    def save_split_reports(self, splits: dict, folder: Path):
+        """
+        Generates the reports of the splits
+        :param splits:          the splits dictionary containing the report columns
+        :param folder:          where to save the reports
         :return:
         """
-        self.save_labels(labels, folder / 'labels.json')
         for split, df in splits.items():
             if len(df.index) < 2:
                 self.logger.info(f"Skipping split {split} because "
                                  f"{len(df.index)} entries are not enough to create reports.")
                 continue
-            self.logger.info(f"Processing split {split}")
+            self.logger.info(f"Computing metadata reports for split {split}")
+            self.save_report(folder, split, df)
 
-            if save_reports:
-                self.logger.info(f"Computing metadata reports")
-                self.save_report(folder, split, df)
-
-            if save_csvs:
-                if isinstance(save_csvs, list):
-                    if split not in save_csvs:
-                        continue  # Only save if the split is in the list
-                self.logger.info("Saving csv file")
-                df.to_csv(folder / f'{split}.csv', index_label='id')
-
-    def create_splits(self, df, split, split_type, include_all=False):
-        self.logger.info("Splitting data into train, val and test set")
+    @staticmethod
+    def remove_split_files(folder: Path):
+        """Removes the split files of a previous run since the new ones are written in append mode"""
+        for extension in ['csv', 'jsonl', 'parquet']:
+            for path in folder.glob(f'**/*.{extension}'):
+                if 'reports' not in path.parts:
+                    path.unlink()
+
+    def create_splits(self, df, split, split_type):
+        self.logger.debug("Splitting data into train, val and test set")
         if split_type == "random":
             train, val, test = self.split_random(df, split)
         elif split_type == "date-stratified":
             train, val, test = self.split_date_stratified(df, split)
         else:
             raise ValueError("Please supply a valid split_type")
-        splits = {'train': train, 'val': val, 'test': test}
-        if include_all:
-            splits['all'] = pd.concat([train, val, test])  # we need to update it since some entries have been removed
-
-        return splits
+        return {'train': train, 'val': val, 'test': test}
 
     def create_sub_datasets(self, splits, split_type):
         """
@@ -370,7 +505,7 @@ class DatasetCreator(AbstractPreprocessor):
         :param splits:      the dictionary containing the split dataframes
         :return:
         """
-        self.logger.info("Creating sub datasets")
+        self.logger.debug("Creating sub datasets")
 
         # set up data structure
         sub_datasets_dict = {
@@ -378,57 +513,46 @@ class DatasetCreator(AbstractPreprocessor):
             'origin_region': dict(), 'origin_canton': dict(), 'origin_court': dict(), 'origin_chamber': dict(),
         }
 
-        self.logger.info(f"Processing sub dataset input_length")
         boundaries = [0, 512, 1024, 2048, 4096, 8192]
-        for i in range(len(boundaries) - 1):
-            lower, higher = boundaries[i] + 1, boundaries[i + 1]
-            sub_dataset = sub_datasets_dict['input_length'][f'between({lower:04d},{higher:04d})'] = dict()
-            for split_name, split_df in splits.items():
-                sub_dataset[split_name] = split_df[split_df.num_tokens_bert.between(lower, higher)]
+        input_length_names = [f'between({lower + 1:04d},{higher:04d})'
+                              for lower, higher in zip(boundaries[:-1], boundaries[1:])]
+        input_length_bins = {split_name: pd.cut(split_df.num_tokens_bert, bins=boundaries, labels=input_length_names)
+                             for split_name, split_df in splits.items()}
+        sub_datasets_dict['input_length'] = self.partition_splits(splits, input_length_bins, input_length_names)
 
-        self.logger.info(f"Processing sub dataset year")
         if split_type == "date-stratified":
-            for year in range(2017, 2020 + 1):
-                sub_dataset = sub_datasets_dict['year'][str(year)] = dict()
-                for split_name, split_df in splits.items():
-                    sub_dataset[split_name] = split_df[split_df.year == year]
-
-        self.logger.info(f"Processing sub dataset legal_area")
-        for legal_area in legal_areas.keys():
-            sub_dataset = sub_datasets_dict['legal_area'][legal_area] = dict()
-            for split_name, split_df in splits.items():
-                sub_dataset[split_name] = split_df[split_df.legal_area.str.contains(legal_area)]
-
-        self.logger.info(f"Processing sub dataset origin_region")
-        for region in splits['all'].origin_region.dropna().unique().tolist():
-            sub_dataset = sub_datasets_dict['origin_region'][region] = dict()
-            for split_name, split_df in splits.items():
-                region_df = split_df.dropna(subset=['origin_region'])
-                sub_dataset[split_name] = region_df[region_df.origin_region.str.contains(region)]
-
-        self.logger.info(f"Processing sub dataset origin_canton")
-        for canton in splits['all'].origin_canton.dropna().unique().tolist():
-            sub_dataset = sub_datasets_dict['origin_canton'][canton] = dict()
-            for split_name, split_df in splits.items():
-                canton_df = split_df.dropna(subset=['origin_canton'])
-                sub_dataset[split_name] = canton_df[canton_df.origin_canton.str.contains(canton)]
-
-        self.logger.info(f"Processing sub dataset origin_court")
-        for court in splits['all'].origin_court.dropna().unique().tolist():
-            sub_dataset = sub_datasets_dict['origin_court'][court] = dict()
-            for split_name, split_df in splits.items():
-                court_df = split_df.dropna(subset=['origin_court'])
-                sub_dataset[split_name] = court_df[court_df.origin_court.str.contains(court)]
-
-        self.logger.info(f"Processing sub dataset origin_chamber")
-        for chamber in splits['all'].origin_chamber.dropna().unique().tolist():
-            sub_dataset = sub_datasets_dict['origin_chamber'][chamber] = dict()
-            for split_name, split_df in splits.items():
-                chamber_df = split_df.dropna(subset=['origin_chamber'])
-                sub_dataset[split_name] = chamber_df[chamber_df.origin_chamber.str.contains(chamber)]
+            years = list(range(2017, 2020 + 1))
+            year_keys = {split_name: split_df.year for split_name, split_df in splits.items()}
+            sub_datasets_dict['year'] = {str(year): sub_dataset for year, sub_dataset in
+                                         self.partition_splits(splits, year_keys, years).items()}
+
+        legal_area_keys = {split_name: split_df.legal_area for split_name, split_df in splits.items()}
+        sub_datasets_dict['legal_area'] = self.partition_splits(splits, legal_area_keys, list(legal_areas.keys()))
+
+        for attribute in ['origin_region', 'origin_canton', 'origin_court', 'origin_chamber']:
+            attribute_keys = {split_name: split_df[attribute] for split_name, split_df in splits.items()}
+            sub_datasets_dict[attribute] = self.partition_splits(splits, attribute_keys)
 
         return sub_datasets_dict
 
+    @staticmethod
+    def partition_splits(splits: dict, keys: dict, values: list = None):
+        """
+        Partitions each split by the exact value of its keys in one groupby pass per split
+        :param splits:  the dictionary containing the split dataframes
+        :param keys:    the dictionary containing the key series (aligned with the split dataframe) for each split
+        :param values:  the values to create sub datasets for (all the values found in the keys if None)
+        :return:        a dict of the sub datasets (value -> split name -> df)
+        """
+        split_indices = {split_name: key_series.groupby(key_series, sort=False, observed=True).indices
+                         for split_name, key_series in keys.items()}
+        if values is None:
+            values = list(dict.fromkeys(value for indices in split_indices.values() for value in indices))
+        empty = np.array([], dtype=np.int64)
+        return {value: {split_name: split_df.take(split_indices[split_name].get(value, empty))
+                        for split_name, split_df in splits.items()}
+                for value in values}
+
     def save_report(self, folder, split, df):
         """
         Saves statistics about the dataset in the form of csv tables and png graphs.
@@ -486,6 +610,8 @@ class DatasetCreator(AbstractPreprocessor):
         # ax.tick_params(labelrotation=30)
         # ax.get_figure().savefig(split_folder / 'multi_label_distribution.png', bbox_inches="tight")
 
+        if df.empty:
+            return  # np.hstack needs at least one array and there is nothing to plot
         counter_dict = dict(Counter(np.hstack(df.label)))
         counter_dict['all'] = sum(counter_dict.values())
         label_counts = pd.DataFrame.from_dict(counter_dict, orient='index', columns=['num_occurrences'])
@@ -579,16 +705,38 @@ class DatasetCreator(AbstractPreprocessor):
 
     def split_random(self, df, split):
         """
-        Splits the df randomly into train, val and test
-        :param df:      the df to be split
+        Splits the df randomly into train, val and test.
+        Each entry is assigned by a seeded hash of its id, so the assignment is reproducible across runs
+        and does not change when more decisions are added to the corpus. Changing the seed reshuffles the split.
+        :param df:      the df to be split (indexed by the decision id)
         :param split:   the exact split (how much of the data goes into train, val and test respectively)
         :return:
         """
-        train, val, test = dd.from_pandas(df, npartitions=1).random_split(list(split), random_state=self.seed)
+        position = self.hash_to_unit_interval(df.index, self.seed)
 
-        # get pandas dfs again
-        train = train.compute(scheduler='processes')
-        val = val.compute(scheduler='processes')
-        test = test.compute(scheduler='processes')
+        train = df[position < split[0]]
+        val = df[(position >= split[0]) & (position < split[0] + split[1])]
+        test = df[position >= split[0] + split[1]]
 
         return train, val, test
+
+    @staticmethod
+    def hash_to_unit_interval(ids: pd.Index, seed: int) -> np.ndarray:
+        """
+        Maps the integer ids to uniformly distributed positions in [0, 1) in one vectorised pass
+        :param ids:     the ids to be hashed
+        :param seed:    the seed mixed into the ids before hashing
+                        (the same seed always yields the same positions, another seed yields other positions)
+        :return:        an array with the position of each id
+        """
+        seed_mix = DatasetCreator.splitmix64(np.array([seed % 2 ** 64], dtype=np.uint64))[0]
+        hashes = DatasetCreator.splitmix64(ids.to_numpy().astype(np.uint64) ^ seed_mix)
+        return (hashes >> np.uint64(11)).astype(np.float64) / 2.0 ** 53  # the 53 most significant bits fit a float
+
+    @staticmethod
+    def splitmix64(values: np.ndarray) -> np.ndarray:
+        """The splitmix64 finalizer: mixes uint64 values bijectively (the multiplications wrap around)"""
+        values = values + np.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
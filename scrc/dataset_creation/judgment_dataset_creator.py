@@ -29,8 +29,10 @@ class JudgmentDatasetCreator(DatasetCreator):
         self.make_single_label = True
 
     def get_dataset(self, feature_col, lang, save_reports):
-        df = self.get_df(self.get_engine(self.db_scrc), feature_col, 'judgments', lang, save_reports)
+        for df in self.get_df(self.get_engine(self.db_scrc), feature_col, 'judgments', lang, save_reports):
+            yield self.prepare_judgments(df, feature_col)
 
+    def prepare_judgments(self, df, feature_col):
         # Delete cases with "Nach Einsicht" from the dataset because they are mostly inadmissible or otherwise dismissal
         # => too easily learnable for the model (because of spurious correlation)
         if self.with_inadmissible:
@@ -85,8 +87,7 @@ class JudgmentDatasetCreator(DatasetCreator):
         df = df.dropna(subset=['judgments'])  # drop empty labels introduced by cleaning before
 
         df = df.rename(columns={feature_col: "text", "judgments": "label"})  # normalize column names
-        labels, _ = list(np.unique(np.hstack(df.label), return_index=True))
-        return df, labels
+        return df
 
 
 if __name__ == '__main__':
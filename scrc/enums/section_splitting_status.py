@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class SectionSplittingStatus(Enum):
+    COMPLETE = 'complete'  # the footer was reached
+    STUCK = 'stuck'  # the footer was not reached, the sections are only partial
+    ERROR = 'error'  # the splitting function failed or is not implemented for the decision
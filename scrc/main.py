@@ -1,7 +1,6 @@
 
 from scrc.preprocessors.name_to_gender import NameToGender
-from scrc.preprocessors.extractors.procedural_participation_extractor import ProceduralParticipationExtractor
-from scrc.preprocessors.extractors.court_composition_extractor import CourtCompositionExtractor
+from scrc.preprocessors.extractors.header_analyzer import HeaderAnalyzer
 
 from scrc.preprocessors.extractors.citation_extractor import CitationExtractor
 from scrc.preprocessors.extractors.cleaner import Cleaner
@@ -10,11 +9,12 @@ from scrc.dataset_creation.criticality_dataset_creator import CriticalityDataset
 from scrc.dataset_creation.judgment_dataset_creator import JudgmentDatasetCreator
 from scrc.preprocessors.text_to_database import TextToDatabase
 from scrc.preprocessors.extractors.judgment_extractor import JudgmentExtractor
-from scrc.preprocessors.extractors.lower_court_extractor import LowerCourtExtractor
 from scrc.preprocessors.scraper import Scraper, base_url
+from scrc.preprocessors.schema_manager import SchemaManager
 from scrc.preprocessors.extractors.section_splitter import SectionSplitter
 from scrc.preprocessors.nlp_pipeline_runner import NlpPipelineRunner
 from scrc.preprocessors.count_computer import CountComputer
+from scrc.preprocessors.citation_graph_builder import CitationGraphBuilder
 
 from scrc.preprocessors.external_corpora.jureko_processor import JurekoProcessor
 from scrc.preprocessors.external_corpora.slc_processor import SlcProcessor
@@ -28,10 +28,13 @@ This file aggregates all the pipeline components and can be a starting point for
 Approach:
 - Scrape data into spider folders
 - Extract text and metadata content (save to Postgres DB because of easy interoperability with pandas (filtering and streaming))
+- Partition the tables by spider and create the indexes used by the stages
 - Clean text  (keep raw content in db)
 - Split BGer into sections (from html_raw)
 - Extract BGer citations (from html_raw) using "artref" tags
 - Extract judgments
+- Analyse the headers (lower court, court composition and parties in one pass)
+- Build the citation and appeal graph of the whole corpus (citations and lower court references)
 - Process each text with spacy, save doc to disk and store path in db, store num token count in separate db col
 - Compute lemma counts and save aggregates in separate tables
 - Create the smaller datasets derived from SCRC with the available metadata
@@ -84,6 +87,9 @@ def construct_base_dataset(config):
     extractor = TextToDatabase(config)
     extractor.build_dataset()
 
+    schema_manager = SchemaManager(config)
+    schema_manager.start()
+
     cleaner = Cleaner(config)
     cleaner.clean()
 
@@ -96,18 +102,21 @@ def construct_base_dataset(config):
     judgment_extractor = JudgmentExtractor(config)
     judgment_extractor.start()
 
-    lower_court_extractor = LowerCourtExtractor(config)
-    lower_court_extractor.start()
+    schema_manager.start()  # the indexes on the extracted columns can be created now
 
-    court_composition_extractor = CourtCompositionExtractor(config)
-    court_composition_extractor.start()
+    header_analyzer = HeaderAnalyzer(config)
+    header_analyzer.start()
 
-    procedural_participation_extractor = ProceduralParticipationExtractor(config)
-    procedural_participation_extractor.start()
+    citation_graph_builder = CitationGraphBuilder(config)
+    citation_graph_builder.get_graph(rebuild=True)
 
     #name_to_gender = NameToGender(config)
     #name_to_gender.start()
 
+    # the token counts of the text and the sections used by the reports of the dataset creators
+    token_counter = NlpPipelineRunner(config, count_tokens_only=True)
+    token_counter.run_pipeline()
+
     nlp_pipeline_runner = NlpPipelineRunner(config)
     nlp_pipeline_runner.run_pipeline()
 
@@ -3,26 +3,28 @@ import gc
 import importlib
 import json
 import multiprocessing
+import multiprocessing.pool
 import os
 from collections import Counter, Sized
 from pathlib import Path
 import glob
 from time import sleep
+from typing import List, Set, Tuple
 
 import spacy
-from spacy.lang.de import German
-from spacy.lang.fr import French
-from spacy.lang.it import Italian
 from spacy.tokens import Doc
 from spacy.vocab import Vocab
 from tqdm import tqdm
-from transformers import AutoTokenizer
 
 from root import ROOT_DIR
 import pandas as pd
 
+from scrc.utils.main_utils import chunker
+from scrc.utils.model_registry_singleton import ModelRegistrySingleton
+from scrc.utils.storage_layout import StorageLayout
+
 from sqlalchemy.sql.expression import bindparam
-from sqlalchemy import create_engine, MetaData, Table, Column, String, JSON
+from sqlalchemy import create_engine, MetaData, Table, Column, String, JSON, Index
 from sqlalchemy.dialects.postgresql import insert
 
 from stopwordsiso import stopwords
@@ -61,6 +63,10 @@ class AbstractPreprocessor:
         self.wikipedia_spacy_subdir = self.create_dir(self.wikipedia_subdir, config['dir']['spacy_subdir'])
         self.spider_specific_dir = self.create_dir(ROOT_DIR, config['dir']['spider_specific_dir'])
         self.output_dir = self.create_dir(self.data_dir, config['dir']['output_subdir'])
+        self.models_subdir = self.create_dir(self.data_dir, config['dir']['models_subdir'])
+        self.graphs_subdir = self.create_dir(self.data_dir, config['dir']['graphs_subdir'])
+        # shared by all preprocessors in this process so that every model is only loaded once
+        self.model_registry = ModelRegistrySingleton(self.models_subdir, float(config['models']['max_memory_gb']))
 
         self.ip = config['postgres']['ip']
         self.port = config['postgres']['port']
@@ -80,6 +86,7 @@ class AbstractPreprocessor:
         self.stopwords |= {' ', '.', '!', '?'}
 
         self.counter_types = ['counter_lemma', 'counter_pos', 'counter_tag']
+        self.token_counting_pool = None  # started on the first use (see count_tokens)
 
     @staticmethod
     def create_dir(parent_dir: Path, dir_name: str) -> Path:
@@ -135,6 +142,12 @@ class AbstractPreprocessor:
     def _check_write_privilege(engine) -> bool:
         return AbstractPreprocessor.query(engine, 'SELECT current_user')['current_user'][0] != 'readonly'
 
+    @staticmethod
+    def get_columns(engine, table) -> Set[str]:
+        """Returns the names of the columns of the table (or view)"""
+        query = f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table}'"
+        return set(AbstractPreprocessor.query(engine, query)['column_name'])
+
     def add_column(self, engine, table, col_name, data_type) -> None:
         """
         Adds a column to an existing table
@@ -146,6 +159,10 @@ class AbstractPreprocessor:
         """
         if not self._check_write_privilege(engine):
             return
+        layout = StorageLayout(engine, table)
+        if layout.is_separated():  # the column is added to the table of its stage
+            layout.add_column(col_name, data_type)
+            return
         with engine.connect() as conn:
             query = f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col_name} {data_type}"
             conn.execute(query)
@@ -190,6 +207,11 @@ class AbstractPreprocessor:
                 df.to_json(f)
             return
 
+        layout = StorageLayout(engine, table)
+        if layout.is_separated():  # the view cannot be updated, the columns are saved in the tables of their stages
+            layout.update(df, columns)
+            return
+
         with engine.connect() as conn:
             t = Table(table, MetaData(), autoload_with=engine)  # get the table
             df = df[columns + ['id']]  # only update these cols, id needs to be there for the where clause
@@ -208,7 +230,7 @@ class AbstractPreprocessor:
     def save_vocab(vocab, spacy_dir) -> None:
         vocab.to_disk(spacy_dir / f"_vocab.spacy", exclude=['vectors'])
 
-    def run_nlp_pipe(self, engine, table, spacy_dir, where, nlp, bert_tokenizer, logger):
+    def run_nlp_pipe(self, engine, table, spacy_dir, where, nlp, bert_tokenizer, logger, count_tokens=True):
         """
         Runs the spacy pipe on the table provided and saves the docs into the given folder
         :param engine:      the engine with the db connection
@@ -218,6 +240,7 @@ class AbstractPreprocessor:
         :param nlp:         used for creating the docs
         :param bert_tokenizer: used for computing the number of bert tokens if present
         :param logger:      custom logger for info output
+        :param count_tokens: whether to save the token counts (not needed if they have been counted already)
         :return:
         """
         dfs = self.select(engine, table, columns='id, text', where=where)  # stream dfs from the db
@@ -232,14 +255,16 @@ class AbstractPreprocessor:
                 path = spacy_dir / (str(id) + ".spacy")
                 doc.to_disk(path, exclude=['tensor'])  # this makes the space on the disk much smaller!
                 num_tokens.append(len(doc))
-            df['num_tokens_spacy'] = num_tokens
 
-            if bert_tokenizer:
-                df['num_tokens_bert'] = [len(input_id) for input_id in bert_tokenizer(df['text'].tolist()).input_ids]
+            if count_tokens:
+                df['num_tokens_spacy'] = num_tokens
+                if bert_tokenizer:
+                    df['num_tokens_bert'] = [len(input_id)
+                                             for input_id in bert_tokenizer(df['text'].tolist()).input_ids]
 
-            columns = ['num_tokens_spacy', 'num_tokens_bert']
-            logger.info("Saving num_tokens_spacy and num_tokens_bert to db")
-            self.update(engine, df, table, columns, self.output_dir)
+                columns = ['num_tokens_spacy', 'num_tokens_bert']
+                logger.info("Saving num_tokens_spacy and num_tokens_bert to db")
+                self.update(engine, df, table, columns, self.output_dir)
 
             self.save_vocab(nlp.vocab, spacy_dir)
 
@@ -248,18 +273,49 @@ class AbstractPreprocessor:
 
     def get_tokenizers(self, lang):
         os.environ['TOKENIZERS_PARALLELISM'] = "True"
-        if lang == 'de':
-            spacy = German()
-            bert = "deepset/gbert-base"
-        elif lang == 'fr':
-            spacy = French()
-            bert = "camembert/camembert-base-ccnet"
-        elif lang == 'it':
-            spacy = Italian()
-            bert = "dbmdz/bert-base-italian-cased"
-        else:
+        if lang not in ['de', 'fr', 'it']:
             raise ValueError(f"Please choose one of the following languages: {self.languages}")
-        return spacy.tokenizer, AutoTokenizer.from_pretrained(bert)
+        spacy_tokenizer = self.model_registry.get_blank_spacy(lang).tokenizer
+        return spacy_tokenizer, self.model_registry.get_bert_tokenizer(lang)
+
+    @staticmethod
+    def get_num_tokens_columns(col: str) -> Tuple[str, str]:
+        """Returns the names of the columns storing the spacy and the bert token counts of the given text column"""
+        if col == 'text':
+            return 'num_tokens_spacy', 'num_tokens_bert'
+        return f'num_tokens_spacy_{col}', f'num_tokens_bert_{col}'
+
+    def count_tokens(self, texts: List[str], lang: str) -> Tuple[List[int], List[int]]:
+        """
+        Computes only the number of spacy tokens and bert subwords for each of the texts.
+        Only the tokenizers are run and only the lengths are kept, so this is much faster than the full spacy pipeline.
+        :param texts:       the texts to be tokenized
+        :param lang:        the language of the texts
+        :return:            the spacy token counts and the bert token counts
+        """
+        if not texts:
+            return [], []
+        _, bert_tokenizer = self.get_tokenizers(lang)
+        # the spacy tokenizer runs in one batch per cpu, the fast bert tokenizer parallelizes the batch itself
+        batch_size = -(-len(texts) // self.num_cpus)  # ceil
+        batches = [(lang, batch) for batch in chunker(texts, batch_size)]
+        num_tokens_spacy = [num for nums in self.get_token_counting_pool().map(count_spacy_tokens, batches)
+                            for num in nums]
+        encodings = bert_tokenizer(texts, return_length=True, return_attention_mask=False, return_token_type_ids=False)
+        return num_tokens_spacy, list(encodings['length'])
+
+    def get_token_counting_pool(self) -> multiprocessing.pool.Pool:
+        """Returns the process pool counting the spacy tokens, started once and reused for all the chunks"""
+        if self.token_counting_pool is None:
+            self.token_counting_pool = multiprocessing.Pool(self.num_cpus, initializer=init_token_counting_worker,
+                                                            initargs=(self.languages,))
+        return self.token_counting_pool
+
+    def close_token_counting_pool(self):
+        if self.token_counting_pool is not None:
+            self.token_counting_pool.close()
+            self.token_counting_pool.join()
+            self.token_counting_pool = None
 
     @staticmethod
     def insert_counter(engine, table, level, level_instance, counter_type, counter):
@@ -304,6 +360,8 @@ class AbstractPreprocessor:
             Column('counter_lemma', JSON),
             Column('counter_pos', JSON),
             Column('counter_tag', JSON),
+            # the aggregates of the higher levels are selected with prefix queries (e.g. chamber LIKE 'X_%')
+            Index(f"{table_name}_{primary_key}_pattern", primary_key, postgresql_ops={primary_key: 'text_pattern_ops'}),
         )
         meta.create_all(engine)
         return table
@@ -345,3 +403,21 @@ class AbstractPreprocessor:
             return dict(Counter(tags))
         else:
             raise ValueError(f"You chose counter_type {counter_type}. Please choose one of {self.counter_types}.")
+
+
+# the spacy tokenizers of a token counting worker process by language
+worker_spacy_tokenizers = dict()
+
+
+def init_token_counting_worker(languages: List[str]):
+    """Loads the spacy tokenizers once per worker process of the token counting pool"""
+    for lang in languages:
+        worker_spacy_tokenizers[lang] = spacy.blank(lang).tokenizer
+
+
+def count_spacy_tokens(lang_and_texts: Tuple[str, List[str]]) -> List[int]:
+    """Counts the spacy tokens of a batch of texts (module level so that it can be run in a process pool)"""
+    lang, texts = lang_and_texts
+    if lang not in worker_spacy_tokenizers:
+        worker_spacy_tokenizers[lang] = spacy.blank(lang).tokenizer
+    return [len(doc) for doc in worker_spacy_tokenizers[lang].pipe(texts)]
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+from scrc.data_classes.citation_graph import CitationGraph, CsrGraph, date_window_join
+from scrc.preprocessors.abstract_preprocessor import AbstractPreprocessor
+from scrc.utils.log_utils import get_logger
+from scrc.utils.main_utils import get_config
+
+
+class CitationGraphBuilder(AbstractPreprocessor):
+    """
+    Builds the citation and appeal graph of the whole corpus in one streamed pass over all the languages
+    and saves it to the graphs directory, so that the labels derived from it (e.g. criticality or citation counts)
+    do not need to be computed with separate scans of the database.
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.logger = get_logger(__name__)
+
+        self.graph_path = self.graphs_subdir / 'citation_graph.npz'
+        # the progress files of the stages writing the columns the graph is built from (citations and lower_court)
+        self.source_progress_paths = [self.progress_dir / "spiders_citation_extracted.txt",
+                                      self.progress_dir / "spiders_header_analyzed.txt",
+                                      self.progress_dir / "spiders_lower_court_extracted.txt"]
+        self.date_window_days = 0  # how many days the date of the lower court decision may differ from the reference
+        self.match_file_number = False  # whether the file number of the lower court decision needs to match as well
+
+    def get_graph(self, rebuild=False) -> CitationGraph:
+        """
+        Loads the graph from disk or builds it if it does not exist yet or is stale
+        :param rebuild: whether to build the graph again (e.g. after new decisions have been added)
+        :return:
+        """
+        if self.graph_path.exists() and not rebuild:
+            self.logger.info(f"Loading the citation graph from {self.graph_path}")
+            graph = CitationGraph.load(self.graph_path)
+            if not self.is_stale(graph):
+                return graph
+            self.logger.warning("The citation graph is stale. Building it again")
+        graph = self.build_graph()
+        graph.save(self.graph_path)
+        self.logger.info(f"Saved the citation graph to {self.graph_path}")
+        return graph
+
+    def is_stale(self, graph: CitationGraph) -> bool:
+        """
+        Whether the saved graph does not reflect the database anymore: decisions have been added or removed
+        (compared by the number of decisions and the largest id per language) or the citations or the lower courts
+        have been extracted again after the graph was built
+        :param graph:   the graph loaded from disk
+        :return:
+        """
+        graph_time = self.graph_path.stat().st_mtime
+        for progress_path in self.source_progress_paths:
+            if progress_path.exists() and progress_path.stat().st_mtime > graph_time:
+                self.logger.info(f"{progress_path} has been modified after the citation graph was built")
+                return True
+        engine = self.get_engine(self.db_scrc)
+        for lang in self.languages:
+            ids = graph.decision_ids[graph.decision_langs == lang]
+            table = self.query(engine, f"SELECT count(*) AS num_decisions, max(id) AS max_id FROM {lang}").iloc[0]
+            max_id = int(ids.max()) if len(ids) else None
+            table_max_id = int(table.max_id) if pd.notna(table.max_id) else None
+            if len(ids) != table.num_decisions or max_id != table_max_id:
+                self.logger.info(f"The citation graph contains {len(ids)} decisions of language {lang} "
+                                 f"(largest id {max_id}), the database {table.num_decisions} "
+                                 f"(largest id {table_max_id})")
+                return True
+        return False
+
+    def build_graph(self) -> CitationGraph:
+        self.logger.info("Started building the citation graph")
+        engine = self.get_engine(self.db_scrc)
+
+        langs, ids, chambers, dates, file_numbers = [], [], [], [], []
+        citation_sources, citation_targets = [], []
+        reference_sources, reference_chambers, reference_dates, reference_file_numbers = [], [], [], []
+        ruling_ids = dict()  # ruling text -> ruling id
+
+        columns = "id, chamber, date, file_number, citations, " \
+                  "lower_court::json#>>'{chamber}' AS origin_chamber, lower_court::json#>>'{date}' AS origin_date, " \
+                  "lower_court::json#>>'{file_number}' AS origin_file_number"
+        num_decisions = 0
+        for lang in self.languages:
+            self.logger.info(f"Adding the decisions of language {lang}")
+            for df in self.select(engine, lang, columns=columns, chunksize=self.chunksize):
+                positions = np.arange(num_decisions, num_decisions + len(df.index))
+                num_decisions += len(df.index)
+                langs.append(np.full(len(df.index), lang))
+                ids.append(df.id.to_numpy(dtype=np.int64))
+                chambers.append(df.chamber.to_numpy(dtype=object))
+                dates.append(pd.to_datetime(df.date, errors='coerce').values.astype('datetime64[D]'))
+                file_numbers.append(self.normalize_file_numbers(df.file_number))
+
+                for position, citations in zip(positions, df.citations):
+                    if not citations:
+                        continue
+                    for ruling in citations.get('rulings', []):
+                        if ruling.get('text'):
+                            citation_sources.append(position)
+                            citation_targets.append(ruling_ids.setdefault(ruling['text'], len(ruling_ids)))
+
+                has_reference = df.origin_chamber.notna() & df.origin_date.notna()
+                reference_sources.append(positions[has_reference.to_numpy()])
+                reference_chambers.append(df.origin_chamber[has_reference].to_numpy(dtype=object))
+                reference_dates.append(pd.to_datetime(df.origin_date[has_reference], errors='coerce')
+                                       .values.astype('datetime64[D]'))
+                reference_file_numbers.append(self.normalize_file_numbers(df.origin_file_number[has_reference]))
+
+        def concat(arrays, dtype):
+            return np.concatenate(arrays) if arrays else np.array([], dtype=dtype)
+
+        langs, ids = concat(langs, str), concat(ids, np.int64)
+        chambers, dates = concat(chambers, object), concat(dates, 'datetime64[D]')
+        file_numbers = concat(file_numbers, object)
+
+        # the node ids are sorted by (language, database id) so that decisions can be looked up by binary search
+        order = np.lexsort((ids, langs))
+        node_of_position = np.empty(num_decisions, dtype=np.int64)
+        node_of_position[order] = np.arange(num_decisions)
+        langs, ids, chambers, dates, file_numbers = langs[order], ids[order], chambers[order], dates[order], \
+                                                    file_numbers[order]
+
+        citation_sources = node_of_position[np.array(citation_sources, dtype=np.int64)]
+        citations = CsrGraph.from_edges(citation_sources, citation_targets, num_decisions, len(ruling_ids))
+
+        reference_sources = node_of_position[concat(reference_sources, np.int64)]
+        reference_chambers = concat(reference_chambers, object)
+        reference_positions, appeal_targets = self.join_references(
+            reference_chambers, concat(reference_dates, 'datetime64[D]'), concat(reference_file_numbers, object),
+            chambers, dates, file_numbers)
+        appeal_sources = reference_sources[reference_positions]
+        # the two error sources of matching the references to the lower court decisions
+        matches_per_reference = np.bincount(reference_positions, minlength=len(reference_sources))
+        not_self_loop = appeal_sources != appeal_targets
+        appeals = CsrGraph.from_edges(appeal_sources[not_self_loop], appeal_targets[not_self_loop],
+                                      num_decisions, num_decisions)
+
+        stats = {
+            'num_decisions': num_decisions,
+            'num_rulings': len(ruling_ids),
+            'num_citations': len(citation_sources),
+            'num_references': len(reference_sources),
+            'num_matched_references': int((matches_per_reference > 0).sum()),
+            # more than one decision at the referenced date in the lower court => too many decisions included
+            'num_ambiguous_references': int((matches_per_reference > 1).sum()),
+            # referenced decision is not published by the lower court => not enough decisions included
+            'num_unmatched_references': int((matches_per_reference == 0).sum()),
+            'num_appeals': int(not_self_loop.sum()),
+        }
+        self.logger.info(f"Finished building the citation graph: {stats}")
+        return CitationGraph(decision_langs=langs, decision_ids=ids, decision_chambers=chambers,
+                             decision_dates=dates, rulings=np.array(list(ruling_ids.keys()), dtype=str),
+                             citations=citations, appeals=appeals,
+                             referenced_chambers=np.unique(reference_chambers.astype(str)), stats=stats)
+
+    def join_references(self, reference_chambers, reference_dates, reference_file_numbers,
+                        chambers, dates, file_numbers):
+        """
+        Joins the lower court references with the decisions on (chamber, date) and optionally the file number.
+        This is a hash join if the dates need to match exactly and a sorted window join otherwise.
+        :return:    the positions of the joined references and the nodes of the matched decisions
+        """
+        if self.date_window_days:
+            reference_positions, nodes = date_window_join(reference_chambers, reference_dates,
+                                                          chambers, dates, self.date_window_days)
+            if self.match_file_number:
+                same_file_number = reference_file_numbers[reference_positions] == file_numbers[nodes]
+                reference_positions, nodes = reference_positions[same_file_number], nodes[same_file_number]
+            return reference_positions, nodes
+
+        keys = ['chamber', 'date'] + (['file_number'] if self.match_file_number else [])
+        references = pd.DataFrame({'chamber': reference_chambers, 'date': reference_dates,
+                                   'file_number': reference_file_numbers,
+                                   'reference_position': np.arange(len(reference_chambers))})
+        decisions = pd.DataFrame({'chamber': chambers, 'date': dates, 'file_number': file_numbers,
+                                  'node': np.arange(len(chambers))})
+        joined = references.dropna(subset=keys)[keys + ['reference_position']].merge(
+            decisions.dropna(subset=keys)[keys + ['node']], on=keys, how='inner')
+        return joined.reference_position.to_numpy(dtype=np.int64), joined.node.to_numpy(dtype=np.int64)
+
+    @staticmethod
+    def normalize_file_numbers(file_numbers: pd.Series) -> np.ndarray:
+        """Removes the whitespace and the case of the file numbers so that they can be compared"""
+        file_numbers = file_numbers.astype(object)  # the column is float if it only contains nulls
+        return file_numbers.str.replace(r'\s+', '', regex=True).str.upper().to_numpy(dtype=object)
+
+
+if __name__ == '__main__':
+    config = get_config()
+
+    citation_graph_builder = CitationGraphBuilder(config)
+    citation_graph_builder.get_graph(rebuild=True)
@@ -1,9 +1,17 @@
 import configparser
+from collections import Counter
+from datetime import datetime
+
+from spacy.tokens import Doc
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, JSON, select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import bindparam
 
 from scrc.preprocessors.abstract_preprocessor import AbstractPreprocessor
 from root import ROOT_DIR
 from scrc.utils.log_utils import get_logger
 from scrc.utils.main_utils import get_config
+from scrc.utils.storage_layout import StorageLayout
 
 
 # import scrc.utils.monkey_patch  # prevent memory leak with pandas
@@ -13,6 +21,10 @@ class CountComputer(AbstractPreprocessor):
     """
     Computes the lemma counts for each decision and saves it in a special column 'counter'.
     In a second step, it computes the aggregate counts for the chamber, court and canton level
+
+    Once the aggregates of a language have been built, new or reprocessed decisions are not aggregated from scratch
+    anymore. Instead, the difference between their old and new counters is recorded in a versioned delta table
+    and applied to all the ancestor levels (chamber -> court -> canton -> lang) in one transaction.
     """
 
     def __init__(self, config: dict):
@@ -29,8 +41,13 @@ class CountComputer(AbstractPreprocessor):
         for lang in self.languages:
             self.logger.info(f"Started processing language {lang}")
             self.lang_dir = self.spacy_subdir / lang
-            self.compute_counts_for_individual_decisions(engine, lang)
-            self.compute_level_aggregates(engine, lang)
+            if self.aggregates_initialized(lang):
+                # only count the decisions added since the last run and propagate them to the aggregates
+                self.update_counters_incrementally(engine, lang, where="counter_lemma IS NULL")
+            else:
+                self.compute_counts_for_individual_decisions(engine, lang)
+                self.compute_level_aggregates(engine, lang)
+                self.mark_aggregates_initialized(lang)
             self.logger.info(f"Finished processing language {lang}")
         tables = [f"{lang}_cantons" for lang in self.languages]
         self.compute_total_aggregate(engine, tables, "lang", self.progress_dir, self.logger)
@@ -86,6 +103,149 @@ class CountComputer(AbstractPreprocessor):
     def get_level_instances(self, engine, lang, level):
         return self.query(engine, f"SELECT DISTINCT {level} FROM {lang}")[level].to_list()
 
+    def get_aggregates_initialized_path(self, lang):
+        return self.progress_dir / f"{lang}_aggregates_initialized.txt"
+
+    def aggregates_initialized(self, lang) -> bool:
+        """
+        The aggregates are complete once all the decisions have been counted and all the levels have been aggregated.
+        The progress files of the levels cannot tell, they are appended one level instance at a time.
+        """
+        return self.get_aggregates_initialized_path(lang).exists()
+
+    def mark_aggregates_initialized(self, lang):
+        """Marks the aggregates of the language as complete, so that the next runs only apply the deltas"""
+        self.get_aggregates_initialized_path(lang).write_text(datetime.now().isoformat())
+
+    def update_counters_incrementally(self, engine, lang, where):
+        """
+        Recomputes the counters of the decisions selected by where and applies the difference to the old counters
+        to all the aggregate levels. Use this for adding new decisions or reprocessing existing ones.
+        :param engine:  the engine with the db connection
+        :param lang:    the language table to process
+        :param where:   the sql WHERE clause selecting the decisions to (re)count
+        :return:
+        """
+        self.logger.info(f"Incrementally updating the counters for the decisions where {where}")
+        for counter_type in self.counter_types:
+            self.add_column(engine, lang, col_name=counter_type, data_type='jsonb')
+        delta_table = self.create_delta_table(engine, f"{lang}_counter_deltas")
+        level_tables = {
+            'chamber': self.create_aggregate_table(engine, f"{lang}_chambers", 'chamber'),
+            'court': self.create_aggregate_table(engine, f"{lang}_courts", 'court'),
+            'canton': self.create_aggregate_table(engine, f"{lang}_cantons", 'canton'),
+            'lang': self.create_aggregate_table(engine, "agg", 'lang'),
+        }
+        # the decisions are locked and updated in the table holding the counters (the view cannot be locked)
+        lang_table = Table(StorageLayout(engine, lang).get_table(self.counter_types[0]), MetaData(), autoload_with=engine)
+
+        self.spacy_vocab = self.load_vocab(self.lang_dir)
+        dfs = self.select(engine, lang, columns='id', where=where)  # stream dfs from the db
+        for df in dfs:
+            # only decisions which have already been processed by the spacy pipeline can be counted
+            ids = [id for id in df.id if (self.lang_dir / (str(id) + ".spacy")).exists()]
+            if not ids:
+                continue
+            self.logger.info(f"Loading {len(ids)} spacy docs")
+            docs = [Doc(self.spacy_vocab).from_disk(self.lang_dir / (str(id) + ".spacy"), exclude=['tensor'])
+                    for id in ids]
+            new_counters = {id: {counter_type: self.create_counter_for_doc(doc, counter_type)
+                                 for counter_type in self.counter_types}
+                            for id, doc in zip(ids, docs)}
+            # the lang level is keyed by the name of the canton table (see compute_total_aggregate)
+            self.apply_counter_deltas(engine, lang_table, delta_table, level_tables, f"{lang}_cantons", new_counters)
+
+    def apply_counter_deltas(self, engine, lang_table, delta_table, level_tables, lang_instance, new_counters):
+        """
+        Saves the new counters of the decisions, records the deltas to their old counters
+        and applies the summed deltas to every ancestor level. Everything happens in one transaction,
+        so the aggregates never diverge from the decisions.
+        :param engine:          the engine with the db connection
+        :param lang_table:      the table containing the decisions
+        :param delta_table:     the table storing the versioned delta records
+        :param level_tables:    the aggregate tables by level (the key is also the name of the level column)
+        :param lang_instance:   the instance of the lang level the decisions belong to
+        :param new_counters:    the new counters by counter type by decision id
+        :return:
+        """
+        level_deltas = {level: dict() for level in level_tables}
+        with engine.begin() as conn:
+            # the old counters are read while locking the decisions, so that a concurrent run
+            # waits for this transaction and computes its deltas from the counters saved here
+            ids = list(new_counters.keys())
+            columns = [lang_table.c[column] for column in ['id', 'chamber', 'court', 'canton'] + self.counter_types]
+            rows = conn.execute(select(*columns).where(lang_table.c.id.in_(ids)).with_for_update()).fetchall()
+            versions = dict(conn.execute(
+                select(delta_table.c.decision_id, func.max(delta_table.c.version))
+                    .where(delta_table.c.decision_id.in_(ids))
+                    .group_by(delta_table.c.decision_id)).fetchall())
+
+            delta_records, counter_records = [], []
+            for row in rows:
+                record = {'decision_id': row.id, 'chamber': row.chamber, 'version': versions.get(row.id, 0) + 1,
+                          'created_at': datetime.now()}
+                level_instances = {'chamber': row.chamber, 'court': row.court, 'canton': row.canton,
+                                   'lang': lang_instance}
+                for counter_type in self.counter_types:
+                    delta = self.compute_counter_delta(row[counter_type], new_counters[row.id][counter_type])
+                    record[counter_type] = delta
+                    for level in level_tables:
+                        level_instance = level_instances[level]
+                        if level_instance is None:
+                            continue
+                        level_counter = level_deltas[level].setdefault(level_instance, dict()).setdefault(
+                            counter_type, Counter())
+                        level_counter.update(delta)
+                delta_records.append(record)
+                counter_records.append({'b_id': row.id, **new_counters[row.id]})
+
+            if not counter_records:
+                return
+            # bulk update (the id cannot be used as bind parameter name, it is the name of the column)
+            conn.execute(lang_table.update().where(lang_table.c.id == bindparam('b_id')).values(), counter_records)
+            conn.execute(delta_table.insert(), delta_records)
+
+            for level, table in level_tables.items():
+                for level_instance, deltas in level_deltas[level].items():
+                    self.apply_delta_to_aggregate(conn, table, level, level_instance, deltas)
+
+    def apply_delta_to_aggregate(self, conn, table, level, level_instance, deltas):
+        """Adds the deltas to the counters of one level instance (creating the row if it does not exist yet)"""
+        current = conn.execute(select(table).where(table.c[level] == level_instance).with_for_update()).first()
+        values = {}
+        for counter_type, delta in deltas.items():
+            counter = Counter(current[counter_type] if current is not None and current[counter_type] else {})
+            counter.update(delta)
+            values[counter_type] = {key: count for key, count in counter.items() if count > 0}
+        stmt = insert(table).values({level: level_instance, **values})
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c[level]], set_=values)
+        conn.execute(stmt)
+
+    @staticmethod
+    def compute_counter_delta(old_counter, new_counter) -> dict:
+        """Computes new_counter - old_counter keeping negative counts (old_counter is None for new decisions)"""
+        delta = Counter(new_counter)
+        delta.subtract(old_counter or {})
+        return {key: count for key, count in delta.items() if count != 0}
+
+    @staticmethod
+    def create_delta_table(engine, table_name):
+        """Creates the table storing one versioned counter delta record per (re)processed decision"""
+        meta = MetaData()
+        table = Table(
+            table_name, meta,
+            Column('id', Integer, primary_key=True),
+            Column('decision_id', Integer, index=True),
+            Column('version', Integer),
+            Column('chamber', String),
+            Column('created_at', DateTime),
+            Column('counter_lemma', JSON),
+            Column('counter_pos', JSON),
+            Column('counter_tag', JSON),
+        )
+        meta.create_all(engine)
+        return table
+
 
 if __name__ == '__main__':
     config = get_config()
@@ -1,7 +1,6 @@
 import glob
 from pathlib import Path
 
-import spacy
 from tqdm import tqdm
 
 import pandas as pd
@@ -35,7 +34,7 @@ class ExternalCorpusProcessor(AbstractPreprocessor):
         self.extract_to_db(engine)
 
         disable_pipes = ['senter', 'ner', 'attribute_ruler', 'textcat']
-        nlp = spacy.load('de_core_news_lg', disable=disable_pipes)
+        nlp = self.model_registry.get_spacy_model('de_core_news_lg', disable_pipes)
         nlp.max_length = 3000000
 
         self.logger.info("Running spacy pipeline")
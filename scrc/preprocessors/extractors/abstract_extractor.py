@@ -1,11 +1,18 @@
 from __future__ import annotations
+import importlib.util
+import math
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Optional, Set, TYPE_CHECKING, Tuple
+from pathlib import Path
+from typing import Any, List, Optional, Set, TYPE_CHECKING, Tuple
 import pandas as pd
 
 from root import ROOT_DIR
 from scrc.enums.language import Language
+from scrc.enums.section import Section
 from scrc.utils.log_utils import get_logger
+from scrc.utils.paragraph_store import ParagraphStore
+from scrc.utils.spider_function_registry import SpiderFunctionRegistry
 from scrc.preprocessors.abstract_preprocessor import AbstractPreprocessor
 
 if TYPE_CHECKING:
@@ -25,6 +32,12 @@ class AbstractExtractor(ABC, AbstractPreprocessor):
         "no_functions": "Not processing",
     }
     processed_file_path = None
+    # if set, only the paragraphs of this section (and the metadata) are fetched instead of the whole decision
+    required_section: Optional[Section] = None
+    max_paragraphs: Optional[int] = None  # only fetch the first n paragraphs of the required section
+    # if set, only these columns (and the ones required by the spider function) are fetched with the metadata
+    required_columns: Optional[List[str]] = None
+    metadata_columns = "id, spider, language, date, html_url, file_name"
 
     @abstractmethod
     def get_required_data(self, series: pd.DataFrame) -> Any:
@@ -43,11 +56,15 @@ class AbstractExtractor(ABC, AbstractPreprocessor):
         super().__init__(config)
         self.logger = get_logger(__name__)
         self.processing_functions = self.load_functions(config, function_name)
+        self.spider_functions = SpiderFunctionRegistry(self.processing_functions)
         self.logger.debug(self.processing_functions)
         self.col_name = col_name
         self.col_type = col_type
         self.processed_amount = 0
-        self.total_to_process = -1
+        self.successful_amount = 0
+        self.total_to_process = -1  # unknown unless the coverage is audited
+        # if set, the totals and the coverage are additionally counted with queries on the whole table
+        self.audit_coverage = False
         self.spider_specific_dir = self.create_dir(ROOT_DIR, config['dir']['spider_specific_dir'])
 
     def start(self):
@@ -72,7 +89,7 @@ class AbstractExtractor(ABC, AbstractPreprocessor):
 
     def start_spider_loop(self, spider_list: Set, engine: Engine):
         for spider in spider_list:
-            if hasattr(self.processing_functions, spider):
+            if spider in self.spider_functions:
                 self.process_one_spider(engine, spider)
             else:
                 self.logger.debug(
@@ -84,26 +101,68 @@ class AbstractExtractor(ABC, AbstractPreprocessor):
     def process_one_spider(self, engine: Engine, spider: str):
         self.logger.info(self.logger_info["start_spider"] + " " + spider)
 
-        for lang in self.languages:
+        for lang in self.get_supported_languages(spider):
             where = self.get_database_selection_string(spider, lang)
             self.start_progress(engine, spider, lang)
             # stream dfs from the db
-            dfs = self.select(engine, lang, where=where,
-                              chunksize=self.chunksize)
+            dfs = self.select_required_data(engine, lang, where, self.spider_functions.get(spider).required_columns)
             for df in dfs:
-                df = df.apply(self.process_one_df_row, axis="columns")
+                df = self.process_one_df(engine, lang, df)
                 self.update(engine, df, lang, [self.col_name], self.output_dir)
-                self.log_progress(self.chunksize)
+                self.log_progress(df)
 
             self.log_coverage(engine, spider, lang)
 
         self.logger.info(f"{self.logger_info['finish_spider']} {spider}")
 
+    def get_supported_languages(self, spider: str) -> List[str]:
+        """
+        Returns the languages supported by the function of the spider and prepares the function.
+        The other languages are skipped before anything is queried from the database.
+        """
+        spider_function = self.spider_functions.get(spider)
+        languages = [lang for lang in self.languages if spider_function.supports(lang)]
+        for lang in [lang for lang in self.languages if lang not in languages]:
+            self.logger.info(f"The function of spider {spider} does not support {lang}. {self.logger_info['no_functions']}")
+        if languages:
+            spider_function.prepare()
+        return languages
+
+    def select_required_data(self, engine: Engine, lang: str, where: str, function_columns: List[str] = None):
+        """
+        Streams the decisions to be processed with all columns, only the required columns
+        or only the paragraphs of the required section
+        :param engine:              the db engine to work upon
+        :param lang:                the language (table) of the decisions
+        :param where:               an sql WHERE clause to filter the decisions
+        :param function_columns:    the columns required by the spider function in addition to the required columns
+        :return:                    a generator of pd.DataFrame
+        """
+        if self.required_section is None:
+            if self.required_columns is None and not function_columns:
+                return self.select(engine, lang, where=where, chunksize=self.chunksize)
+            columns = list(dict.fromkeys((self.required_columns or []) + (function_columns or [])))
+            return self.select(engine, lang, columns=", ".join([self.metadata_columns] + columns),
+                               where=where, chunksize=self.chunksize)
+        return ParagraphStore.stream_sections(engine, lang, [self.required_section],
+                                              columns=", ".join([self.metadata_columns] + (function_columns or [])),
+                                              where=where, max_paragraphs=self.max_paragraphs,
+                                              chunksize=self.chunksize)
+
+    def process_one_df(self, engine: Engine, lang: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Processes one chunk of decisions streamed from the db"""
+        return df.apply(self.process_one_df_row, axis="columns")
+
+    def get_namespace(self, series: pd.DataFrame) -> dict:
+        """Returns the context (metadata) of the decision passed to the processing functions"""
+        namespace = series[["date", "html_url", "id"]].to_dict()
+        namespace['language'] = Language(series['language'])
+        return namespace
+
     def process_one_df_row(self, series: pd.DataFrame) -> pd.DataFrame:
         """Processes one row of a raw df"""
         self.logger.debug(f"{self.logger_info['processing_one']} {series['file_name']}")
-        namespace = series[["date", "html_url", "id"]].to_dict()
-        namespace['language'] = Language(series['language'])
+        namespace = self.get_namespace(series)
         data = self.get_required_data(series)
         assert data
         series[self.col_name] = self.call_processing_function(
@@ -115,7 +174,7 @@ class AbstractExtractor(ABC, AbstractPreprocessor):
         """Calls the processing function (named by the spider) and passes the data and the namespace as arguments."""
         if not self.check_condition_before_process(spider, data, namespace):
             return None
-        extracting_functions = getattr(self.processing_functions, spider)
+        extracting_functions = self.spider_functions.get(spider)
         try:
             # invoke function with data and namespace
             return extracting_functions(data, namespace)
@@ -124,6 +183,57 @@ class AbstractExtractor(ABC, AbstractPreprocessor):
             # just ignore the error for now. It would need much more rules to prevent this.
             return None
 
+    def benchmark_processing_function(self, spider: str, num_decisions: int = 1000,
+                                      reference_functions_file: Path = None) -> bool:
+        """
+        Times the processing function of the spider on real decisions.
+        If a reference file (e.g. a previous version of the spider specific functions) is given,
+        its processing function is timed as well and the outputs of both are compared.
+        :param spider:                      the spider to take the decisions from
+        :param num_decisions:               how many decisions to use per language
+        :param reference_functions_file:    the file containing the reference processing functions
+        :return:                            whether the outputs are identical (always True without reference)
+        """
+        engine = self.get_engine(self.db_scrc)
+        functions = {'current': getattr(self.processing_functions, spider)}
+        if reference_functions_file:
+            spec = importlib.util.spec_from_file_location('reference_functions', reference_functions_file)
+            reference_functions = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(reference_functions)
+            functions['reference'] = getattr(reference_functions, spider)
+
+        def run(function, data, namespace):
+            try:
+                return repr(function(data, namespace))
+            except Exception as e:  # the errors need to be identical as well
+                return type(e).__name__
+
+        all_identical = True
+        for lang in self.languages:
+            inputs = []
+            for df in self.select_required_data(engine, lang, self.get_database_selection_string(spider, lang)):
+                for _, series in df.iterrows():
+                    inputs.append((self.get_required_data(series), self.get_namespace(series)))
+                if len(inputs) >= num_decisions:
+                    break
+            inputs = inputs[:num_decisions]
+            if not inputs:
+                continue
+
+            outputs = {}
+            for name, function in functions.items():
+                start = time.perf_counter()
+                outputs[name] = [run(function, data, dict(namespace)) for data, namespace in inputs]
+                seconds = time.perf_counter() - start
+                self.logger.info(f"{spider} ({lang}) {name}: {len(inputs) / seconds:.0f} decisions per second "
+                                 f"({len(inputs)} decisions in {seconds:.3f}s)")
+            if 'reference' in outputs:
+                differences = sum(current != reference
+                                  for current, reference in zip(outputs['current'], outputs['reference']))
+                all_identical &= differences == 0
+                self.logger.info(f"{spider} ({lang}): {differences} of {len(inputs)} outputs differ from the reference")
+        return all_identical
+
     def coverage_get_total(self, engine: Engine, spider: str, lang: str) -> int:
         """
         Returns total amount of valid entries to be processed by extractor
@@ -139,21 +249,45 @@ class AbstractExtractor(ABC, AbstractPreprocessor):
         )
         return pd.read_sql(query, engine.connect())["count"][0]
 
-    def start_progress(self, engine: Engine, spider: str, lang: str):
+    def count_successful(self, df: pd.DataFrame) -> int:
+        """Returns how many decisions of the processed chunk got a result"""
+        return int(sum(not is_null(value) for value in df[self.col_name]))
+
+    def reset_progress(self, total_to_process: int = -1):
         self.processed_amount = 0
-        self.total_to_process = self.coverage_get_total(engine, spider, lang)
-        self.logger.info(f"Total: {self.total_to_process}")
+        self.successful_amount = 0
+        self.total_to_process = total_to_process
+
+    def start_progress(self, engine: Engine, spider: str, lang: str):
+        if self.audit_coverage:
+            self.reset_progress(self.coverage_get_total(engine, spider, lang))
+            self.logger.info(f"Total: {self.total_to_process}")
+        else:
+            self.reset_progress()
 
-    def log_progress(self, chunksize: int):
-        self.processed_amount = min(
-            self.processed_amount + chunksize, self.total_to_process)
-        self.logger.info(f"{self.logger_info['saving']} ({self.processed_amount}/{self.total_to_process})")
+    def log_progress(self, df: pd.DataFrame):
+        """Counts the decisions of the processed chunk, so that the coverage does not need to be queried"""
+        self.processed_amount += len(df.index)
+        self.successful_amount += self.count_successful(df)
+        total = self.total_to_process if self.total_to_process >= 0 else '?'
+        self.logger.info(f"{self.logger_info['saving']} ({self.processed_amount}/{total})")
 
     def log_coverage(self, engine: Engine, spider: str, lang: str):
-        successful_attempts = self.coverage_get_successful(engine, spider, lang)
+        total, successful_attempts = self.processed_amount, self.successful_amount
+        if self.audit_coverage:
+            total, successful_attempts = self.total_to_process, self.coverage_get_successful(engine, spider, lang)
+            if (total, successful_attempts) != (self.processed_amount, self.successful_amount):
+                self.logger.warning(f"The counted coverage ({self.successful_amount} / {self.processed_amount}) "
+                                    f"differs from the coverage in the database")
         self.logger.info(
             f"{self.logger_info['finish_spider']} in {lang} with "
-            f"{successful_attempts} / {self.total_to_process} "
-            f"({successful_attempts / self.total_to_process:.2%}) "
+            f"{successful_attempts} / {total} "
+            f"({successful_attempts / max(total, 1):.2%}) "
             "working"
         )
+
+
+def is_null(value: Any) -> bool:
+    """Whether the extracted value is saved as null (or the json null)"""
+    return value is None or (isinstance(value, float) and math.isnan(value)) \
+           or (isinstance(value, str) and value == 'null')
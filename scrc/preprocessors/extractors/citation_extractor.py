@@ -18,6 +18,7 @@ class CitationExtractor(AbstractExtractor):
         super().__init__(config, function_name='citation_extracting_functions', col_name='citations')
         self.logger = get_logger(__name__)
         self.processed_file_path = self.progress_dir / "spiders_citation_extracted.txt"
+        self.required_columns = ['html_raw', 'pdf_raw']  # only fetch the raw decision
         self.logger_info = {
             'start': 'Started extracting citations',
             'finished': 'Finished extracting citations',
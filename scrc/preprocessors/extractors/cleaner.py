@@ -91,7 +91,7 @@ class Cleaner(AbstractExtractor):
                 with ProgressBar():
                     df = ddf.compute(scheduler='processes')
                 self.update(engine, df, lang, [self.col_name], self.output_dir)
-                self.log_progress(self.chunksize)
+                self.log_progress(df)
             self.log_coverage(engine, spider, lang)
         self.logger.info(f"{self.logger_info['finish_spider']} {spider}")
 
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from collections import Counter
+from typing import Dict, List, TYPE_CHECKING
+
+import pandas as pd
+
+from scrc.enums.language import Language
+from scrc.preprocessors.abstract_preprocessor import AbstractPreprocessor
+from scrc.preprocessors.extractors.abstract_extractor import AbstractExtractor, is_null
+from scrc.utils.log_utils import get_logger
+from scrc.utils.main_utils import get_config
+from scrc.utils.spider_function_registry import SpiderFunctionRegistry
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+
+
+class HeaderAnalyzer(AbstractPreprocessor):
+    """
+    Extracts the lower court, the court composition and the parties from the header section in one pass.
+    Every header is read once and passed to the spider specific functions of all three extractors,
+    and the three columns are written with one update per chunk.
+    """
+    # the extracted columns with the spider specific functions of their extractors
+    function_names = {
+        'lower_court': 'lower_court_extracting_functions',
+        'court_composition': 'court_composition_extracting_functions',
+        'parties': 'procedural_participation_extracting_functions',
+    }
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.logger = get_logger(__name__)
+        self.processed_file_path = self.progress_dir / "spiders_header_analyzed.txt"
+        self.spider_functions: Dict[str, SpiderFunctionRegistry] = {
+            col_name: SpiderFunctionRegistry(self.load_functions(config, function_name))
+            for col_name, function_name in self.function_names.items()
+        }
+        self.columns = list(self.spider_functions.keys())
+        # if set, the coverage is additionally counted with a query on the whole table
+        self.audit_coverage = False
+
+    def start(self):
+        self.logger.info(f"Started analyzing the headers ({', '.join(self.columns)})")
+        spider_list, message = self.compute_remaining_spiders(self.processed_file_path)
+        self.logger.info(message)
+
+        engine = self.get_engine(self.db_scrc)
+        for lang in self.languages:
+            for col_name in self.columns:
+                self.add_column(engine, lang, col_name=col_name, data_type='jsonb')
+
+        for spider in spider_list:
+            columns = [col_name for col_name in self.columns if spider in self.spider_functions[col_name]]
+            if columns:
+                self.process_one_spider(engine, spider, columns)
+            else:
+                self.logger.debug(f"There are no special functions for spider {spider}. Not analyzing the headers.")
+            self.mark_as_processed(self.processed_file_path, spider)
+
+        self.logger.info("Finished analyzing the headers")
+
+    def get_database_selection_string(self, spider: str, lang: str) -> str:
+        """Returns the `where` clause of the select statement for the entries to be processed"""
+        return f"spider='{spider}' AND header IS NOT NULL AND header <> ''"
+
+    def process_one_spider(self, engine: Engine, spider: str, columns: List[str]):
+        self.logger.info(f"Started analyzing the headers for spider {spider}")
+        for lang in self.languages:
+            lang_columns = [col_name for col_name in columns
+                            if self.spider_functions[col_name].get(spider).supports(lang)]
+            if not lang_columns:
+                self.logger.info(f"The functions of spider {spider} do not support {lang}. Not analyzing the headers.")
+                continue
+            function_columns = []
+            for col_name in lang_columns:
+                spider_function = self.spider_functions[col_name].get(spider)
+                spider_function.prepare()
+                function_columns.extend(spider_function.required_columns or [])
+            where = self.get_database_selection_string(spider, lang)
+            # only the header and the metadata are needed
+            selected_columns = list(dict.fromkeys(['header'] + function_columns))
+            dfs = self.select(engine, lang, columns=", ".join([AbstractExtractor.metadata_columns] + selected_columns),
+                              where=where, chunksize=self.chunksize)
+            total, successful = 0, Counter()
+            for df in dfs:
+                df = df.apply(self.process_one_df_row, axis='columns', columns=lang_columns)
+                self.update(engine, df, lang, lang_columns, self.output_dir)
+                total += len(df.index)
+                successful.update({col_name: sum(not is_null(value) for value in df[col_name])
+                                   for col_name in lang_columns})
+                self.logger.info(f"Saving chunk of analyzed headers ({total} decisions)")
+            self.log_coverage(engine, spider, lang, lang_columns, total, successful)
+        self.logger.info(f"Finished analyzing the headers for spider {spider}")
+
+    def process_one_df_row(self, series: pd.Series, columns: List[str]) -> pd.Series:
+        """Runs the spider specific functions of all the extracted columns on the header of the decision"""
+        self.logger.debug(f"Analyzing the header of {series['file_name']}")
+        namespace = series[['date', 'html_url', 'id']].to_dict()
+        namespace['language'] = Language(series['language'])
+        for col_name in columns:
+            result = None
+            try:
+                result = self.spider_functions[col_name].get(series['spider'])(series['header'], dict(namespace))
+            except Exception as e:
+                # one failing function should not prevent the others from saving their results
+                self.logger.warning(f"({series['id']}): Extracting the {col_name} failed with {e!r}")
+            series[col_name] = result
+        return series
+
+    def log_coverage(self, engine: Engine, spider: str, lang: str, columns: List[str],
+                     total: int, successful: Counter):
+        """
+        Logs the coverage of all the extracted columns counted on the processed decisions
+        or, if the coverage is audited, counted in the database with one query
+        """
+        coverage = dict(total=total, **{col_name: successful[col_name] for col_name in columns})
+        if self.audit_coverage:
+            counts = ", ".join(f"count(*) FILTER (WHERE {col_name} <> 'null') AS {col_name}" for col_name in columns)
+            coverage = self.query(engine, f"SELECT count(*) AS total, {counts} FROM {lang} "
+                                          f"WHERE {self.get_database_selection_string(spider, lang)}").iloc[0]
+        for col_name in columns:
+            self.logger.info(f"Finished analyzing the headers for spider {spider} in {lang}: "
+                             f"{col_name} {coverage[col_name]} / {coverage['total']} "
+                             f"({coverage[col_name] / max(coverage['total'], 1):.2%}) working")
+
+
+if __name__ == '__main__':
+    config = get_config()
+
+    header_analyzer = HeaderAnalyzer(config)
+    header_analyzer.start()
@@ -1,14 +1,19 @@
 from __future__ import annotations
 import configparser
-from typing import Any, TYPE_CHECKING
+import time
+from typing import Any, List, TYPE_CHECKING
 
+from scrc.enums.language import Language
+from scrc.enums.section import Section
 from scrc.preprocessors.extractors.abstract_extractor import AbstractExtractor
 from root import ROOT_DIR
 from scrc.utils.log_utils import get_logger
-from scrc.utils.main_utils import get_config
+from scrc.utils.main_utils import clean_text, get_config
+from scrc.utils.paragraph_store import ParagraphStore
 
 if TYPE_CHECKING:
     from pandas.core.frame import DataFrame
+    from sqlalchemy.engine.base import Engine
 
 class JudgmentExtractor(AbstractExtractor):
     """
@@ -18,6 +23,9 @@ class JudgmentExtractor(AbstractExtractor):
     def __init__(self, config: dict):
         super().__init__(config, function_name='judgment_extracting_functions', col_name='judgments')
         self.logger = get_logger(__name__)
+        self.required_section = Section.RULINGS  # only fetch the rulings paragraphs
+        # the main ruling (usually the first one) is nearly always within the first paragraphs
+        self.max_paragraphs = 3
         self.processed_file_path = self.progress_dir / "spiders_judgment_extracted.txt"
         self.logger_info = {
             'start': 'Started extracting judgments',
@@ -35,13 +43,78 @@ class JudgmentExtractor(AbstractExtractor):
 
     def get_required_data(self, series: DataFrame) -> Any:
         """Returns the data required by the processing functions"""
-        return series['rulings']
+        # the extracting functions work on the section text
+        return ParagraphStore.separator.join(series['rulings_paragraphs'] or [])
+
+    def get_namespace(self, series: DataFrame) -> dict:
+        namespace = super().get_namespace(series)
+        namespace['rulings_cut_off'] = bool(series.get('rulings_cut_off', False))
+        return namespace
+
+    def process_one_df(self, engine: Engine, lang: str, df: DataFrame) -> DataFrame:
+        """
+        Extracts the judgments from the first paragraphs of the rulings. The decisions whose judgment
+        could be after these paragraphs (no judgment is returned for them) are processed again with all the paragraphs.
+        """
+        df['rulings_cut_off'] = df.rulings_paragraphs.map(lambda paragraphs: len(paragraphs) >= self.max_paragraphs)
+        df = super().process_one_df(engine, lang, df)
+        retry = df.rulings_cut_off & df[self.col_name].isna()
+        if retry.any():
+            where = f"id IN ({', '.join(str(int(decision_id)) for decision_id in df.id[retry])})"
+            function_columns = self.spider_functions.get(df.spider.iloc[0]).required_columns or []
+            columns = ", ".join([self.metadata_columns] + function_columns)
+            full_dfs = ParagraphStore.stream_sections(engine, lang, [self.required_section], columns=columns,
+                                                      where=where, chunksize=self.chunksize)
+            judgments = dict()
+            for full_df in full_dfs:
+                full_df = full_df.apply(self.process_one_df_row, axis="columns")
+                judgments.update(zip(full_df.id, full_df[self.col_name]))
+            df[self.col_name] = [judgments.get(decision_id) if retried else extracted
+                                 for decision_id, extracted, retried in zip(df.id, df[self.col_name], retry)]
+        return df
 
     def check_condition_before_process(self, spider: str, data: Any, namespace: dict) -> bool:
         """Override if data has to conform to a certain condition before processing.
         e.g. data is required to be present for analysis"""
         return bool(data)
 
+    def check_equivalence(self, spiders: List[str], num_decisions: int = 1000) -> bool:
+        """
+        Checks that the compiled judgment markers find the same judgments as searching the rulings
+        for every ruling number and judgment on real decisions and logs the time both take.
+        :param spiders:         the spiders to take the decisions from
+        :param num_decisions:   how many decisions to use per spider and language
+        :return:                whether both found the same judgments for all the decisions
+        """
+        engine = self.get_engine(self.db_scrc)
+        functions = self.processing_functions
+        all_equal = True
+        for spider in spiders:
+            for lang in self.languages:
+                namespace = {'language': Language(lang), 'html_url': None}
+                if namespace['language'] not in functions.all_judgment_markers:
+                    continue
+                rulings_list = []
+                for df in self.select_required_data(engine, lang, self.get_database_selection_string(spider, lang)):
+                    rulings_list.extend(clean_text(self.get_required_data(series)) for _, series in df.iterrows())
+                    if len(rulings_list) >= num_decisions:
+                        break
+                rulings_list = rulings_list[:num_decisions]
+
+                results = {}
+                for get_judgments in [functions.get_judgments, functions.get_judgments_by_search]:
+                    start = time.perf_counter()
+                    results[get_judgments.__name__] = [get_judgments(rulings, namespace) for rulings in rulings_list]
+                    self.logger.info(f"{spider} ({lang}) {get_judgments.__name__}: {len(rulings_list)} decisions "
+                                     f"in {time.perf_counter() - start:.3f}s")
+                for rulings, compiled, searched in zip(rulings_list, results['get_judgments'],
+                                                       results['get_judgments_by_search']):
+                    if compiled != searched:
+                        all_equal = False
+                        self.logger.warning(f"Found {compiled} instead of {searched} in the rulings: {rulings}")
+        self.logger.info(f"Both found the same judgments: {all_equal}")
+        return all_equal
+
 
 if __name__ == '__main__':
     config = get_config()
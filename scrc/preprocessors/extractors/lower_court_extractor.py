@@ -17,6 +17,7 @@ class LowerCourtExtractor(AbstractExtractor):
         super().__init__(config, function_name='lower_court_extracting_functions',
                          col_name='lower_court')
         self.logger = get_logger(__name__)
+        self.required_columns = ['header']  # only fetch the header
         self.processed_file_path = self.progress_dir / "spiders_lower_court_extracted.txt"
         self.logger_info = {
             'start': 'Started extracting lower court informations',
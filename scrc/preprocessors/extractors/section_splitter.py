@@ -1,16 +1,23 @@
 from __future__ import annotations
 import configparser
-from typing import Optional, TYPE_CHECKING, Union
+import time
+import unicodedata
+from collections import Counter
+from typing import List, Optional, TYPE_CHECKING, Union
 
 import bs4
 import pandas as pd
+from sqlalchemy import Column, Integer, MetaData, String, Table
 
+from scrc.data_classes.section_splitting_result import SectionSplittingResult
 from scrc.enums.language import Language
 from scrc.enums.section import Section
+from scrc.enums.section_splitting_status import SectionSplittingStatus
 from scrc.preprocessors.extractors.abstract_extractor import AbstractExtractor
 from root import ROOT_DIR
 from scrc.utils.log_utils import get_logger
 from scrc.utils.main_utils import get_config
+from scrc.utils.paragraph_store import ParagraphStore
 
 if TYPE_CHECKING:
     from sqlalchemy.engine.base import Engine
@@ -34,6 +41,12 @@ class SectionSplitter(AbstractExtractor):
             'no_functions': 'Not splitting into sections.'
         }
         self.processed_file_path = self.progress_dir / "spiders_section_split.txt"
+        self.required_columns = ['html_raw', 'pdf_raw', 'pdf_url']  # only fetch the raw decision
+        # the decisions which did not reach the footer or failed are recorded here so that they can be replayed
+        self.failures_table_name = 'section_splitting_failures'
+        self.failures_table = None
+        self.paragraph_store = None
+        self.section_amounts = Counter()  # the recognized sections per section of the processed decisions
 
     def get_required_data(self, series: pd.DataFrame) -> Union[bs4.BeautifulSoup, str, None]:
         """Returns the data required by the processing functions"""
@@ -55,39 +68,130 @@ class SectionSplitter(AbstractExtractor):
         for lang in self.languages:
             for section in Section:  # add empty section columns
                 self.add_column(engine, lang, col_name=section.value, data_type='text')
-            self.add_column(engine, lang, col_name='paragraphs', data_type='jsonb')
+        self.create_failures_table(engine)
+        self.paragraph_store = ParagraphStore(engine)
+        if self._check_write_privilege(engine):
+            self.paragraph_store.create_table()
+
+    def create_failures_table(self, engine: Engine) -> Table:
+        """Creates the side table recording the decisions which could not be split completely"""
+        if self.failures_table is None:
+            meta = MetaData()
+            self.failures_table = Table(
+                self.failures_table_name, meta,
+                Column('lang', String, primary_key=True),
+                Column('id', Integer, primary_key=True),
+                Column('spider', String),
+                Column('status', String),
+                Column('stuck_section', String),
+                Column('stuck_paragraph_index', Integer),
+            )
+            if self._check_write_privilege(engine):
+                meta.create_all(engine)
+        return self.failures_table
+
+    def save_failures(self, engine: Engine, df: pd.DataFrame, lang: str) -> None:
+        """
+        Replaces the recorded failures of the decisions in the df by their current ones
+        :param engine:  the db engine to work upon
+        :param df:      the processed df containing the status columns added by process_one_df_row
+        :param lang:    the language (table) of the decisions
+        """
+        if not self._check_write_privilege(engine):
+            return
+        table = self.create_failures_table(engine)
+        failures = df[df.status != SectionSplittingStatus.COMPLETE.value]
+        failures = failures[['id', 'spider', 'status', 'stuck_section', 'stuck_paragraph_index']].assign(lang=lang)
+        failures['stuck_paragraph_index'] = failures.stuck_paragraph_index.astype('Int64')
+        failures = failures.astype(object).where(failures.notna(), None)
+        with engine.connect() as conn:
+            conn.execute(table.delete().where(table.c.lang == lang).where(table.c.id.in_(df.id.tolist())))
+            if len(failures.index):
+                conn.execute(table.insert(), failures.to_dict('records'))
 
     def read_column(self, engine: Engine, spider: str, name: str, lang: str) -> pd.DataFrame:
         query = f"SELECT count({name}) FROM {lang} WHERE {self.get_database_selection_string(spider, lang)} AND {name} <> ''"
         return pd.read_sql(query, engine.connect())['count'][0]
 
+    def count_successful(self, df: pd.DataFrame) -> int:
+        return int((df.status == SectionSplittingStatus.COMPLETE.value).sum())
+
+    def reset_progress(self, total_to_process: int = -1):
+        super().reset_progress(total_to_process)
+        self.section_amounts = Counter()
+
+    def log_progress(self, df: pd.DataFrame):
+        """Additionally counts the recognized sections of the processed chunk"""
+        super().log_progress(df)
+        complete = df[df.status == SectionSplittingStatus.COMPLETE.value]
+        for section in Section:
+            if section.value in complete:
+                self.section_amounts[section] += int((complete[section.value].fillna('') != '').sum())
+
     def log_coverage(self, engine: Engine, spider: str, lang: str):
         """Override method to get custom coverage report"""
         self.logger.info(f"{self.logger_info['finish_spider']} in {lang} with the following amount recognized:")
+        total = self.total_to_process if self.audit_coverage else self.processed_amount
         for section in Section:
-            section_amount = self.read_column(engine, spider, section.value, lang)
+            if self.audit_coverage:
+                section_amount = self.read_column(engine, spider, section.value, lang)
+            else:
+                section_amount = self.section_amounts[section]
             self.logger.info(
-                f"{section.value.capitalize()}:\t{section_amount} / {self.total_to_process} "
-                f"({section_amount / self.total_to_process:.2%}) "
+                f"{section.value.capitalize()}:\t{section_amount} / {total} "
+                f"({section_amount / max(total, 1):.2%}) "
             )
 
     def process_one_spider(self, engine: Engine, spider: str):
         self.logger.info(self.logger_info['start_spider'] + ' ' + spider)
 
-        for lang in self.languages:
+        for lang in self.get_supported_languages(spider):
             where = self.get_database_selection_string(spider, lang)
             self.start_progress(engine, spider, lang)
             # stream dfs from the db
-            dfs = self.select(engine, lang, where=where, chunksize=self.chunksize)
-            for df in dfs:
-                df = df.apply(self.process_one_df_row, axis='columns')
-                self.update(engine, df, lang, [section.value for section in Section] + ['paragraphs'], self.output_dir)
-                self.log_progress(self.chunksize)
+            dfs = self.select_required_data(engine, lang, where, self.spider_functions.get(spider).required_columns)
+            self.process_dfs(engine, dfs, lang)
 
             self.log_coverage(engine, spider, lang)
 
         self.logger.info(f"{self.logger_info['finish_spider']} {spider}")
 
+    def replay_failures(self, spiders: Optional[List[str]] = None):
+        """
+        Splits only the decisions recorded in the failures table again, e.g. after changing the section markers.
+        Decisions which succeed now are removed from the failures table.
+        :param spiders: the spiders to replay the failures of (all by default)
+        """
+        self.logger.info("Started replaying the failed section splits")
+        engine = self.get_engine(self.db_scrc)
+        self.add_columns(engine)
+        for lang in self.languages:
+            failed_ids = f"SELECT id FROM {self.failures_table_name} WHERE lang = '{lang}'"
+            if spiders:
+                failed_ids += " AND spider IN ({})".format(", ".join(f"'{spider}'" for spider in spiders))
+            self.reset_progress(self.query(engine, f"SELECT count(*) FROM ({failed_ids}) AS failed")['count'][0])
+            self.logger.info(f"Replaying {self.total_to_process} failed decisions in {lang}")
+            dfs = self.select_required_data(engine, lang, where=f"id IN ({failed_ids})")
+            self.process_dfs(engine, dfs, lang)
+        self.logger.info("Finished replaying the failed section splits")
+
+    def process_dfs(self, engine: Engine, dfs, lang: str) -> Counter:
+        """Splits the sections of the streamed dfs, saves them and records the failures"""
+        statuses = Counter()
+        for df in dfs:
+            df = df.apply(self.process_one_df_row, axis='columns')
+            # only the raw decision is selected, so the sections of the other decisions must not be overwritten
+            complete = df[df.status == SectionSplittingStatus.COMPLETE.value]
+            if len(complete.index):
+                self.update(engine, complete, lang, [section.value for section in Section], self.output_dir)
+            if self._check_write_privilege(engine):
+                self.paragraph_store.save(lang, df.id, df.paragraphs_by_section)
+            self.save_failures(engine, df, lang)
+            statuses.update(df.status)
+            self.log_progress(df)
+        self.logger.info(f"Section splitting status counts in {lang}: {dict(statuses)}")
+        return statuses
+
     def process_one_df_row(self, series: pd.DataFrame) -> pd.DataFrame:
         """Override method to handle section data and paragraph data individually"""
         # TODO consider removing the overriding function altogether with new db
@@ -97,16 +201,84 @@ class SectionSplitter(AbstractExtractor):
         data = self.get_required_data(series)
         assert data
         try:
-            paragraphs_by_section = self.call_processing_function(series['spider'], data, namespace) or None
-            if paragraphs_by_section:
-                for section, value in paragraphs_by_section.items():
-                    series[section.value] = "\t".join(value)  # TODO save as list in new db
+            result = self.call_processing_function(series['spider'], data, namespace)
         except TypeError as e:
             self.logger.error(f"While processing decision {series['html_url']} caught exception {e}")
+            result = None
+        result = result or SectionSplittingResult(status=SectionSplittingStatus.ERROR)
+        series['paragraphs_by_section'] = None
+        if result.is_complete:
+            for section, value in result.paragraphs_by_section.items():
+                series[section.value] = ParagraphStore.separator.join(value)
+            series['paragraphs_by_section'] = result.paragraphs_by_section  # saved in the paragraph store
+        elif result.status == SectionSplittingStatus.STUCK:
+            url = series['html_url'] if pd.notna(series['html_url']) else series.get('pdf_url')
+            self.logger.debug(f"({series['id']}): We got stuck at section {result.stuck_section} "
+                              f"(starting at paragraph {result.stuck_paragraph_index}). Please check! {url}")
+        series['status'] = result.status.value
+        series['stuck_section'] = result.stuck_section.value if result.stuck_section else None
+        series['stuck_paragraph_index'] = result.stuck_paragraph_index
         return series
 
+    def benchmark(self, spiders: List[str], num_decisions: int = 1000):
+        """
+        Compares the compiled section markers with searching the markers of each section one after the other
+        on the paragraphs of real decisions. Logs the throughput of both and whether they assign the same sections.
+        :param spiders:         the spiders to take the decisions from
+        :param num_decisions:   how many decisions to use per spider and language
+        """
+        engine = self.get_engine(self.db_scrc)
+        for spider in spiders:
+            section_markers = getattr(self.processing_functions, f"{spider.lower()}_section_markers")
+            for lang in self.languages:
+                if Language(lang) not in section_markers:
+                    continue
+                markers = section_markers[Language(lang)]
+                paragraphs_of_decisions = []
+                dfs = self.select(engine, lang, where=self.get_database_selection_string(spider, lang),
+                                  chunksize=min(self.chunksize, num_decisions))
+                for df in dfs:
+                    for _, series in df.iterrows():
+                        namespace = series[['date', 'html_url', 'id']].to_dict()
+                        namespace['language'] = Language(lang)
+                        try:
+                            result = self.call_processing_function(spider, self.get_required_data(series), namespace)
+                        except TypeError:
+                            continue
+                        if not result:
+                            continue
+                        paragraphs = [unicodedata.normalize('NFC', paragraph)
+                                      for section in Section for paragraph in result.paragraphs_by_section[section]]
+                        paragraphs_of_decisions.append(paragraphs)
+                    if len(paragraphs_of_decisions) >= num_decisions:
+                        break
+                paragraphs_of_decisions = paragraphs_of_decisions[:num_decisions]
+                num_paragraphs = sum(len(paragraphs) for paragraphs in paragraphs_of_decisions)
+                if not num_paragraphs:
+                    continue
+
+                results = {}
+                for find_next_section in [markers.find_next_section, markers.find_next_section_sequentially]:
+                    start = time.perf_counter()
+                    sections = []
+                    for paragraphs in paragraphs_of_decisions:
+                        current_section = Section.HEADER
+                        for paragraph in paragraphs:
+                            if current_section != Section.FOOTER:
+                                current_section = find_next_section(current_section, paragraph) or current_section
+                            sections.append(current_section)
+                    seconds = time.perf_counter() - start
+                    results[find_next_section.__name__] = sections
+                    self.logger.info(f"{spider} ({lang}) {find_next_section.__name__}: "
+                                     f"{num_paragraphs / seconds:.0f} paragraphs per second "
+                                     f"({len(paragraphs_of_decisions)} decisions in {seconds:.3f}s)")
+                equal = results['find_next_section'] == results['find_next_section_sequentially']
+                self.logger.info(f"{spider} ({lang}): both assign the same sections: {equal}")
+
 
 if __name__ == '__main__':
     config = get_config()
     section_splitter = SectionSplitter(config)
     section_splitter.start()
+    # after changing the section markers, only the failed decisions need to be split again
+    # section_splitter.replay_failures()
@@ -1,7 +1,8 @@
-from pathlib import Path
 import re
 import json
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from root import ROOT_DIR
 from scrc.data_classes.court_composition import CourtComposition
 from scrc.data_classes.court_person import CourtPerson
 
@@ -9,6 +10,7 @@ from scrc.enums.court_role import CourtRole
 from scrc.enums.gender import Gender
 from scrc.enums.language import Language
 from scrc.enums.political_party import PoliticalParty
+from scrc.utils.spider_function_registry import spider_function
 
 """
 This file is used to extract the judicial persons from decisions sorted by spiders.
@@ -22,7 +24,46 @@ def XX_SPIDER(header: str, namespace: dict) -> Optional[str]:
     pass
 
 
+# the regexes of CH_BGer are compiled once when the module is loaded
+ch_bger_information_start = re.compile(r'Besetzung|Bundesrichter|Composition( de la Cour:)?|Composizione|Giudic[ie] federal|composta')
+ch_bger_role_regexes = {
+    Gender.MALE: {
+        CourtRole.JUDGE: re.compile('|'.join([r'Bundesrichter(?!in)', r'MM?\.(( et|,) Mmes?)? les? Juges?( fédéra(l|ux))?',
+                                              r'[Gg]iudici federali'])),
+        CourtRole.CLERK: re.compile('|'.join([r'Gerichtsschreiber(?!in)', r'Greffier[^\w\s]*', r'[Cc]ancelliere']))
+    },
+    Gender.FEMALE: {
+        CourtRole.JUDGE: re.compile('|'.join([r'Bundesrichterin(nen)?', r'Mmes? l(a|es) Juges? (fédérales?)?',
+                                              r'MMe et MM?\. les? Juges?( fédéra(l|ux))?', r'[Gg]iudice federal'])),
+        CourtRole.CLERK: re.compile('|'.join([r'Gerichtsschreiberin(nen)?', r'Greffière.*Mme', r'[Cc]ancelliera']))
+    }
+}
+ch_bger_end_positions = {
+    Language.DE: [re.compile(r'.(?=(1.)?(Partei)|(Verfahrensbeteiligt))'), re.compile('Urteil vom'),
+                  re.compile(r'Gerichtsschreiber(in)?\s\w*.'), re.compile(r'[Ii]n Sachen'), re.compile(r'\w{2,}\.')],
+    Language.FR: [re.compile(r'.(?=(Parties|Participant))'), re.compile(r'Greffi[eè]re? M(\w)*\.\s\w*.')],
+    Language.IT: [re.compile(r'.(?=(Parti)|(Partecipant))'), re.compile(r'[Cc]ancellier[ae]:?\s\w*.'),
+                  re.compile(r'\w{2,}\.')],
+}
+ch_bger_abbreviation_dot = re.compile(r'(?<!M)(?<!Mme)(?<!MM)(?<!\s\w)\.')
+ch_bger_male_and_female = re.compile(r'MM?\., Mme')
+ch_bger_female_and_male = re.compile(r'Mmes?, MM?\.')
+ch_bger_president = re.compile(r'(?<![Vv]ice-)[Pp]r[äée]sid')
+ch_bger_name_after_role = re.compile(r'[A-Z][A-Za-z\-éèäöü\s]*(?= Urteil)|[A-Z][A-Za-z\-éèäöü\s]*(?= )')
+ch_bger_name = re.compile(r'[A-Z][A-Za-z\-éèäöü\s]*(?= Urteil)|[A-Z][A-Za-z\-éèäöü\s]*(?= )|[A-Z][A-Za-z\-éèäöü\s]*')
+
+
+def search_first(patterns: List[re.Pattern], text: str) -> Optional[re.Match]:
+    """Returns the match of the first pattern matching the text (the patterns after it are not evaluated)"""
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match
+    return None
+
+
 # check if court got assigned shortcut: SELECT count(*) from de WHERE lower_court is not null and lower_court <> 'null' and lower_court::json#>>'{court}'~'[A-Z0-9_]{2,}';
+@spider_function(languages=ch_bger_end_positions.keys(), prepare=lambda: PersonIndex.get_instance())
 def CH_BGer(header: str, namespace: dict) -> Optional[str]:
     """
     Extract judicial persons from decisions of the Federal Supreme Court of Switzerland
@@ -31,35 +72,13 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
     :return:            the sections dict
     """
 
-    information_start_regex = r'Besetzung|Bundesrichter|Composition( de la Cour:)?|Composizione|Giudic[ie] federal|composta'
-    role_regexes = {
-        Gender.MALE: {
-            CourtRole.JUDGE: [r'Bundesrichter(?!in)', r'MM?\.(( et|,) Mmes?)? les? Juges?( fédéra(l|ux))?',
-                       r'[Gg]iudici federali'],
-            CourtRole.CLERK: [r'Gerichtsschreiber(?!in)', r'Greffier[^\w\s]*', r'[Cc]ancelliere']
-        },
-        Gender.FEMALE: {
-            CourtRole.JUDGE: [r'Bundesrichterin(nen)?', r'Mmes? l(a|es) Juges? (fédérales?)?',
-                       r'MMe et MM?\. les? Juges?( fédéra(l|ux))?', r'[Gg]iudice federal'],
-            CourtRole.CLERK: [r'Gerichtsschreiberin(nen)?', r'Greffière.*Mme', r'[Cc]ancelliera']
-        }
-    }
-
     skip_strings = get_skip_strings()
 
-    start_pos = re.search(information_start_regex, header)
+    start_pos = ch_bger_information_start.search(header)
     if start_pos:
         header = header[start_pos.span()[0]:]
-    end_pos = {
-        Language.DE: re.search(r'.(?=(1.)?(Partei)|(Verfahrensbeteiligt))', header) or re.search('Urteil vom',
-                                                                                          header) or re.search(
-            r'Gerichtsschreiber(in)?\s\w*.', header) or re.search(r'[Ii]n Sachen', header) or re.search(r'\w{2,}\.',
-                                                                                                        header),
-        Language.FR: re.search(r'.(?=(Parties|Participant))', header) or re.search(r'Greffi[eè]re? M(\w)*\.\s\w*.', header),
-        Language.IT: re.search(r'.(?=(Parti)|(Partecipant))', header) or re.search(r'[Cc]ancellier[ae]:?\s\w*.',
-                                                                            header) or re.search(r'\w{2,}\.', header),
-    }
-    end_pos = end_pos[namespace['language']]
+    # only search the end in the language of the decision
+    end_pos = search_first(ch_bger_end_positions[namespace['language']], header)
     if end_pos:
         header = header[:end_pos.span()[1] - 1]
 
@@ -69,9 +88,9 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
     header = header.replace(' et ', ', ')
     header = header.replace(' e ', ', ')
     header = header.replace('MMe', 'Mme')
-    header = re.sub(r'(?<!M)(?<!Mme)(?<!MM)(?<!\s\w)\.', ', ', header)
-    header = re.sub(r'MM?\., Mme', 'M. et Mme', header)
-    header = re.sub(r'Mmes?, MM?\.', 'MMe et M', header)
+    header = ch_bger_abbreviation_dot.sub(', ', header)
+    header = ch_bger_male_and_female.sub('M. et Mme', header)
+    header = ch_bger_female_and_male.sub('MMe et M', header)
     header = header.replace('federali, ', 'federali')
     besetzungs_strings = header.split(',')
 
@@ -94,8 +113,7 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
         text = text.strip()
         if len(text) == 0 or text in skip_strings[namespace['language']]:
             continue
-        if re.search(r'(?<![Vv]ice-)[Pp]r[äée]sid',
-                     text):  # Set president either to the current person or the last Person (case 1: Präsident Niklaus, case 2: Niklaus, Präsident)
+        if ch_bger_president.search(text):  # Set president either to the current person or the last Person (case 1: Präsident Niklaus, case 2: Niklaus, Präsident)
             if last_person:
                 besetzung.president = last_person
                 continue
@@ -105,18 +123,16 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
                 besetzung.president = president
         has_role_in_string = False
         matched_gender_regex = False
-        for gender in role_regexes:  # check for male and female all roles
+        for gender in ch_bger_role_regexes:  # check for male and female all roles
             if matched_gender_regex:
                 break
-            role_regex = role_regexes[gender]
+            role_regex = ch_bger_role_regexes[gender]
             for regex_key in role_regex:  # check each role
-                regex = '|'.join(role_regex[regex_key])
-                role_pos = re.search(regex, text)
+                role_pos = role_regex[regex_key].search(text)
                 if role_pos: # Found a role regex
                     last_role = current_role
                     current_role = regex_key
-                    name_match = re.search(r'[A-Z][A-Za-z\-éèäöü\s]*(?= Urteil)|[A-Z][A-Za-z\-éèäöü\s]*(?= )',
-                                           text[role_pos.span()[1] + 1:])
+                    name_match = ch_bger_name_after_role.search(text[role_pos.span()[1] + 1:])
                     name = name_match.group() if name_match else text[role_pos.span()[1] + 1:]
                     if len(name.strip()) == 0:
                         if (last_role == CourtRole.CLERK and len(besetzung.clerks) == 0) or (last_role == CourtRole.JUDGE and len(besetzung.judges) == 0):
@@ -148,8 +164,7 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
             if namespace['language'] == Language.FR:
                 person = prepare_french_name_and_find_gender(text)
                 last_gender = person.gender or last_gender
-            name_match = re.search(
-                r'[A-Z][A-Za-z\-éèäöü\s]*(?= Urteil)|[A-Z][A-Za-z\-éèäöü\s]*(?= )|[A-Z][A-Za-z\-éèäöü\s]*', person.name)
+            name_match = ch_bger_name.search(person.name)
             if not name_match:
                 continue
             name = name_match.group()
@@ -497,31 +512,83 @@ def get_skip_strings() -> dict:
     }
 
 
+class PersonIndex:
+    """
+    Index of the persons in personal_information.json for matching the names found in the decisions.
+    The file is only parsed once per process, when the index is used for the first time.
+    For every role, the name tokens are mapped to the persons containing them,
+    so that only the persons containing all the tokens of a name need to be checked.
+    """
+    personal_information_path = ROOT_DIR / 'scrc' / 'preprocessors' / 'extractors' / 'personal_information.json'
+    _instance = None
+
+    def __init__(self, personal_information_database: dict):
+        self.persons = dict()  # role -> list of persons (in the order of the file)
+        self.postings = dict()  # role -> name token -> indices of the persons with this token
+        self.initials = dict()  # role -> list of the characters following a whitespace in the name of each person
+        for role, subcategories in personal_information_database.items():
+            persons = [db_person for cat_ids in subcategories.values() for db_persons in cat_ids.values()
+                       for db_person in db_persons]
+            self.persons[role] = persons
+            self.postings[role] = dict()
+            for index, db_person in enumerate(persons):
+                for token in set(db_person['name'].split()):
+                    self.postings[role].setdefault(token, []).append(index)
+            self.initials[role] = [{name[i + 1] for i in range(len(name) - 1) if name[i].isspace()}
+                                   for name in (db_person['name'] for db_person in persons)]
+        self.match_cache = dict()  # (name, role) -> the matching persons
+
+    @classmethod
+    def get_instance(cls) -> 'PersonIndex':
+        if cls._instance is None:
+            cls._instance = cls(json.loads(cls.personal_information_path.read_text()))
+        return cls._instance
+
+    @property
+    def roles(self) -> List[str]:
+        return list(self.persons.keys())
+
+    def find(self, name: str, role: str) -> List[dict]:
+        """
+        Returns all the persons of the role whose name contains all the words of the name (longer than one character)
+        and if the name contains an initial, whose first name or last name starts with it
+        """
+        key = (name, role)
+        if key not in self.match_cache:
+            split_name = name.replace('.', '').strip().split()
+            initial = None
+            if len(split_name) > 1:
+                initial = next((x for x in split_name if len(x) == 1), None)
+                split_name = [x for x in split_name if len(x) > 1]
+            if split_name:
+                candidates = set.intersection(*(set(self.postings[role].get(token, [])) for token in split_name))
+            else:
+                candidates = range(len(self.persons[role]))  # an empty name matches everybody
+            self.match_cache[key] = [self.persons[role][index] for index in sorted(candidates)
+                                     if not initial or self.has_initial(role, index, initial.upper())]
+        return self.match_cache[key]
+
+    def has_initial(self, role: str, index: int, initial: str) -> bool:
+        if len(initial) == 1:
+            return initial in self.initials[role][index]
+        return bool(re.search(rf'\s{re.escape(initial)}', self.persons[role][index]['name']))
+
+
 def match_person_to_database(person: CourtPerson, current_gender: Gender) -> Tuple[CourtPerson, bool]:
     """"Matches a name of a given role to a person from personal_information.json"""
-    personal_information_database = json.loads(Path("personal_information.json").read_text())
+    person_index = PersonIndex.get_instance()
 
     results = []
-    name = person.name.replace('.', '').strip()
-    split_name = name.split()
-    initial = False
-    if len(split_name) > 1:
-        initial = next((x for x in split_name if len(x) == 1), None)
-        split_name = list(filter(lambda x: len(x) > 1, split_name))
-    if person.court_role.value in personal_information_database:
-        for subcategory in personal_information_database[person.court_role]:
-            for cat_id in personal_information_database[person.court_role][subcategory]:
-                for db_person in personal_information_database[person.court_role][subcategory][cat_id]:
-                    if set(split_name).issubset(set(db_person['name'].split())):
-                        if not initial or re.search(rf'\s{initial.upper()}\w*', db_person['name']):
-                            person.name = db_person['name']
-                            if db_person.get('gender'):
-                                person.gender = Gender(db_person['gender'])
-                            if db_person.get('party'):
-                                person.party = PoliticalParty(db_person['party'])
-                            results.append(person)
+    if person.court_role and person.court_role.value in person_index.roles:
+        for db_person in person_index.find(person.name, person.court_role.value):
+            person.name = db_person['name']
+            if db_person.get('gender'):
+                person.gender = Gender(db_person['gender'])
+            if db_person.get('party'):
+                person.party = PoliticalParty(db_person['party'])
+            results.append(person)
     else:
-        for existing_role in personal_information_database:
+        for existing_role in person_index.roles:
             temp_person = CourtPerson(person.name, court_role=CourtRole(existing_role))
             db_person, match = match_person_to_database(temp_person, current_gender)
             if match:
@@ -529,6 +596,5 @@ def match_person_to_database(person: CourtPerson, current_gender: Gender) -> Tup
     if len(results) == 1:
         if not results[0].gender:
             results[0].gender = current_gender
-        return person, True
+        return results[0], True
     return person, False
-
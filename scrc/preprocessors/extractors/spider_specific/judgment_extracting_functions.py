@@ -1,11 +1,13 @@
 import unicodedata
-from typing import Optional, List
+from functools import lru_cache
+from typing import Dict, List, Match, Optional, Pattern, Set
 
 import re
 
 from scrc.enums.judgment import Judgment
 from scrc.enums.language import Language
 from scrc.utils.main_utils import clean_text, int_to_roman
+from scrc.utils.spider_function_registry import spider_function
 
 """
 This file is used to extract the judgment outcomes from decisions sorted by spiders.
@@ -71,6 +73,7 @@ def XX_SPIDER(rulings: str, namespace: dict) -> Optional[List[Judgment]]:
     pass
 
 
+@spider_function(languages=[Language.DE, Language.FR, Language.IT])
 def CH_BGer(rulings: str, namespace: dict) -> Optional[List[Judgment]]:
     """
     Extract judgment outcomes from the rulings
@@ -88,7 +91,9 @@ def CH_BGer(rulings: str, namespace: dict) -> Optional[List[Judgment]]:
 
     judgments = get_judgments(rulings, namespace)
 
-    if not judgments:
+    if not judgments and namespace.get('rulings_cut_off'):
+        return None  # the judgment may be after the first paragraphs of the rulings (see JudgmentExtractor)
+    elif not judgments:
         message = f"Found no judgment for the rulings \"{rulings}\" in the case {namespace['html_url']}. Please check!"
         raise ValueError(message)
     elif len(judgments) > 1:
@@ -160,13 +165,75 @@ all_judgment_markers = {
 }
 
 
+class JudgmentMarkers:
+    """
+    The judgment markers of one language, compiled once when the module is loaded:
+    the markers of each judgment are combined into one compiled pattern.
+    """
+
+    def __init__(self, judgment_markers: Dict[Judgment, List[str]]):
+        # an empty list of markers matches every ruling, just like searching for the empty alternation
+        self.patterns = {judgment: re.compile('|'.join(judgment_markers[judgment])) for judgment in Judgment}
+
+    def find_judgments(self, ruling: str) -> Set[Judgment]:
+        """
+        Returns all the judgments whose markers are found in the ruling
+        :param ruling:  the NFC normalized ruling
+        :return:        the set of judgments
+        """
+        return {judgment for judgment, pattern in self.patterns.items() if pattern.search(ruling)}
+
+
+compiled_judgment_markers = {language: JudgmentMarkers(judgment_markers)
+                             for language, judgment_markers in all_judgment_markers.items()}
+
+
+@lru_cache(maxsize=None)
+def get_ruling_pattern(start: str, end: str) -> Pattern:
+    """Returns the compiled pattern of search_rulings, so that it is compiled once per number and not per decision"""
+    return re.compile(rf"{start}\.(.+?)(?:{end}\.|$)")
+
+
+def find_nth_ruling(rulings: str, n: int, roman_numerals: bool = True) -> Optional[Match]:
+    """Same as search_rulings for the nth ruling but with the compiled patterns (falling back to roman numerals)"""
+    match = get_ruling_pattern(str(n), str(n + 1)).search(rulings)
+    if not match and roman_numerals:
+        # try with roman numerals
+        match = get_ruling_pattern(int_to_roman(n), int_to_roman(n + 1)).search(rulings)
+    return match
+
+
 def get_judgments(rulings: str, namespace: dict) -> set:
     """
     Get the judgment outcomes based on a rulings string and the given namespace context.
+    The rulings are only searched until the first ruling containing a judgment is found (usually the first one).
+    If the rulings are cut off (namespace['rulings_cut_off']), no judgment is returned for a ruling
+    which may continue after the end of the rulings string.
     :param rulings:     the rulings string
     :param namespace:   the context (metadata) from the court decision
     :return:            the set of judgment outcomes
     """
+    judgment_markers = compiled_judgment_markers[namespace['language']]
+    cut_off = namespace.get('rulings_cut_off', False)
+
+    judgments = set()
+    n = 1
+    while len(judgments) == 0:
+        # the roman numerals are only searched if the arabic numeral cannot be after the end of the rulings string
+        match = find_nth_ruling(rulings, n, roman_numerals=not cut_off)
+        if match is None or (cut_off and match.end(1) == len(rulings)):
+            break
+        # if we don't normalize, we get weird matching behaviour
+        judgments = judgment_markers.find_judgments(unicodedata.normalize('NFC', match.group(1)))
+        n += 1
+    return judgments
+
+
+def get_judgments_by_search(rulings: str, namespace: dict) -> set:
+    """
+    Same as get_judgments but searches the rulings again for every ruling number and every judgment.
+    This is how the judgments used to be found and is only kept to check the compiled markers against.
+    """
     judgments = set()
 
     judgment_markers = all_judgment_markers[namespace['language']]
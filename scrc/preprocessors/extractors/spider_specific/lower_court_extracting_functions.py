@@ -1,21 +1,83 @@
-from typing import Match, Optional, List, Tuple
+from typing import Dict, Match, Optional, List, Tuple
 from pathlib import Path
 import re
 import unicodedata
 import json
 import pandas as pd
+
+from root import ROOT_DIR
 from scrc.utils.main_utils import clean_text
+from scrc.utils.spider_function_registry import spider_function
 
 """
 This file is used to extract the lower courts from decisions sorted by spiders.
 The name of the functions should be equal to the spider! Otherwise, they won't be invocated!
 """
 
+class CourtChambersIndex:
+    """
+    Index of the cantons, courts and chambers in court_chambers.json by their names in de/fr/it.
+    The file is only parsed once per process, when the index is used for the first time.
+    """
+    court_chambers_path = ROOT_DIR / "court_chambers.json"
+    languages = ['de', 'fr', 'it']
+    _instance = None
+
+    def __init__(self, court_chambers_data: dict):
+        self.cantons = dict()  # canton name -> canton short (the first canton in the file wins)
+        self.courts = dict()  # canton short -> court name -> court short (the first court in the file wins)
+        self.chambers = dict()  # canton short -> court short -> list of (chamber short, chamber names)
+        for canton_short, canton in court_chambers_data.items():
+            for lang in self.languages:
+                self.cantons.setdefault(canton[lang], canton_short)
+            self.courts[canton_short], self.chambers[canton_short] = dict(), dict()
+            for court_short, court in canton['gerichte'].items():
+                for lang in self.languages:
+                    self.courts[canton_short].setdefault(court[lang], court_short)
+                self.chambers[canton_short][court_short] = [
+                    (chamber_short, [chamber[lang] for lang in self.languages])
+                    for chamber_short, chamber in court['kammern'].items()
+                    if set(self.languages) <= chamber.keys()]
+        self.chamber_cache = dict()  # (chamber, court, canton) -> chamber short
+
+    @classmethod
+    def get_instance(cls) -> 'CourtChambersIndex':
+        if cls._instance is None:
+            cls._instance = cls(json.loads(cls.court_chambers_path.read_text()))
+        return cls._instance
+
+    def get_canton(self, canton: str) -> Optional[str]:
+        return self.cantons.get(canton)
+
+    def get_court(self, court: str, canton: str) -> Optional[str]:
+        return self.courts[canton].get(court)  # raises a KeyError for unknown cantons
+
+    def get_chamber(self, chamber: str, court: str, canton: str) -> Optional[str]:
+        """
+        Returns the first chamber of the court whose name contains the chamber (with or without its number)
+        or the chamber itself if the court is unknown
+        """
+        if court not in self.chambers[canton]:
+            return chamber
+        key = (chamber, court, canton)
+        if key not in self.chamber_cache:
+            chamber_without_number = re.sub(r'[IV0-9]*.\s', '', chamber)
+            result = None
+            for chamber_short, names in self.chambers[canton][court]:
+                # names can be None for missing translations which raises a TypeError just like before
+                if any(chamber in name for name in names) or any(chamber_without_number in name for name in names):
+                    result = chamber_short
+                    break
+            self.chamber_cache[key] = result
+        return self.chamber_cache[key]
+
+
 def XX_SPIDER(header: str, namespace: dict) -> Optional[str]:
     # This is an example spider. Just copy this method and adjust the method name and the code to add your new spider.
     pass
 
 # check if court got assigned shortcut: SELECT count(*) from de WHERE lower_court is not null and lower_court <> 'null' and lower_court::json#>>'{court}'~'[A-Z0-9_]{2,}';
+@spider_function(languages=['de', 'fr', 'it'], prepare=CourtChambersIndex.get_instance)
 def CH_BGer(header: str, namespace: dict) -> Optional[str]:
     """
     Extract lower courts from decisions of the Federal Supreme Court of Switzerland
@@ -77,40 +139,17 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
         ]
     }
 
-    def prepareCantonForQuery(canton: str, court_chambers_data) -> str:
-        for canton_short in court_chambers_data:
-            current_canton = court_chambers_data[canton_short]
-            if current_canton['de'] == canton or \
-                current_canton['fr'] == canton or \
-                current_canton['it'] == canton:
-                return canton_short
-        print(canton)
-
-    def prepareCourtForQuery(court: str, canton:str, court_chambers_data) -> str:
-        canton_court_data = court_chambers_data[canton]
-        for current_court_short in canton_court_data['gerichte']:
-            current_court = canton_court_data['gerichte'][current_court_short]
-            if current_court['de'] == court or \
-                current_court['fr'] == court or \
-                current_court['it'] == court:
-                return current_court_short
-
-    def prepareChamberForQuery(chamber: str, court: str, canton:str, court_chambers_data) -> str:
-        if court not in court_chambers_data[canton]['gerichte']:
-            return chamber
-        possible_labels = court_chambers_data[canton]['gerichte'][court]['kammern']
-        for current_short in possible_labels:
-            current_court_data = court_chambers_data[canton]['gerichte'][court]['kammern'][current_short]
-            if {'de', 'fr', 'it'} <= current_court_data.keys():
-                if chamber in current_court_data['de'] or \
-                    chamber in current_court_data['fr'] or \
-                    chamber in current_court_data['it']:
-                    return current_short
-                chamber_without_number = re.sub(r'[IV0-9]*.\s', '', chamber)
-                if chamber_without_number in current_court_data['de'] or \
-                    chamber_without_number in current_court_data['fr'] or \
-                    chamber_without_number in current_court_data['it']:
-                    return current_short
+    def prepareCantonForQuery(canton: str, court_chambers_index: CourtChambersIndex) -> str:
+        canton_short = court_chambers_index.get_canton(canton)
+        if canton_short is None:
+            print(canton)
+        return canton_short
+
+    def prepareCourtForQuery(court: str, canton:str, court_chambers_index: CourtChambersIndex) -> str:
+        return court_chambers_index.get_court(court, canton)
+
+    def prepareChamberForQuery(chamber: str, court: str, canton:str, court_chambers_index: CourtChambersIndex) -> str:
+        return court_chambers_index.get_chamber(chamber, court, canton)
 
     def prepareDateForQuery(date: str) -> str:
         translation_dict = {
@@ -131,19 +170,17 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
         chamber = None
 
         if 'canton' in lower_court_information:
-            court_chambers_data = json.loads(Path("court_chambers.json").read_text())
-            lower_court_information['canton'] = prepareCantonForQuery(lower_court_information['canton'], court_chambers_data)
+            lower_court_information['canton'] = prepareCantonForQuery(lower_court_information['canton'], CourtChambersIndex.get_instance())
             if 'court_string' in lower_court_information and lower_court_information['canton'] is not None:
-                lower_court_information['court'] = prepareCourtForQuery(lower_court_information['court_string'], lower_court_information['canton'], court_chambers_data)
+                lower_court_information['court'] = prepareCourtForQuery(lower_court_information['court_string'], lower_court_information['canton'], CourtChambersIndex.get_instance())
         else:
             if 'court_string' in lower_court_information:
-                court_chambers_data = json.loads(Path("court_chambers.json").read_text())
-                lower_court_information['court'] = prepareCourtForQuery(lower_court_information['court_string'], 'CH', court_chambers_data)
+                lower_court_information['court'] = prepareCourtForQuery(lower_court_information['court_string'], 'CH', CourtChambersIndex.get_instance())
                 if re.match(r'CH_',lower_court_information['court']):
                     lower_court_information['canton'] = 'CH'
 
         if {'canton', 'chamber_string', 'court'} <= lower_court_information.keys() and all(value is not None for value in [lower_court_information['chamber_string'], lower_court_information['court'], lower_court_information['canton']]):
-            lower_court_information['chamber'] = prepareChamberForQuery(lower_court_information['chamber_string'], lower_court_information['court'], lower_court_information['canton'], json.loads(Path("court_chambers.json").read_text()))
+            lower_court_information['chamber'] = prepareChamberForQuery(lower_court_information['chamber_string'], lower_court_information['court'], lower_court_information['canton'], CourtChambersIndex.get_instance())
         if 'date' in lower_court_information:
             lower_court_information['date'] = prepareDateForQuery(lower_court_information['date'])
 
@@ -8,6 +8,7 @@ from scrc.data_classes.proceedings_party import ProceedingsParty
 from scrc.enums.gender import Gender
 from scrc.enums.language import Language
 from scrc.enums.legal_type import LegalType
+from scrc.utils.spider_function_registry import spider_function
 
 """
 This file is used to extract the parties from decisions sorted by spiders.
@@ -19,6 +20,63 @@ def XX_SPIDER(header: str, namespace: dict) -> Optional[str]:
     # This is an example spider. Just copy this method and adjust the method name and the code to add your new spider.
     pass
 
+# the regexes of CH_BGer are compiled once when the module is loaded
+ch_bger_information_start = re.compile(r'Parteien|Verfahrensbeteiligte|[Ii]n Sachen|Parties|Participants à la procédure|formée? par|[Dd]ans la cause|Parti|Partecipanti al procedimento|Visto il ricorso.*?da')
+ch_bger_clerk_starts = [re.compile(r'Gerichtsschreiber.*?\.'), re.compile(r'[Gg]reffi[eè]re?.*?\S{2,}?\.')]
+ch_bger_end_positions = {
+    Language.DE: [re.compile(r'(?<=Beschwerdegegnerin).+?'), re.compile(r'(?<=Beschwerdegegner).+?'),
+                  re.compile(r'Gegenstand'), re.compile(r'A\.\- '), re.compile(r'gegen das Urteil')],
+    Language.FR: [re.compile(r'Objet'), re.compile(r'Vu')],
+    Language.IT: [re.compile(r'Oggetto')]
+}
+ch_bger_second_party_start = re.compile('|'.join([
+    r'gegen',
+    r'contre',
+    r'(?<=,) et',
+    r'contro(?! l[ao] (?:decisione|sentenza|risoluzione|scritto))',
+    r'contro l.*?che (?:l[oai] )?oppone (?:(?:il|l[oai]) ricorrente)?'
+]))
+ch_bger_representation_start = re.compile('|'.join([
+    r'vertreten durch',
+    r'représentée? par',
+    r'p\.a\.',
+    r'patrocinat[oia]',
+    r'rappresentat[oia]',
+    r'presso'
+]))
+ch_bger_party_gender = {
+    Gender.MALE: re.compile('|'.join([r'Beschwerdeführer(?!in)', r'Beschwerdegegner(?!in)', r'recourant(?!e)',
+                                      r'intimés?(?!e)', r'ricorrente'])),
+    Gender.FEMALE: re.compile('|'.join([r'Beschwerdeführerin', r'Beschwerdegegnerin', r'recourantes?', r'intimées?']))
+}
+ch_bger_lawyer_representation = {
+    Gender.MALE: re.compile('|'.join([r'Rechtsanwalt', r'Fürsprecher(?!in)', r'Advokat(?!in)', r'avocats?(?!e)',
+                                      r'dall\'avv\.', r'l\'avv\.'])),
+    Gender.FEMALE: re.compile('|'.join([r'Rechtsanwältin', r'Fürsprecherin', r'Advokatin', r'avocates?']))
+}
+ch_bger_lawyer_name = {
+    Language.DE: re.compile(r'((Dr\.\s)|(Prof\.\s))*[\w\séäöü\.]*?(?=(,)|(.$)|. Gegen| und)'),
+    Language.FR: re.compile(r'(?<=Me\s)[\w\séèäöü\.\-]*?(?=,| et)|(?<=Mes\s)[\w\séèäöü\.\-]*?(?=,| et)|(?<=Maître\s)[\w\séèäöü\.\-]*?(?=,| et)'),
+    Language.IT: re.compile(r'(lic\.?\s?|iur\.?\s?|dott\.\s?)*[A-Z].*?(?=,)')
+}
+ch_bger_representative_name = re.compile(r'[A-Z][\w\s\.\-\']*(?=,)')
+ch_bger_representative_name_at_end = re.compile(r'[A-Z][\w\s\.\-\']*')
+ch_bger_party_name = re.compile(r'[A-Z1-9].*?(?=(,)|(.$)| Beschwerde)')
+ch_bger_enumerated_party = re.compile(r'[1-9IVX]+\.(?!_)')
+ch_bger_party_enumeration = re.compile(r'[1-9IVX]+\. ')
+ch_bger_anonymized_party = re.compile(r'([A-Z]\.)?[A-Z]\._$')
+
+
+def search_first(patterns: List[re.Pattern], text: str) -> Optional[re.Match]:
+    """Returns the match of the first pattern matching the text (the patterns after it are not evaluated)"""
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match
+    return None
+
+
+@spider_function(languages=ch_bger_end_positions.keys())
 def CH_BGer(header: str, namespace: dict) -> Optional[str]:
     """
     Extract lower courts from decisions of the Federal Supreme Court of Switzerland
@@ -26,75 +84,29 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
     :param namespace:   the namespace containing some metadata of the court decision
     :return:            the sections dict
     """
+    lawyer_name = ch_bger_lawyer_name[namespace['language']]
 
-    information_start_regex = r'Parteien|Verfahrensbeteiligte|[Ii]n Sachen|Parties|Participants à la procédure|formée? par|[Dd]ans la cause|Parti|Partecipanti al procedimento|Visto il ricorso.*?da'
-    second_party_start_regex = [
-        r'gegen',
-        r'contre',
-        r'(?<=,) et',
-        r'contro(?! l[ao] (?:decisione|sentenza|risoluzione|scritto))',
-        r'contro l.*?che (?:l[oai] )?oppone (?:(?:il|l[oai]) ricorrente)?'
-    ]
-    representation_start = {
-        r'vertreten durch',
-        r'représentée? par',
-        r'p\.a\.',
-        r'patrocinat[oia]',
-        r'rappresentat[oia]',
-        r'presso'
-    }
-
-    party_gender = {
-        Gender.MALE: [r'Beschwerdeführer(?!in)', r'Beschwerdegegner(?!in)', r'recourant(?!e)', r'intimés?(?!e)', r'ricorrente'],
-        Gender.FEMALE: [r'Beschwerdeführerin', r'Beschwerdegegnerin', r'recourantes?', r'intimées?']
-    }
-
-    lawyer_representation = {
-        Gender.MALE: [r'Rechtsanwalt', r'Fürsprecher(?!in)', r'Advokat(?!in)', r'avocats?(?!e)', r'dall\'avv\.', r'l\'avv\.'],
-        Gender.FEMALE: [r'Rechtsanwältin', r'Fürsprecherin', r'Advokatin', r'avocates?']
-    }
-
-    lawyer_name = {
-        Language.DE: r'((Dr\.\s)|(Prof\.\s))*[\w\séäöü\.]*?(?=(,)|(.$)|. Gegen| und)',
-        Language.FR: r'(?<=Me\s)[\w\séèäöü\.\-]*?(?=,| et)|(?<=Mes\s)[\w\séèäöü\.\-]*?(?=,| et)|(?<=Maître\s)[\w\séèäöü\.\-]*?(?=,| et)',
-        Language.IT: r'(lic\.?\s?|iur\.?\s?|dott\.\s?)*[A-Z].*?(?=,)'
-    }
-
-    start_pos = re.search(information_start_regex, header) or re.search(r'Gerichtsschreiber.*?\.', header) or re.search(
-        r'[Gg]reffi[eè]re?.*?\S{2,}?\.', header)
+    start_pos = ch_bger_information_start.search(header) or search_first(ch_bger_clerk_starts, header)
     if start_pos:
         header = header[start_pos.span()[1]:]
-    end_pos = {
-        Language.DE: re.search(r'(?<=Beschwerdegegnerin).+?', header) or re.search(r'(?<=Beschwerdegegner).+?',
-                                                                            header) or re.search(r'Gegenstand',
-                                                                                                 header) or re.search(
-            r'A\.\- ', header) or re.search(r'gegen das Urteil', header),
-        Language.FR: re.search(r'Objet', header) or re.search(r'Vu', header),
-        Language.IT: re.search(r'Oggetto', header)
-    }
-    end_pos = end_pos[namespace['language']]
+    # only search the end in the language of the decision
+    end_pos = search_first(ch_bger_end_positions[namespace['language']], header)
     if end_pos:
         header = header[:end_pos.span()[0]]
 
-    representation_start = '|'.join(representation_start)
-    for key in lawyer_representation:
-        lawyer_representation[key] = '|'.join(lawyer_representation[key])
-    for key in party_gender:
-        party_gender[key] = '|'.join(party_gender[key])
-
     def search_lawyers(text: str) -> List[LegalCounsel]:
         lawyers: List[LegalCounsel] = []
-        for (gender, current_regex) in lawyer_representation.items():
-            pos = re.search(current_regex, text)
+        for (gender, current_regex) in ch_bger_lawyer_representation.items():
+            pos = current_regex.search(text)
             if pos:
                 lawyer = LegalCounsel()
                 if not namespace['language'] == Language.IT:
                     lawyer.gender = gender
-                name_match = re.search(lawyer_name[namespace['language']], text[pos.span()[1]:])
+                name_match = lawyer_name.search(text[pos.span()[1]:])
                 if name_match and not text[pos.span()[1]] == ',':
                     lawyer.name = name_match.group()
                 else:
-                    name_match = re.search(lawyer_name[namespace['language']], text[:pos.span()[0]])
+                    name_match = lawyer_name.search(text[:pos.span()[0]])
                     lawyer.name = name_match.group() if name_match else None
                 lawyer.legal_type = LegalType.NATURAL_PERSON
                 lawyers.append(lawyer)
@@ -103,7 +115,7 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
 
     def add_representation(text: str) -> List[LegalCounsel]:
         representations = []
-        start_positions = tuple(re.finditer(representation_start, text))
+        start_positions = tuple(ch_bger_representation_start.finditer(text))
         if not start_positions:
             return []
 
@@ -119,7 +131,7 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
                 representations.extend(lawyers)
                 continue
 
-            name_match = re.search(r'[A-Z][\w\s\.\-\']*(?=,)', current_text)
+            name_match = ch_bger_representative_name.search(current_text)
             if name_match:
                 name = name_match.group()
                 if name.startswith('Me'):
@@ -129,7 +141,7 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
                 lawyer = LegalCounsel(name, legal_type=LegalType.LEGAL_ENTITY)
                 representations.append(lawyer)
                 continue
-            name_match = re.search(r'[A-Z][\w\s\.\-\']*', current_text)
+            name_match = ch_bger_representative_name_at_end.search(current_text)
             if name_match:
                 name = name_match.group()
                 lawyer = LegalCounsel(name, legal_type=LegalType.LEGAL_ENTITY)
@@ -142,21 +154,21 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
         current_person = ProceedingsParty()
         result: List[ProceedingsParty] = []
         try:
-            current_person.name = re.search(r'[A-Z1-9].*?(?=(,)|(.$)| Beschwerde)', text).group().strip()
+            current_person.name = ch_bger_party_name.search(text).group().strip()
         except AttributeError:
             return result
 
-        if re.match(r'[1-9IVX]+\.(?!_)', current_person.name):
-            people_string = re.split(r'[1-9IVX]+\. ', text)
+        if ch_bger_enumerated_party.match(current_person.name):
+            people_string = ch_bger_party_enumeration.split(text)
             for string in people_string[1:]:
                 result.extend(get_party(string))
 
             for idx in range(len(result)):
                 result[idx].gender = None
             return result
-        if re.match(r'([A-Z]\.)?[A-Z]\._$', current_person.name):
-            for gender, current_regex in party_gender.items():
-                if re.search(current_regex, text):
+        if ch_bger_anonymized_party.match(current_person.name):
+            for gender, current_regex in ch_bger_party_gender.items():
+                if current_regex.search(text):
                     if not namespace['language'] == Language.IT:
                         current_person.gender = gender
                     current_person.legal_type = LegalType.NATURAL_PERSON
@@ -169,7 +181,7 @@ def CH_BGer(header: str, namespace: dict) -> Optional[str]:
         result.append(current_person)
         return result
 
-    header_parts = re.split('|'.join(second_party_start_regex), header)
+    header_parts = ch_bger_second_party_start.split(header)
     if len(header_parts) < 2:
         raise ValueError(f"({namespace['id']}): Header malformed for: {namespace['html_url']}")
     party = ProceduralParticipation()
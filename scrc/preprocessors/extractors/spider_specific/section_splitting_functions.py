@@ -4,9 +4,12 @@ from typing import Optional, List, Dict, Union
 import bs4
 import re
 
+from scrc.data_classes.section_splitting_result import SectionSplittingResult
 from scrc.enums.language import Language
 from scrc.enums.section import Section
+from scrc.enums.section_splitting_status import SectionSplittingStatus
 from scrc.utils.main_utils import clean_text
+from scrc.utils.spider_function_registry import spider_function
 
 """
 This file is used to extract sections from decisions sorted by spiders.
@@ -14,37 +17,84 @@ The name of the functions should be equal to the spider! Otherwise, they won't b
 Overview of spiders still todo: https://docs.google.com/spreadsheets/d/1FZmeUEW8in4iDxiIgixY4g0_Bbg342w-twqtiIu8eZo/edit#gid=0
 """
 
-x = 0
 
-def XX_SPIDER(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+class SectionMarkers:
+    """
+    The section markers of one spider and language, compiled once when the module is loaded.
+    The markers of each section are combined into one compiled pattern. The patterns of the following sections
+    are searched in section order and the search stops at the first section found in the paragraph.
+    """
+
+    def __init__(self, section_markers: Dict[Section, List[str]]):
+        # combine multiple regex into one for each section due to performance reasons
+        # normalize strings to avoid problems with umlauts
+        self.markers = {section: unicodedata.normalize('NFC', '|'.join(regexes))
+                        for section, regexes in section_markers.items()}
+        self.patterns = {section: re.compile(markers) for section, markers in self.markers.items()}
+        sections = list(Section)
+        # consider all following sections
+        self.next_sections = {section: [next_section for next_section in sections[index + 1:]
+                                        if next_section in self.markers]
+                              for index, section in enumerate(sections)}
+
+    def find_next_section(self, current_section: Section, paragraph: str) -> Optional[Section]:
+        """
+        Returns the first section following the current section whose markers are found in the paragraph
+        :param current_section: the section of the previous paragraph
+        :param paragraph:       the NFC normalized paragraph
+        :return:                the next section or None if no markers of the following sections are found
+        """
+        for next_section in self.next_sections[current_section]:
+            if self.patterns[next_section].search(paragraph):
+                return next_section
+        return None
+
+    def find_next_section_sequentially(self, current_section: Section, paragraph: str) -> Optional[Section]:
+        """
+        Same as find_next_section but searches the uncompiled markers of the following sections.
+        This is how the sections used to be found and is only kept to benchmark and check the compiled patterns.
+        """
+        for next_section in self.next_sections[current_section]:
+            if re.search(self.markers[next_section], paragraph):
+                return next_section
+        return None
+
+
+def compile_section_markers(all_section_markers: Dict[Language, Dict[Section, List[str]]]) \
+        -> Dict[Language, SectionMarkers]:
+    return {language: SectionMarkers(section_markers) for language, section_markers in all_section_markers.items()}
+
+
+def XX_SPIDER(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
     # This is an example spider. Just copy this method and adjust the method name and the code to add your new spider.
     pass
 
-def BS_Omni(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+# (?:C|c) is much faster for case insensitivity than [Cc] or (?i)c
+bs_omni_section_markers = compile_section_markers({
+    Language.DE: {
+        Section.FACTS: [r'^Sachverhalt:?\s*$', r'^Tatsachen$'],
+        Section.CONSIDERATIONS: [r'^Begründung:\s*$',r'Erwägung(en)?:?\s*$',r'^Entscheidungsgründe$', r'[iI]n Erwägung[:,]?\s*$'],
+        Section.RULINGS: [r'Demgemäss erkennt d[\w]{2}', r'erkennt d[\w]{2} [A-Z]\w+:', r'Appellationsgericht (\w+ )?(\(\w+\) )?erkennt', r'^und erkennt:$', r'erkennt:\s*$'],
+        Section.FOOTER: [r'^Rechtsmittelbelehrung$',
+                         r'AUFSICHTSKOMMISSION', r'APPELLATIONSGERICHT']
+    }
+})
+
+
+@spider_function(languages=bs_omni_section_markers.keys())
+def BS_Omni(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    # (?:C|c) is much faster for case insensitivity than [Cc] or (?i)c
-    all_section_markers = {
-        Language.DE: {
-            Section.FACTS: [r'^Sachverhalt:?\s*$', r'^Tatsachen$'],
-            Section.CONSIDERATIONS: [r'^Begründung:\s*$',r'Erwägung(en)?:?\s*$',r'^Entscheidungsgründe$', r'[iI]n Erwägung[:,]?\s*$'],
-            Section.RULINGS: [r'Demgemäss erkennt d[\w]{2}', r'erkennt d[\w]{2} [A-Z]\w+:', r'Appellationsgericht (\w+ )?(\(\w+\) )?erkennt', r'^und erkennt:$', r'erkennt:\s*$'],
-            Section.FOOTER: [r'^Rechtsmittelbelehrung$',
-                             r'AUFSICHTSKOMMISSION', r'APPELLATIONSGERICHT']
-        }
-    }
-    valid_namespace(namespace, all_section_markers)
-
-    section_markers = prepare_section_markers(all_section_markers, namespace)
+    section_markers = prepare_section_markers(bs_omni_section_markers, namespace)
 
     divs = decision.find_all(
         "div", class_=['WordSection1', 'Section1', 'WordSection2'])
@@ -52,55 +102,54 @@ def BS_Omni(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optiona
     return associate_sections(paragraphs, section_markers, namespace)
 
 
-def CH_BGer(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+# (?:C|c) is much faster for case insensitivity than [Cc] or (?i)c
+ch_bger_section_markers = compile_section_markers({
+    Language.DE: {
+        # "header" has no markers!
+        # at some later point we can still divide rubrum into more fine-grained sections like title, judges, parties, topic
+        # "title": ['Urteil vom', 'Beschluss vom', 'Entscheid vom'],
+        # "judges": ['Besetzung', 'Es wirken mit', 'Bundesrichter'],
+        # "parties": ['Parteien', 'Verfahrensbeteiligte', 'In Sachen'],
+        # "topic": ['Gegenstand', 'betreffend'],
+        Section.FACTS: [r'Sachverhalt:', r'hat sich ergeben', r'Nach Einsicht', r'A\.-'],
+        Section.CONSIDERATIONS: [r'Erwägung:', r'[Ii]n Erwägung', r'Erwägungen:'],
+        Section.RULINGS: [r'erkennt d[\w]{2} Präsident', r'Demnach (erkennt|beschliesst)', r'beschliesst.*:\s*$',
+                          r'verfügt(\s[\wäöü]*){0,3}:\s*$', r'erk[ae]nnt(\s[\wäöü]*){0,3}:\s*$',
+                          r'Demnach verfügt[^e]'],
+        Section.FOOTER: [
+            r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
+            r'Im Namen des']
+    },
+    Language.FR: {
+        Section.FACTS: [r'Faits\s?:', r'en fait et en droit', r'(?:V|v)u\s?:', r'A.-'],
+        Section.CONSIDERATIONS: [r'Considérant en (?:fait et en )?droit\s?:', r'(?:C|c)onsidérant(s?)\s?:',
+                                 r'considère'],
+        Section.RULINGS: [r'prononce\s?:', r'Par ces? motifs?\s?', r'ordonne\s?:'],
+        Section.FOOTER: [
+            r'\w*,\s(le\s?)?((\d?\d)|\d\s?(er|re|e)|premier|première|deuxième|troisième)\s?(?:janv|févr|mars|avr|mai|juin|juill|août|sept|oct|nov|déc).{0,10}\d?\d?\d\d\s?(.{0,5}[A-Z]{3}|(?!.{2})|[\.])',
+            r'Au nom de la Cour'
+        ]
+    },
+    Language.IT: {
+        Section.FACTS: [r'(F|f)att(i|o)\s?:'],
+        Section.CONSIDERATIONS: [r'(C|c)onsiderando', r'(D|d)iritto\s?:', r'Visto:', r'Considerato'],
+        Section.RULINGS: [r'(P|p)er questi motivi'],
+        Section.FOOTER: [
+            r'\w*,\s(il\s?)?((\d?\d)|\d\s?(°))\s?(?:gen(?:naio)?|feb(?:braio)?|mar(?:zo)?|apr(?:ile)?|mag(?:gio)|giu(?:gno)?|lug(?:lio)?|ago(?:sto)?|set(?:tembre)?|ott(?:obre)?|nov(?:embre)?|dic(?:embre)?)\s?\d?\d?\d\d\s?([A-Za-z\/]{0,7}):?\s*$'
+        ]
+    }
+})
+
+
+@spider_function(languages=ch_bger_section_markers.keys())
+def CH_BGer(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    # (?:C|c) is much faster for case insensitivity than [Cc] or (?i)c
-    all_section_markers = {
-        Language.DE: {
-            # "header" has no markers!
-            # at some later point we can still divide rubrum into more fine-grained sections like title, judges, parties, topic
-            # "title": ['Urteil vom', 'Beschluss vom', 'Entscheid vom'],
-            # "judges": ['Besetzung', 'Es wirken mit', 'Bundesrichter'],
-            # "parties": ['Parteien', 'Verfahrensbeteiligte', 'In Sachen'],
-            # "topic": ['Gegenstand', 'betreffend'],
-            Section.FACTS: [r'Sachverhalt:', r'hat sich ergeben', r'Nach Einsicht', r'A\.-'],
-            Section.CONSIDERATIONS: [r'Erwägung:', r'[Ii]n Erwägung', r'Erwägungen:'],
-            Section.RULINGS: [r'erkennt d[\w]{2} Präsident', r'Demnach (erkennt|beschliesst)', r'beschliesst.*:\s*$',
-                              r'verfügt(\s[\wäöü]*){0,3}:\s*$', r'erk[ae]nnt(\s[\wäöü]*){0,3}:\s*$',
-                              r'Demnach verfügt[^e]'],
-            Section.FOOTER: [
-                r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
-                r'Im Namen des']
-        },
-        Language.FR: {
-            Section.FACTS: [r'Faits\s?:', r'en fait et en droit', r'(?:V|v)u\s?:', r'A.-'],
-            Section.CONSIDERATIONS: [r'Considérant en (?:fait et en )?droit\s?:', r'(?:C|c)onsidérant(s?)\s?:',
-                                     r'considère'],
-            Section.RULINGS: [r'prononce\s?:', r'Par ces? motifs?\s?', r'ordonne\s?:'],
-            Section.FOOTER: [
-                r'\w*,\s(le\s?)?((\d?\d)|\d\s?(er|re|e)|premier|première|deuxième|troisième)\s?(?:janv|févr|mars|avr|mai|juin|juill|août|sept|oct|nov|déc).{0,10}\d?\d?\d\d\s?(.{0,5}[A-Z]{3}|(?!.{2})|[\.])',
-                r'Au nom de la Cour'
-            ]
-        },
-        Language.IT: {
-            Section.FACTS: [r'(F|f)att(i|o)\s?:'],
-            Section.CONSIDERATIONS: [r'(C|c)onsiderando', r'(D|d)iritto\s?:', r'Visto:', r'Considerato'],
-            Section.RULINGS: [r'(P|p)er questi motivi'],
-            Section.FOOTER: [
-                r'\w*,\s(il\s?)?((\d?\d)|\d\s?(°))\s?(?:gen(?:naio)?|feb(?:braio)?|mar(?:zo)?|apr(?:ile)?|mag(?:gio)|giu(?:gno)?|lug(?:lio)?|ago(?:sto)?|set(?:tembre)?|ott(?:obre)?|nov(?:embre)?|dic(?:embre)?)\s?\d?\d?\d\d\s?([A-Za-z\/]{0,7}):?\s*$'
-            ]
-        }
-    }
-
-    valid_namespace(namespace, all_section_markers)
-
-    section_markers = prepare_section_markers(all_section_markers, namespace)
+    section_markers = prepare_section_markers(ch_bger_section_markers, namespace)
 
     divs = decision.find_all("div", class_="content")
     # we expect maximally two divs with class content
@@ -143,54 +192,34 @@ def valid_namespace(namespace: dict, all_section_markers):
         message = f"This function is only implemented for the languages {list(all_section_markers.keys())} so far."
         raise ValueError(message)   
 
-def prepare_section_markers(all_section_markers, namespace: dict) -> Dict[Section, str]: 
-    section_markers = all_section_markers[namespace['language']]
-    section_markers = dict(
-        map(lambda kv: (kv[0], '|'.join(kv[1])), section_markers.items()))
-    for section, regexes in section_markers.items():
-        section_markers[section] = unicodedata.normalize('NFC', regexes)
-    return section_markers
+def prepare_section_markers(all_section_markers: Dict[Language, SectionMarkers], namespace: dict) -> SectionMarkers:
+    valid_namespace(namespace, all_section_markers)
+    return all_section_markers[namespace['language']]
 
-def associate_sections(paragraphs: List[str], section_markers, namespace: dict):
+def associate_sections(paragraphs: List[str], section_markers, namespace: dict) -> SectionSplittingResult:
     paragraphs_by_section = {section: [] for section in Section}
     current_section = Section.HEADER
-    for paragraph in paragraphs:
+    section_start = 0  # the index of the paragraph where the current section started
+    for index, paragraph in enumerate(paragraphs):
         # update the current section if it changed
-        current_section = update_section(current_section, paragraph, section_markers)
+        # if we don't normalize, we get weird matching behaviour
+        next_section = update_section(current_section, unicodedata.normalize('NFC', paragraph), section_markers)
+        if next_section != current_section:
+            current_section, section_start = next_section, index
 
         # add paragraph to the list of paragraphs
         paragraphs_by_section[current_section].append(paragraph)
     if current_section != Section.FOOTER:
-        # count how many times the footer wasn't reached
-        global x
-        x += 1
-        print(x)
-        # change the message depending on whether there's a url
-        if namespace['html_url']:
-            message = f"({namespace['id']}): We got stuck at section {current_section}. Please check! " \
-                  f"Here you have the url to the decision: {namespace['html_url']}"
-        elif 'pdf_url' in namespace and namespace['pdf_url']:
-            message = f"({namespace['id']}): We got stuck at section {current_section}. Please check! " \
-                  f"Here is the url to the decision: {namespace['pdf_url']}"
-        else:
-            message = f"({namespace['id']}): We got stuck at section {current_section}. Please check! " \
-                  f"Here is the date of the decision: {namespace['date']}"
-        raise ValueError(message)
-    return paragraphs_by_section
-
-def update_section(current_section: Section, paragraph: str, section_markers) -> Section:
+        # return the partial sections, so that the caller can record where we got stuck
+        return SectionSplittingResult(paragraphs_by_section, SectionSplittingStatus.STUCK,
+                                      stuck_section=current_section, stuck_paragraph_index=section_start)
+    return SectionSplittingResult(paragraphs_by_section)
+
+def update_section(current_section: Section, paragraph: str, section_markers: SectionMarkers) -> Section:
     if current_section == Section.FOOTER:
         return current_section  # we made it to the end, hooray!
-    sections = list(Section)
-    next_section_index = sections.index(current_section) + 1
-    # consider all following sections
-    next_sections = sections[next_section_index:]
-    for next_section in next_sections:
-        marker = section_markers[next_section]
-        paragraph = unicodedata.normalize('NFC', paragraph)  # if we don't do this, we get weird matching behaviour
-        if re.search(marker, paragraph):
-            return next_section  # change to the next section
-    return current_section  # stay at the old section
+    # change to the next section or stay at the old section
+    return section_markers.find_next_section(current_section, paragraph) or current_section
 
 # This needs special care
 # def CH_BGE(decision: Any, namespace: dict) -> Optional[dict]:
@@ -201,36 +230,26 @@ def update_section(current_section: Section, paragraph: str, section_markers) ->
 
 
 
-def ZG_Verwaltungsgericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+zg_verwaltungsgericht_section_markers = compile_section_markers({
+    Language.DE: {
+        # "header" has no markers!
+        Section.FACTS: [r'wird Folgendes festgestellt:', r'wird nach Einsicht in', r'^A\.\s'],
+        Section.CONSIDERATIONS: [r'(Der|Die|Das) \w+ erwägt:', r'und in Erwägung, dass'],
+        Section.RULINGS: [r'Demnach erkennt', r'Folgendes verfügt', r'(Der|Die|Das) \w+ verfügt:', r'Demnach wird verfügt:'],
+        Section.FOOTER: [r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}']
+    }
+})
+
+
+@spider_function(languages=zg_verwaltungsgericht_section_markers.keys())
+def ZG_Verwaltungsgericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    all_section_markers = {
-        Language.DE: {
-            # "header" has no markers!
-            Section.FACTS: [r'wird Folgendes festgestellt:', r'wird nach Einsicht in', r'^A\.\s'],
-            Section.CONSIDERATIONS: [r'(Der|Die|Das) \w+ erwägt:', r'und in Erwägung, dass'],
-            Section.RULINGS: [r'Demnach erkennt', r'Folgendes verfügt', r'(Der|Die|Das) \w+ verfügt:', r'Demnach wird verfügt:'],
-            Section.FOOTER: [r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}']
-        }
-    }
-
-    if namespace['language'] not in all_section_markers:
-        message = f"This function is only implemented for the languages {list(all_section_markers.keys())} so far."
-        raise ValueError(message)
-
-    section_markers = all_section_markers[namespace['language']]
-
-    # combine multiple regex into one for each section due to performance reasons
-    section_markers = dict(map(lambda kv: (kv[0], '|'.join(kv[1])), section_markers.items()))
-
-    # normalize strings to avoid problems with umlauts
-    for section, regexes in section_markers.items():
-        section_markers[section] = unicodedata.normalize('NFC', regexes)
-        # section_markers[key] = clean_text(regexes) # maybe this would solve some problems because of more cleaning
+    section_markers = prepare_section_markers(zg_verwaltungsgericht_section_markers, namespace)
 
     def get_paragraphs(soup):
         """
@@ -254,37 +273,27 @@ def ZG_Verwaltungsgericht(decision: Union[bs4.BeautifulSoup, str], namespace: di
     return associate_sections(paragraphs, section_markers, namespace)
 
 
-def ZH_Baurekurs(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+zh_baurekurs_section_markers = compile_section_markers({
+    Language.DE: {
+        # "header" has no markers!
+        Section.FACTS: [r'hat sich ergeben', r'Gegenstand des Rekursverfahrens'],
+        Section.CONSIDERATIONS: [r'Es kommt in Betracht', r'Aus den Erwägungen'],
+        Section.RULINGS: [r'Zusammengefasst (ist|sind)', r'Zusammenfassend ist festzuhalten', r'Zusammengefasst ergibt sich', r'Der Rekurs ist nach', r'Gesamthaft ist der Rekurs'],
+        # this court has few if any footers
+        Section.FOOTER: [r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}']
+    },
+})
+
+
+@spider_function(languages=zh_baurekurs_section_markers.keys())
+def ZH_Baurekurs(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    all_section_markers = {
-        Language.DE: {
-            # "header" has no markers!
-            Section.FACTS: [r'hat sich ergeben', r'Gegenstand des Rekursverfahrens'],
-            Section.CONSIDERATIONS: [r'Es kommt in Betracht', r'Aus den Erwägungen'],
-            Section.RULINGS: [r'Zusammengefasst (ist|sind)', r'Zusammenfassend ist festzuhalten', r'Zusammengefasst ergibt sich', r'Der Rekurs ist nach', r'Gesamthaft ist der Rekurs'],
-            # this court has few if any footers
-            Section.FOOTER: [r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}']
-        },
-    }
-
-    if namespace['language'] not in all_section_markers:
-        message = f"This function is only implemented for the languages {list(all_section_markers.keys())} so far."
-        raise ValueError(message)
-
-    section_markers = all_section_markers[namespace['language']]
-    
-    # combine multiple regex into one for each section due to performance reasons
-    section_markers = dict(map(lambda kv: (kv[0], '|'.join(kv[1])), section_markers.items()))
-
-    # normalize strings to avoid problems with umlauts
-    for section, regexes in section_markers.items():
-        section_markers[section] = unicodedata.normalize('NFC', regexes)
-        # section_markers[key] = clean_text(regexes) # maybe this would solve some problems because of more cleaning
+    section_markers = prepare_section_markers(zh_baurekurs_section_markers, namespace)
 
     def get_paragraphs(soup):
         """
@@ -310,37 +319,28 @@ def ZH_Baurekurs(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Op
 
 
 
-def ZH_Obergericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+zh_obergericht_section_markers = compile_section_markers({
+    Language.DE: {
+        # "header" has no markers!
+        Section.FACTS: [r'betreffend'],
+        Section.CONSIDERATIONS: [r'Erwägungen:', r'Das Gericht erwägt'],
+        Section.RULINGS: [r'Es wird (erkannt|beschlossen|verfügt):', r'Das Gericht beschliesst:', r'(Sodann|Demnach) beschliesst das Gericht:'],
+        Section.FOOTER: [
+            r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
+            r'Obergericht des Kantons Zürich', r'OBERGERICHT DES KANTONS ZÜRICH']
+    }
+})
+
+
+@spider_function(languages=zh_obergericht_section_markers.keys())
+def ZH_Obergericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    all_section_markers = {
-        Language.DE: {
-            # "header" has no markers!
-            Section.FACTS: [r'betreffend'],
-            Section.CONSIDERATIONS: [r'Erwägungen:', r'Das Gericht erwägt'],
-            Section.RULINGS: [r'Es wird (erkannt|beschlossen|verfügt):', r'Das Gericht beschliesst:', r'(Sodann|Demnach) beschliesst das Gericht:'],
-            Section.FOOTER: [
-                r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
-                r'Obergericht des Kantons Zürich', r'OBERGERICHT DES KANTONS ZÜRICH']
-        }
-    }
-
-    if namespace['language'] not in all_section_markers:
-        message = f"This function is only implemented for the languages {list(all_section_markers.keys())} so far."
-        raise ValueError(message)
-
-    section_markers = all_section_markers[namespace['language']]
-    # combine multiple regex into one for each section due to performance reasons
-    section_markers = dict(map(lambda kv: (kv[0], '|'.join(kv[1])), section_markers.items()))
-
-    # normalize strings to avoid problems with umlauts
-    for section, regexes in section_markers.items():
-        section_markers[section] = unicodedata.normalize('NFC', regexes)
-        # section_markers[key] = clean_text(regexes) # maybe this would solve some problems because of more cleaning
+    section_markers = prepare_section_markers(zh_obergericht_section_markers, namespace)
 
     def get_paragraphs(soup):
         """
@@ -364,37 +364,27 @@ def ZH_Obergericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) ->
     return associate_sections(paragraphs, section_markers, namespace)
 
 
-def ZH_Sozialversicherungsgericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+zh_sozialversicherungsgericht_section_markers = compile_section_markers({
+    Language.DE: {
+        # "header" has no markers!
+        Section.FACTS: [r'Sachverhalt:'],
+        Section.CONSIDERATIONS: [r'in Erwägung, dass', r'zieht in Erwägung:', r'Erwägungen:'],
+        Section.RULINGS: [r'Das Gericht (erkennt|beschliesst):', r'(Der|Die) Einzelrichter(in)? (erkennt|beschliesst):', r'erkennt das Gericht:', r'und erkennt sodann:'],
+        # this court doesn't always have a footer
+        Section.FOOTER: [r'Sozialversicherungsgericht des Kantons Zürich']
+    }
+})
+
+
+@spider_function(languages=zh_sozialversicherungsgericht_section_markers.keys())
+def ZH_Sozialversicherungsgericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    all_section_markers = {
-        Language.DE: {
-            # "header" has no markers!
-            Section.FACTS: [r'Sachverhalt:'],
-            Section.CONSIDERATIONS: [r'in Erwägung, dass', r'zieht in Erwägung:', r'Erwägungen:'],
-            Section.RULINGS: [r'Das Gericht (erkennt|beschliesst):', r'(Der|Die) Einzelrichter(in)? (erkennt|beschliesst):', r'erkennt das Gericht:', r'und erkennt sodann:'],
-            # this court doesn't always have a footer
-            Section.FOOTER: [r'Sozialversicherungsgericht des Kantons Zürich']
-        }
-    }
-
-    if namespace['language'] not in all_section_markers:
-        message = f"This function is only implemented for the languages {list(all_section_markers.keys())} so far."
-        raise ValueError(message)
-
-    section_markers = all_section_markers[namespace['language']]
-
-    # combine multiple regex into one for each section due to performance reasons
-    section_markers = dict(map(lambda kv: (kv[0], '|'.join(kv[1])), section_markers.items()))
-
-    # normalize strings to avoid problems with umlauts
-    for section, regexes in section_markers.items():
-        section_markers[section] = unicodedata.normalize('NFC', regexes)
-        # section_markers[key] = clean_text(regexes) # maybe this would solve some problems because of more cleaning
+    section_markers = prepare_section_markers(zh_sozialversicherungsgericht_section_markers, namespace)
 
     def get_paragraphs(soup):
         """
@@ -437,38 +427,29 @@ def ZH_Sozialversicherungsgericht(decision: Union[bs4.BeautifulSoup, str], names
 
 
 
-def ZH_Steuerrekurs(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+zh_steuerrekurs_section_markers = compile_section_markers({
+    Language.DE: {
+        # "header" has no markers!
+        Section.FACTS: [r'hat sich ergeben:'],
+        Section.CONSIDERATIONS: [r'zieht in Erwägung:', r'sowie in der Erwägung'],
+        Section.RULINGS: [r'Demgemäss (erkennt|beschliesst)', r'beschliesst die Rekurskommission'],
+        # often there is no footer
+        Section.FOOTER: [
+            r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
+            r'Im Namen des']
+    }
+})
+
+
+@spider_function(languages=zh_steuerrekurs_section_markers.keys())
+def ZH_Steuerrekurs(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    all_section_markers = {
-        Language.DE: {
-            # "header" has no markers!
-            Section.FACTS: [r'hat sich ergeben:'],
-            Section.CONSIDERATIONS: [r'zieht in Erwägung:', r'sowie in der Erwägung'],
-            Section.RULINGS: [r'Demgemäss (erkennt|beschliesst)', r'beschliesst die Rekurskommission'],
-            # often there is no footer
-            Section.FOOTER: [
-                r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
-                r'Im Namen des']
-        }
-    }
-
-    if namespace['language'] not in all_section_markers:
-        message = f"This function is only implemented for the languages {list(all_section_markers.keys())} so far."
-        raise ValueError(message)
-
-    section_markers = all_section_markers[namespace['language']]
-    # combine multiple regex into one for each section due to performance reasons
-    section_markers = dict(map(lambda kv: (kv[0], '|'.join(kv[1])), section_markers.items()))
-
-    # normalize strings to avoid problems with umlauts
-    for section, regexes in section_markers.items():
-        section_markers[section] = unicodedata.normalize('NFC', regexes)
-        # section_markers[key] = clean_text(regexes) # maybe this would solve some problems because of more cleaning
+    section_markers = prepare_section_markers(zh_steuerrekurs_section_markers, namespace)
 
     def get_paragraphs(soup):
         """
@@ -494,39 +475,29 @@ def ZH_Steuerrekurs(decision: Union[bs4.BeautifulSoup, str], namespace: dict) ->
 
 
 
-def ZH_Verwaltungsgericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[Dict[Section, List[str]]]:
+# As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
+zh_verwaltungsgericht_section_markers = compile_section_markers({
+    Language.DE: {
+        # "header" has no markers!
+        Section.FACTS: [r'hat sich ergeben:', r'^\s*I\.\s+A\.\s*', r'^\s*I\.\s+$'],
+        Section.CONSIDERATIONS: [r'erwägt:', r'zieht in Erwägung:'],
+        Section.RULINGS: [r'Demgemäss (erkennt|beschliesst|entscheidet)'],
+        # this court generally has no footer
+        Section.FOOTER: [
+            r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
+            r'Im Namen des']
+    }
+})
+
+
+@spider_function(languages=zh_verwaltungsgericht_section_markers.keys())
+def ZH_Verwaltungsgericht(decision: Union[bs4.BeautifulSoup, str], namespace: dict) -> Optional[SectionSplittingResult]:
     """
     :param decision:    the decision parsed by bs4 or the string extracted of the pdf
     :param namespace:   the namespace containing some metadata of the court decision
-    :return:            the sections dict (keys: section, values: list of paragraphs)
+    :return:            the sections dict (keys: section, values: list of paragraphs) with the splitting status
     """
-    # As soon as one of the strings in the list (regexes) is encountered we switch to the corresponding section (key)
-    all_section_markers = {
-        Language.DE: {
-            # "header" has no markers!
-            Section.FACTS: [r'hat sich ergeben:', r'^\s*I\.\s+A\.\s*', r'^\s*I\.\s+$'],
-            Section.CONSIDERATIONS: [r'erwägt:', r'zieht in Erwägung:'],
-            Section.RULINGS: [r'Demgemäss (erkennt|beschliesst|entscheidet)'],
-            # this court generally has no footer
-            Section.FOOTER: [
-                r'^[\-\s\w\(]*,( den| vom)?\s\d?\d\.?\s?(?:Jan(?:uar)?|Feb(?:ruar)?|Mär(?:z)?|Apr(?:il)?|Mai|Jun(?:i)?|Jul(?:i)?|Aug(?:ust)?|Sep(?:tember)?|Okt(?:ober)?|Nov(?:ember)?|Dez(?:ember)?)\s\d{4}([\s]*$|.*(:|Im Namen))',
-                r'Im Namen des']
-        }
-    }
-
-    if namespace['language'] not in all_section_markers:
-        message = f"This function is only implemented for the languages {list(all_section_markers.keys())} so far."
-        raise ValueError(message)
-
-    section_markers = all_section_markers[namespace['language']]
-
-    # combine multiple regex into one for each section due to performance reasons
-    section_markers = dict(map(lambda kv: (kv[0], '|'.join(kv[1])), section_markers.items()))
-
-    # normalize strings to avoid problems with umlauts
-    for section, regexes in section_markers.items():
-        section_markers[section] = unicodedata.normalize('NFC', regexes)
-        # section_markers[key] = clean_text(regexes) # maybe this would solve some problems because of more cleaning
+    section_markers = prepare_section_markers(zh_verwaltungsgericht_section_markers, namespace)
 
     def get_paragraphs(soup):
         """
@@ -4,6 +4,7 @@ import os, psutil
 
 import spacy
 import configparser
+from scrc.enums.section import Section
 from scrc.preprocessors.abstract_preprocessor import AbstractPreprocessor
 from root import ROOT_DIR
 from scrc.utils.log_utils import get_logger
@@ -31,9 +32,13 @@ class NlpPipelineRunner(AbstractPreprocessor):
     and can then use the spacy objects directly in our analysis.
 
     Here is a very good resource to reduce memory consumption: https://pythonspeed.com/memory/
+
+    With count_tokens_only set, no spacy docs are created. Only the tokenizers run and the token counts of the text
+    and of the facts, considerations and rulings are saved, so that they do not need to be recomputed later
+    (e.g. by the reports of the dataset creators).
     """
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, count_tokens_only: bool = False):
         super().__init__(config)
         self.logger = get_logger(__name__)
 
@@ -44,14 +49,24 @@ class NlpPipelineRunner(AbstractPreprocessor):
         }
         # tag, pos and lemma are enough for now
         self.disable_pipes = ['senter', 'ner', 'attribute_ruler', 'textcat']
-        self.active_spacy_model = None
-        self.active_bert_tokenizer = None
 
-    @staticmethod
-    def load_spacy_model(model_name, disable_pipes):
-        return spacy.load(model_name, disable=disable_pipes)
+        self.count_tokens_only = count_tokens_only
+        self.count_cols = ['text', Section.FACTS.value, Section.CONSIDERATIONS.value, Section.RULINGS.value]
+
+    def get_spacy_model(self, lang, lang_dir):
+        """
+        Returns the spacy model of the language with the vocab of the lang_dir.
+        It is fetched from the model registry for every use and not kept, so that the registry can free it.
+        """
+        nlp = self.model_registry.get_spacy_model(self.models[lang], self.disable_pipes, vocab_dir=lang_dir)
+        # increase max length for long texts: Can lead to memory allocation errors for parser and ner
+        nlp.max_length = 3000000
+        return nlp
 
     def run_pipeline(self):
+        if self.count_tokens_only:
+            self.run_token_counting()
+            return
         self.logger.info("Started running spacy pipeline on the texts")
 
         for lang in self.languages:
@@ -61,9 +76,10 @@ class NlpPipelineRunner(AbstractPreprocessor):
             processed_file_path = self.progress_dir / f"{lang}_spiders_spacied.txt"
             spider_list, message = self.compute_remaining_spiders(processed_file_path)
             self.logger.info(message)
-
-            if spider_list:
-                self.load_language_models(lang, lang_dir)
+            # the token counts of the spiders already processed by the token counting do not need to be saved again
+            token_counted_file_path = self.get_token_counted_file_path(lang)
+            token_counted_spiders = set(token_counted_file_path.read_text().split("\n")) \
+                if token_counted_file_path.exists() else set()
 
             engine = self.get_engine(self.db_scrc)
             # add new columns for num_tokens
@@ -74,31 +90,68 @@ class NlpPipelineRunner(AbstractPreprocessor):
                 # according to docs you should aim for a partition size of 100MB
                 # 1 court decision takes approximately between around 10KB and 100KB of RAM when loaded into memory
                 # The spacy doc takes about 25x the size of a court decision
-                self.run_nlp_pipeline(engine, spider, lang, lang_dir)
+                self.run_nlp_pipeline(engine, spider, lang, lang_dir, count_tokens=spider not in token_counted_spiders)
                 self.mark_as_processed(processed_file_path, spider)
 
             self.logger.info(f"Finished processing language {lang}")
 
         self.logger.info("Finished running spacy pipeline on the texts")
 
-    def load_language_models(self, lang, lang_dir):
-        self.logger.info("Loading spacy model")
-        self.active_spacy_model = self.load_spacy_model(self.models[lang], self.disable_pipes)
-        # increase max length for long texts: Can lead to memory allocation errors for parser and ner
-        self.active_spacy_model.max_length = 3000000
-        self.active_spacy_model.vocab = self.load_vocab(lang_dir)
+    def run_token_counting(self):
+        self.logger.info("Started counting the tokens of the texts")
 
-        # calculate both the num_tokens for regular words and subwords
-        spacy_tokenizer, self.active_bert_tokenizer = self.get_tokenizers(lang)
+        engine = self.get_engine(self.db_scrc)
+        for lang in self.languages:
+            self.logger.info(f"Started processing language {lang}")
+            processed_file_path = self.get_token_counted_file_path(lang)
+            spider_list, message = self.compute_remaining_spiders(processed_file_path)
+            self.logger.info(message)
+
+            for col in self.count_cols:
+                for num_tokens_col in self.get_num_tokens_columns(col):
+                    self.add_column(engine, lang, col_name=num_tokens_col, data_type='bigint')
+
+            for spider in spider_list:
+                self.count_tokens_of_spider(engine, spider, lang)
+                self.mark_as_processed(processed_file_path, spider)
+
+            self.logger.info(f"Finished processing language {lang}")
+
+        self.close_token_counting_pool()
+        self.logger.info("Finished counting the tokens of the texts")
+
+    def get_token_counted_file_path(self, lang):
+        """Returns the progress file of the spiders whose tokens have been counted by the token counting"""
+        return self.progress_dir / f"{lang}_spiders_token_counted.txt"
+
+    def count_tokens_of_spider(self, engine, spider, lang):
+        """Saves the spacy and bert token counts of the text and the sections of all decisions of a spider"""
+        self.logger.info(f"Processing spider {spider}")
+        dfs = self.select(engine, lang, columns=", ".join(['id'] + self.count_cols), where=f"spider='{spider}'")
+        for df in dfs:
+            columns = []
+            for col in self.count_cols:
+                spacy_col, bert_col = self.get_num_tokens_columns(col)
+                present = df[col].notna() & (df[col] != '')
+                num_tokens_spacy, num_tokens_bert = self.count_tokens(df.loc[present, col].tolist(), lang)
+                df[spacy_col], df[bert_col] = None, None  # sections which could not be split get no count
+                df.loc[present, spacy_col] = num_tokens_spacy
+                df.loc[present, bert_col] = num_tokens_bert
+                columns += [spacy_col, bert_col]
+            self.update(engine, df, lang, columns, self.output_dir)
 
     @profile
-    def run_nlp_pipeline(self, engine, spider, lang, lang_dir):
+    def run_nlp_pipeline(self, engine, spider, lang, lang_dir, count_tokens=True):
         """
         Creates and saves the docs generated by the spacy pipeline.
+        The token counts are only saved if count_tokens is set (they may have been counted by the token counting).
         """
         self.logger.info(f"Processing spider {spider}")
 
-        self.run_nlp_pipe(engine, lang, lang_dir, f"spider='{spider}'", self.active_spacy_model, self.active_bert_tokenizer, self.logger)
+        # calculate both the num_tokens for regular words and subwords
+        bert_tokenizer = self.get_tokenizers(lang)[1] if count_tokens else None
+        self.run_nlp_pipe(engine, lang, lang_dir, f"spider='{spider}'", self.get_spacy_model(lang, lang_dir),
+                          bert_tokenizer, self.logger, count_tokens=count_tokens)
 
         memory_usage = psutil.Process(os.getpid()).memory_info().rss / 1024 ** 3
         message = f"Your running process is currently using {memory_usage:.3f} GB of memory"
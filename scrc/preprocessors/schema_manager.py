@@ -0,0 +1,167 @@
+from __future__ import annotations
+import re
+from typing import List, Optional, TYPE_CHECKING
+
+from scrc.preprocessors.abstract_preprocessor import AbstractPreprocessor
+from scrc.utils.log_utils import get_logger
+from scrc.utils.main_utils import get_config
+from scrc.utils.storage_layout import StorageLayout
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+
+
+class StageIndex:
+    """An index matching the selection of a pipeline stage (only created once all its columns exist)"""
+
+    def __init__(self, name: str, definition: str, columns: List[str], where: Optional[str] = None):
+        self.name = name
+        self.definition = definition  # the indexed columns (with operator classes)
+        self.columns = columns  # the columns which need to exist (all in the same table, the id is in every table)
+        self.where = where  # the condition of a partial index
+
+    def get_create_statement(self, table: str) -> str:
+        statement = f"CREATE INDEX IF NOT EXISTS {table}_{self.name} ON {table} ({self.definition})"
+        if self.where:
+            statement += f" WHERE {self.where}"
+        return statement
+
+
+stage_indexes = [
+    # the header extractors: spider='X' AND header IS NOT NULL AND header <> ''
+    # (the spider is given by the partition and is not in the side table of the sections)
+    StageIndex('with_header', 'id', ['header'], "header IS NOT NULL AND header <> ''"),
+    # the judgment extractor: spider='X' AND rulings IS NOT NULL AND rulings <> ''
+    StageIndex('with_rulings', 'id', ['rulings'], "rulings IS NOT NULL AND rulings <> ''"),
+    # the citation dataset creator: citations IS NOT NULL
+    StageIndex('with_citations', 'id', ['citations'], "citations IS NOT NULL"),
+    # selecting the decisions of a court ordered by date (or year)
+    StageIndex('court_date', 'court, date', ['court', 'date']),
+    # the prefix queries of the count computer (chamber LIKE 'X_%', court LIKE 'X_%')
+    StageIndex('chamber_pattern', 'chamber text_pattern_ops', ['chamber']),
+    StageIndex('court_pattern', 'court text_pattern_ops', ['court']),
+]
+
+
+class SchemaManager(AbstractPreprocessor):
+    """
+    Manages the schema of the language tables:
+    they are list partitioned by spider, so that selecting a spider only reads the partition of the spider,
+    the raw documents and the extracted columns are separated from the metadata (see StorageLayout)
+    and they get the indexes matching the selections of the pipeline stages.
+    All steps are idempotent and can be run again after adding spiders or columns.
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.logger = get_logger(__name__)
+        # if set, the language tables are separated into a metadata table, a raw table and side tables per stage
+        self.separate_storage = True
+
+    def start(self):
+        engine = self.get_engine(self.db_scrc)
+        if not self._check_write_privilege(engine):
+            self.logger.warning("Cannot change the schema without write privilege")
+            return
+        for lang in self.languages:
+            self.partition_table(engine, lang)
+            if self.separate_storage:
+                StorageLayout(engine, lang).separate()
+            self.create_indexes(engine, lang)
+
+    @staticmethod
+    def get_partition_name(lang: str, spider: Optional[str] = None) -> str:
+        suffix = re.sub(r'\W', '_', spider.lower()) if spider else 'default'
+        return f"{lang}_spider_{suffix}"
+
+    @staticmethod
+    def is_partitioned(engine: Engine, table: str) -> bool:
+        query = f"SELECT count(*) FROM pg_partitioned_table WHERE partrelid = '{table}'::regclass"
+        return AbstractPreprocessor.query(engine, query)['count'][0] > 0
+
+    def get_spiders(self, engine: Engine, table: str) -> List[str]:
+        query = f"SELECT DISTINCT spider FROM {table} WHERE spider IS NOT NULL"
+        return sorted(self.query(engine, query)['spider'])
+
+    def partition_table(self, engine: Engine, lang: str):
+        """
+        Partitions the language table (the metadata table if it is separated) by spider. If it is partitioned already,
+        the decisions of new spiders (which were inserted into the default partition) get their own partitions.
+        """
+        layout = StorageLayout(engine, lang)
+        table = layout.base_table if layout.is_separated() else lang
+        if self.is_partitioned(engine, table):
+            self.move_default_rows(engine, lang, table)
+            return
+        self.logger.info(f"Partitioning table {table} by spider")
+        partitioned = f"{lang}_partitioned"
+        spiders = self.get_spiders(engine, table)
+        with engine.begin() as conn:  # everything or nothing
+            if layout.is_separated():
+                layout.drop_view(conn)  # it depends on the old table
+            conn.execute(f"CREATE TABLE {partitioned} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                         f"PARTITION BY LIST (spider)")
+            # the primary key of a partitioned table needs to contain the partition key
+            conn.execute(f"ALTER TABLE {partitioned} ADD PRIMARY KEY (id, spider)")
+            for spider in spiders:
+                conn.execute(f"CREATE TABLE {self.get_partition_name(lang, spider)} "
+                             f"PARTITION OF {partitioned} FOR VALUES IN ('{spider}')")
+            conn.execute(f"CREATE TABLE {self.get_partition_name(lang)} PARTITION OF {partitioned} DEFAULT")
+            conn.execute(f"INSERT INTO {partitioned} SELECT * FROM {table}")
+            # the id sequence would be dropped together with the old table
+            sequence = conn.execute(f"SELECT pg_get_serial_sequence('{table}', 'id')").scalar()
+            if sequence:
+                conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {partitioned}.id")
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {partitioned} RENAME TO {table}")
+            if layout.is_separated():
+                layout.create_view(conn)
+        self.logger.info(f"Finished partitioning table {table}")
+
+    def move_default_rows(self, engine: Engine, lang: str, table: str):
+        """Moves the decisions of spiders without partition from the default partition into new partitions"""
+        default = self.get_partition_name(lang)
+        spiders = self.get_spiders(engine, default)
+        if not spiders:
+            return
+        self.logger.info(f"Adding partitions to table {table} for the spiders {spiders}")
+        with engine.begin() as conn:
+            # a partition cannot be added while the default partition contains rows belonging to it
+            conn.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+            for spider in spiders:
+                conn.execute(f"CREATE TABLE {self.get_partition_name(lang, spider)} "
+                             f"PARTITION OF {table} FOR VALUES IN ('{spider}')")
+                conn.execute(f"INSERT INTO {table} SELECT * FROM {default} WHERE spider = '{spider}'")
+                conn.execute(f"DELETE FROM {default} WHERE spider = '{spider}'")
+            conn.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+
+    def create_indexes(self, engine: Engine, lang: str):
+        """
+        Creates the configured indexes and the indexes of the stages whose columns exist already
+        in the table holding the columns (the language table or, if it is separated, the table of their stage)
+        """
+        layout = StorageLayout(engine, lang)
+        with engine.connect() as conn:
+            for index in self.indexes:
+                # the indexes are created on all the partitions
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {lang}_{index} ON {layout.get_table(index)}({index})")
+            for index in stage_indexes:
+                tables = {layout.get_table(column) for column in index.columns}
+                if len(tables) > 1:
+                    self.logger.warning(f"Not creating index {index.name}: its columns are in the tables {tables}")
+                    continue
+                table = tables.pop()
+                columns = self.get_columns(engine, table)
+                if set(index.columns) <= columns:
+                    self.logger.info(f"Creating index {index.name} in table {table}")
+                    conn.execute(index.get_create_statement(table))
+                else:
+                    self.logger.debug(f"Not creating index {index.name} in table {table} yet: "
+                                      f"missing the columns {set(index.columns) - columns}")
+
+
+if __name__ == '__main__':
+    config = get_config()
+
+    schema_manager = SchemaManager(config)
+    schema_manager.start()
@@ -19,6 +19,7 @@ from scrc.utils.log_utils import get_logger
 import tika
 
 from scrc.utils.main_utils import get_config
+from scrc.utils.storage_layout import StorageLayout
 
 os.environ['TIKA_LOG_PATH'] = str(AbstractPreprocessor.create_dir(Path(os.getcwd()), 'logs'))
 tika.initVM()
@@ -101,10 +102,13 @@ class TextToDatabase(AbstractPreprocessor):
 
     def create_indexes(self, lang):
         self.logger.info(f"Creating indexes for {lang}")
-        with self.get_engine(self.db_scrc).connect() as conn:
+        engine = self.get_engine(self.db_scrc)
+        layout = StorageLayout(engine, lang)
+        with engine.connect() as conn:
             for index in self.indexes:
                 self.logger.info(f"Creating index for column {index} in table {lang}")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS {lang}_{index} ON {lang}({index})")
+                # the view of a separated table cannot be indexed, the index belongs to the table of the column
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {lang}_{index} ON {layout.get_table(index)}({index})")
 
     def build_spider_dataset(self, spider: str) -> None:
         """ Builds a dataset for a spider """
@@ -119,7 +123,11 @@ class TextToDatabase(AbstractPreprocessor):
         for lang in self.languages:
             lang_df = df[df.language.str.contains(lang, na=False)]  # select only decisions by language
             if len(lang_df.index) > 0:
-                lang_df.to_sql(lang, self.get_engine(self.db_scrc), if_exists="append", index=False)
+                layout = StorageLayout(self.get_engine(self.db_scrc), lang)
+                if layout.is_separated():  # the view cannot be inserted into
+                    layout.insert(lang_df)
+                else:
+                    lang_df.to_sql(lang, self.get_engine(self.db_scrc), if_exists="append", index=False)
 
     def build_spider_dict_list(self, spider_dir: Path) -> list:
         """ Builds the spider dict list which we can convert to a pandas Data Frame later """
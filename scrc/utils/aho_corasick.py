@@ -0,0 +1,60 @@
+from collections import deque
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton to find the occurrences of many patterns in a text in a single pass over the text.
+    The automaton only consists of lists and dicts, so it can be pickled and sent to worker processes.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))  # unique, in order
+        self.goto = [dict()]  # the transitions of each state
+        self.fail = [0]  # the state to continue with if no transition matches
+        self.output = [[]]  # the indices of the patterns ending in each state
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(index)
+
+        # compute the failure links in breadth first order
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """
+        Finds all (possibly overlapping) occurrences of the patterns in the text
+        :param text:    the text to search in
+        :return:        a generator of (start offset, end offset, pattern index) tuples
+        """
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for index in self.output[state]:
+                yield position + 1 - len(self.patterns[index]), position + 1, index
+
+    def first_contained(self, text: str) -> Optional[str]:
+        """
+        Returns the first pattern (in the order they were given) contained in the text
+        and None if the text does not contain any of the patterns
+        """
+        indices = [index for _, _, index in self.find_all(text)]
+        return self.patterns[min(indices)] if indices else None
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import json
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+from scrc.utils.log_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class GenderResponse:
+    """The answer of a gender backend to one request"""
+    status_code: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    persons: List[dict] = field(default_factory=list)  # dicts with name, gender and probability
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 300
+
+
+class GenderBackend(ABC):
+    """Fetches the gender of a chunk of first names. Subclass this to use another service (e.g. a local stand-in)"""
+
+    @abstractmethod
+    def fetch(self, names: List[str], country_id: Optional[str] = None) -> GenderResponse:
+        """Returns the response for the names (in the given country if set)"""
+
+
+class GenderizeBackend(GenderBackend):
+    """The genderize.io api (or any server implementing the same interface under base_url)"""
+
+    def __init__(self, base_url: str = 'https://api.genderize.io/', api_key: str = None, timeout: float = 30.0):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def fetch(self, names: List[str], country_id: Optional[str] = None) -> GenderResponse:
+        params = [('name[]', name) for name in names]
+        if country_id:
+            params.append(('country_id', country_id))
+        if self.api_key:
+            params.append(('apikey', self.api_key))
+        response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+
+        persons = []
+        if 'application/json' in response.headers.get('content-type', ''):
+            decoded = response.json()
+            # the api returns a single object for a single name but a list for multiple names
+            persons = decoded if isinstance(decoded, list) else [decoded]
+        else:
+            logger.warning(f"Response not in JSON format (server responded with "
+                           f"{response.status_code}: {response.reason})")
+        return GenderResponse(status_code=response.status_code, headers=dict(response.headers), persons=persons)
+
+
+class StandInGenderBackend(GenderBackend):
+    """
+    In-process stand-in for the genderize.io api serving canned genders, e.g. to test the client without network.
+    Names which are not known get no gender. After rate_limit requests within reset_seconds,
+    the requests are answered with 429 and the rate limit headers until the window is reset.
+    """
+
+    def __init__(self, genders: Dict[str, Optional[str]], rate_limit: Optional[int] = None, reset_seconds: int = 1):
+        self.genders = genders
+        self.rate_limit = rate_limit
+        self.reset_seconds = reset_seconds
+        self.requests: List[tuple] = []  # (names, country_id, status code) of every request
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.lock = threading.Lock()  # the client fetches from several threads
+
+    def fetch(self, names: List[str], country_id: Optional[str] = None) -> GenderResponse:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.reset_seconds:
+                self.window_start, self.window_requests = now, 0
+            reset = max(math.ceil(self.window_start + self.reset_seconds - now), 0)
+            if self.rate_limit is not None and self.window_requests >= self.rate_limit:
+                self.requests.append((list(names), country_id, 429))
+                return GenderResponse(status_code=429, headers={'X-Rate-Limit-Remaining': '0',
+                                                                'X-Rate-Limit-Reset': str(reset)})
+            self.window_requests += 1
+            self.requests.append((list(names), country_id, 200))
+            headers = {'X-Rate-Limit-Reset': str(reset)}
+            if self.rate_limit is not None:
+                headers['X-Rate-Limit-Remaining'] = str(self.rate_limit - self.window_requests)
+        persons = [{'name': name, 'gender': self.genders.get(name),
+                    'probability': 1.0 if self.genders.get(name) else 0.0, 'count': 1 if name in self.genders else 0}
+                   for name in names]
+        return GenderResponse(status_code=200, headers=headers, persons=persons)
+
+
+class TokenBucket:
+    """
+    Async token bucket limiting the number of requests per second.
+    The rate limit headers of the responses can additionally block all requests until the limit is reset.
+    """
+
+    def __init__(self, rate: float = 1.0, capacity: int = 5):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = None  # created in the running event loop
+
+    def get_wait_time(self) -> float:
+        """Returns how many seconds all the requests are blocked by the rate limit headers"""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update_from_headers(self, headers: Dict[str, str]) -> None:
+        """Honours the rate limit headers: no more requests until the reset if nothing remains"""
+        headers = {key.lower(): value for key, value in headers.items()}
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset', headers.get('x-rate-reset'))
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+        if reset is not None and (remaining is None or int(remaining) <= 0):
+            self.block(int(reset))
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class GenderCache:
+    """Persistent cache of the resolved first names: name -> {gender, probability, fetched_at}"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, dict] = json.loads(self.path.read_text()) if self.path.exists() else dict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def get(self, name: str) -> Optional[dict]:
+        return self.entries.get(name)
+
+    def add(self, name: str, gender: Optional[str], probability: Optional[float] = None) -> None:
+        self.entries[name] = {'gender': gender, 'probability': probability,
+                              'fetched_at': datetime.datetime.now().isoformat(timespec='seconds')}
+
+    def get_names(self, gender: Optional[str]) -> List[str]:
+        return sorted(name for name, entry in self.entries.items() if entry['gender'] == gender)
+
+    def save(self) -> None:
+        # write to a temporary file first so that an interrupted run does not corrupt the cache
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        tmp_path.write_text(json.dumps(self.entries, indent=4, sort_keys=True))
+        tmp_path.replace(self.path)
+
+
+class GenderClient:
+    """
+    Resolves the gender of first names concurrently with a backend, a rate limiter and a persistent cache.
+    Only names which are not in the cache are fetched. Names without a gender in the given country
+    are fetched again without the country. Chunks hitting the rate limit are retried after the reset.
+    """
+
+    def __init__(self, cache: GenderCache, backend: GenderBackend = None, limiter: TokenBucket = None,
+                 chunk_size: int = 10, concurrency: int = 4, country_id: Optional[str] = 'CH', max_retries: int = 3,
+                 max_wait: float = 3600):
+        self.cache = cache
+        self.backend = backend or GenderizeBackend()
+        self.limiter = limiter or TokenBucket()
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.country_id = country_id
+        self.max_retries = max_retries
+        self.max_wait = max_wait  # give up on chunks instead of waiting longer than this for the rate limit reset
+
+    def resolve(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Returns the gender ('male', 'female' or None) of every name, fetching the unknown names first"""
+        names = set(names)
+        missing = sorted(name for name in names if name not in self.cache)
+        if missing:
+            logger.info(f"{len(missing)} new names to fetch ({len(names) - len(missing)} cached)")
+            asyncio.run(self.fetch_all(missing))
+            self.cache.save()
+        return {name: self.cache.get(name)['gender'] if name in self.cache else None for name in names}
+
+    async def fetch_all(self, names: List[str]) -> None:
+        self.limiter.lock = None  # the lock belongs to the event loop of the previous run
+        semaphore = asyncio.Semaphore(self.concurrency)
+        persons = await self.fetch_chunks(names, self.country_id, semaphore)
+        without_gender = [name for name in persons if not persons[name].get('gender')]
+        if self.country_id and without_gender:
+            persons_without_country = await self.fetch_chunks(without_gender, None, semaphore)
+            for name in without_gender:
+                # names which could not be fetched without the country are not cached, so they are retried next run
+                if name in persons_without_country:
+                    persons[name] = persons_without_country[name]
+                else:
+                    del persons[name]
+        for name, person in persons.items():
+            self.cache.add(name, person.get('gender'), person.get('probability'))
+
+    async def fetch_chunks(self, names: List[str], country_id: Optional[str],
+                           semaphore: asyncio.Semaphore) -> Dict[str, dict]:
+        chunks = [names[i:i + self.chunk_size] for i in range(0, len(names), self.chunk_size)]
+        results = await asyncio.gather(*[self.fetch_chunk(chunk, country_id, semaphore) for chunk in chunks])
+        return {person['name']: person for persons in results for person in persons if 'name' in person}
+
+    async def fetch_chunk(self, names: List[str], country_id: Optional[str],
+                          semaphore: asyncio.Semaphore) -> List[dict]:
+        """Returns the persons of the chunk (an empty list if it could not be fetched, so it is retried next run)"""
+        loop = asyncio.get_event_loop()
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                if self.limiter.get_wait_time() > self.max_wait:
+                    logger.warning(f"Request limit reached. Not waiting {self.limiter.get_wait_time():.0f}s "
+                                   f"for the reset, the names will be fetched in the next run")
+                    return []
+                await self.limiter.acquire()
+                logger.debug(f"Fetching next chunk of {len(names)} names")
+                try:
+                    response = await loop.run_in_executor(None, self.backend.fetch, names, country_id)
+                except requests.RequestException as e:
+                    logger.warning(f"Fetching the names failed with {e!r}")
+                    continue
+                self.limiter.update_from_headers(response.headers)
+                if response.ok:
+                    return response.persons
+                if response.status_code != 429:
+                    logger.warning(f"Fetching the names failed with status {response.status_code}")
+                    return []
+                if not any(key.lower() in ['x-rate-limit-reset', 'x-rate-reset'] for key in response.headers):
+                    self.limiter.block(60)
+                logger.warning(f"Request limit reached (attempt {attempt + 1}). Waiting until the limit is reset")
+        return []
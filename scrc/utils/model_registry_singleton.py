@@ -0,0 +1,135 @@
+import gc
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable
+
+import psutil
+import spacy
+from spacy.language import Language
+from spacy.vocab import Vocab
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
+
+from root import ROOT_DIR
+from scrc.utils.log_utils import get_logger
+
+
+class ModelRegistrySingleton:
+    """
+    Process-wide cache for the spacy models and tokenizers.
+    Models are loaded lazily on first use and evicted in least recently used order
+    as soon as the estimated memory of all loaded models exceeds max_memory_gb.
+    The size of a model is estimated once by the growth of the memory while loading it.
+    An evicted model is only freed if nobody else holds it, so fetch the models from the registry when needed
+    instead of keeping them in attributes.
+
+    Models are only loaded offline: bert tokenizers from model_dir (or the local huggingface cache)
+    and spacy models from model_dir (or the installed spacy packages).
+    Run this file once with network access to download the tokenizers into model_dir.
+    """
+    default_model_dir = ROOT_DIR / 'data' / 'models'
+    default_max_memory_gb = 8.0
+
+    bert_tokenizers = {
+        'de': "deepset/gbert-base",
+        'fr': "camembert/camembert-base-ccnet",
+        'it': "dbmdz/bert-base-italian-cased",
+    }
+
+    _instance = None
+
+    def __new__(cls, model_dir: Path = None, max_memory_gb: float = None):
+        if cls._instance is None:
+            cls._instance = super(ModelRegistrySingleton, cls).__new__(cls)
+            # Put any initialization here.
+            cls._instance.init(model_dir or cls.default_model_dir, max_memory_gb or cls.default_max_memory_gb)
+        return cls._instance
+
+    def init(self, model_dir: Path, max_memory_gb: float):
+        self.logger = get_logger(__name__)
+        self.model_dir = Path(model_dir)
+        self.max_memory = max_memory_gb * 1024 ** 3
+        self.models = OrderedDict()  # key -> (model, estimated size in bytes), ordered from least to most recently used
+
+    def get_spacy_model(self, model_name: str, disable_pipes: Iterable[str] = (), vocab_dir: Path = None) -> Language:
+        """
+        Returns the spacy model with the given pipes disabled.
+        If vocab_dir is given, the model uses the vocab saved there (see AbstractPreprocessor.save_vocab),
+        the models with different vocabs are cached separately.
+        """
+        disable_pipes = tuple(disable_pipes)
+
+        def load():
+            local_path = self.model_dir / model_name
+            nlp = spacy.load(local_path if local_path.exists() else model_name, disable=disable_pipes)
+            vocab_path = Path(vocab_dir) / "_vocab.spacy" if vocab_dir else None
+            if vocab_path and vocab_path.exists():
+                nlp.vocab = Vocab().from_disk(str(vocab_path), exclude=['vectors'])
+            return nlp
+
+        return self.get(('spacy', model_name, disable_pipes, str(vocab_dir) if vocab_dir else None), load)
+
+    def get_blank_spacy(self, lang: str) -> Language:
+        """Returns the blank spacy model of the language (only containing the tokenizer)"""
+        return self.get(('spacy_blank', lang), lambda: spacy.blank(lang))
+
+    def get_bert_tokenizer(self, lang: str) -> PreTrainedTokenizerBase:
+        """Returns the fast bert tokenizer used for the language"""
+        if lang not in self.bert_tokenizers:
+            raise ValueError(f"Please choose one of the following languages: {list(self.bert_tokenizers.keys())}")
+        model_name = self.bert_tokenizers[lang]
+
+        def load():
+            local_path = self.model_dir / model_name
+            try:
+                return AutoTokenizer.from_pretrained(str(local_path) if local_path.exists() else model_name,
+                                                     local_files_only=True)
+            except OSError as e:
+                raise OSError(f"Could not find the tokenizer {model_name} locally. "
+                              f"Please download it first into {self.model_dir}: {e}")
+
+        return self.get(('bert', model_name), load)
+
+    def get(self, key: tuple, load: Callable):
+        """Returns the cached model for the key or loads it with the given function"""
+        if key in self.models:
+            self.models.move_to_end(key)  # mark as most recently used
+            return self.models[key][0]
+
+        self.logger.info(f"Loading model {key}")
+        memory_before = self.get_memory_usage()
+        model = load()
+        size = max(self.get_memory_usage() - memory_before, 0)
+        self.models[key] = (model, size)
+        self.evict()
+        return model
+
+    def evict(self):
+        """Removes the least recently used models until the models fit into the memory limit again"""
+        while len(self.models) > 1 and self.get_total_size() > self.max_memory:
+            key, _ = self.models.popitem(last=False)
+            self.logger.info(f"Evicting model {key} to stay below {self.max_memory / 1024 ** 3:.1f} GB")
+        gc.collect()
+
+    def get_total_size(self) -> int:
+        return sum(size for _, size in self.models.values())
+
+    @staticmethod
+    def get_memory_usage() -> int:
+        return psutil.Process(os.getpid()).memory_info().rss
+
+    def download_tokenizers(self):
+        """Saves the bert tokenizers into the model dir so that they can be loaded offline afterwards"""
+        for model_name in self.bert_tokenizers.values():
+            local_path = self.model_dir / model_name
+            if not local_path.exists():
+                self.logger.info(f"Downloading tokenizer {model_name} to {local_path}")
+                tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=False)
+                tokenizer.save_pretrained(str(local_path))
+            else:
+                self.logger.info(f"Tokenizer {model_name} already exists in {local_path}")
+
+
+if __name__ == '__main__':
+    model_registry = ModelRegistrySingleton()
+    model_registry.download_tokenizers()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, TYPE_CHECKING
+
+import pandas as pd
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text
+
+from scrc.enums.section import Section
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+
+
+class ParagraphStore:
+    """
+    Stores the paragraphs of the decisions as one row per paragraph:
+    (lang, decision_id, section, ordinal, text, start_offset, end_offset).
+    The offsets are the character offsets of the paragraph in the tab-joined section column of the decision.
+    This way the paragraphs of a section can be fetched directly (e.g. only the first n paragraphs of the rulings)
+    without loading and splitting the whole section text again.
+    """
+    table_name = 'paragraphs'
+    separator = '\t'  # the separator of the paragraphs in the section columns
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        meta = MetaData()
+        self.table = Table(
+            self.table_name, meta,
+            Column('lang', String, primary_key=True),
+            Column('decision_id', Integer, primary_key=True),
+            Column('section', String, primary_key=True),
+            Column('ordinal', Integer, primary_key=True),
+            Column('text', Text),
+            Column('start_offset', Integer),
+            Column('end_offset', Integer),
+        )
+        self.meta = meta
+
+    def create_table(self) -> None:
+        self.meta.create_all(self.engine)
+
+    @classmethod
+    def get_rows(cls, decision_id: int, paragraphs_by_section: Dict[Section, List[str]]) -> List[dict]:
+        """Returns the paragraph rows (without the language) of one decision"""
+        rows = []
+        for section, paragraphs in paragraphs_by_section.items():
+            start = 0
+            for ordinal, paragraph in enumerate(paragraphs):
+                rows.append({'decision_id': int(decision_id), 'section': section.value, 'ordinal': ordinal,
+                             'text': paragraph, 'start_offset': start, 'end_offset': start + len(paragraph)})
+                start += len(paragraph) + len(cls.separator)
+        return rows
+
+    def save(self, lang: str, decision_ids: Iterable[int],
+             paragraphs_by_section_list: Iterable[Optional[Dict[Section, List[str]]]]) -> None:
+        """
+        Replaces the paragraphs of the given decisions.
+        Decisions without paragraphs (None) only get their old paragraphs removed.
+        :param lang:                        the language (table) of the decisions
+        :param decision_ids:                the ids of the decisions
+        :param paragraphs_by_section_list:  the paragraphs of each decision by section
+        """
+        decision_ids = [int(decision_id) for decision_id in decision_ids]
+        rows = []
+        for decision_id, paragraphs_by_section in zip(decision_ids, paragraphs_by_section_list):
+            if paragraphs_by_section:
+                rows.extend(dict(row, lang=lang) for row in self.get_rows(decision_id, paragraphs_by_section))
+        with self.engine.connect() as conn:
+            conn.execute(self.table.delete()
+                         .where(self.table.c.lang == lang)
+                         .where(self.table.c.decision_id.in_(decision_ids)))
+            if rows:
+                conn.execute(self.table.insert(), rows)  # bulk insert
+
+    def get_paragraphs(self, lang: str, decision_ids: Iterable[int], section: Section,
+                       max_paragraphs: int = None) -> Dict[int, List[str]]:
+        """
+        Returns the paragraphs of one section for the given decisions
+        :param lang:            the language (table) of the decisions
+        :param decision_ids:    the ids of the decisions
+        :param section:         the section to get the paragraphs of
+        :param max_paragraphs:  only return the first max_paragraphs paragraphs of each decision (all if None)
+        :return:                a dict with the decision id as key and the list of paragraphs as value
+        """
+        query = self.table.select() \
+            .where(self.table.c.lang == lang) \
+            .where(self.table.c.decision_id.in_([int(decision_id) for decision_id in decision_ids])) \
+            .where(self.table.c.section == section.value)
+        if max_paragraphs is not None:
+            query = query.where(self.table.c.ordinal < max_paragraphs)
+        query = query.order_by(self.table.c.decision_id, self.table.c.ordinal)
+        paragraphs = dict()
+        with self.engine.connect() as conn:
+            for row in conn.execute(query):
+                paragraphs.setdefault(row.decision_id, []).append(row.text)
+        return paragraphs
+
+    @classmethod
+    def get_section_paragraphs_column(cls, lang: str, section: Section, max_paragraphs: int = None,
+                                      decision_alias='d', column_alias: str = None) -> str:
+        """
+        Returns an sql expression selecting the paragraphs of the section as text[] for each decision (row of d).
+        Decisions which are not in the store yet fall back to splitting the section column on the database server.
+        """
+        limit = f" AND p.ordinal < {int(max_paragraphs)}" if max_paragraphs is not None else ""
+        fallback = f"string_to_array({decision_alias}.{section.value}, E'\\t')"
+        if max_paragraphs is not None:
+            fallback = f"({fallback})[1:{int(max_paragraphs)}]"
+        return f"COALESCE((SELECT array_agg(p.text ORDER BY p.ordinal) FROM {cls.table_name} p " \
+               f"WHERE p.lang = '{lang}' AND p.decision_id = {decision_alias}.id " \
+               f"AND p.section = '{section.value}'{limit}), {fallback}) " \
+               f"AS {column_alias or section.value + '_paragraphs'}"
+
+    @classmethod
+    def stream_sections(cls, engine: Engine, lang: str, sections: List[Section], columns: str = "id",
+                        where: str = None, max_paragraphs: int = None, chunksize=1000):
+        """
+        Streams the decisions with the paragraphs of the given sections as lists (one column per section)
+        :param engine:          the db engine to work upon
+        :param lang:            the language (table) of the decisions
+        :param sections:        the sections to get the paragraphs of (columns named <section>_paragraphs)
+        :param columns:         the other columns of the decisions to select (comma separated list)
+        :param where:           an sql WHERE clause to filter the decisions
+        :param max_paragraphs:  only return the first max_paragraphs paragraphs of each section (all if None)
+        :param chunksize:       the number of rows to retrieve per chunk
+        :return:                a generator of pd.DataFrame
+        """
+        paragraph_columns = ", ".join(cls.get_section_paragraphs_column(lang, section, max_paragraphs)
+                                      for section in sections)
+        # the paragraphs are selected in a correlated subquery, so the where clause only refers to the decisions
+        query = f"SELECT {columns}, {paragraph_columns} FROM {lang} d"
+        if where:
+            query += " WHERE " + where
+        with engine.connect().execution_options(stream_results=True) as conn:
+            for chunk_df in pd.read_sql(query, conn, chunksize=chunksize):
+                yield chunk_df
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from scrc.enums.language import Language
+
+
+class SpiderFunction:
+    """
+    A spider specific function together with what it needs to run:
+    the languages it supports (all if None), the database columns it requires (in addition to the metadata)
+    and a hook which is called once before the first decision is processed (e.g. to load lookup tables).
+    """
+
+    def __init__(self, function: Callable, languages: Optional[Iterable[Union[Language, str]]] = None,
+                 required_columns: Optional[List[str]] = None, prepare: Optional[Callable[[], Any]] = None):
+        self.function = function
+        self.name = function.__name__
+        self.languages = None if languages is None else {Language(language).value for language in languages}
+        self.required_columns = list(required_columns or [])
+        self.prepare_hook = prepare
+        self.prepared = False
+
+    def supports(self, language: Union[Language, str]) -> bool:
+        return self.languages is None or Language(language).value in self.languages
+
+    def prepare(self) -> None:
+        """Calls the prepare hook the first time only"""
+        if not self.prepared and self.prepare_hook is not None:
+            self.prepare_hook()
+        self.prepared = True
+
+    def __call__(self, data: Any, namespace: dict) -> Any:
+        return self.function(data, namespace)
+
+
+def spider_function(languages: Optional[Iterable[Union[Language, str]]] = None,
+                    required_columns: Optional[List[str]] = None, prepare: Optional[Callable[[], Any]] = None):
+    """
+    Decorator declaring the requirements of a spider specific function (see SpiderFunction).
+    The decorated function itself stays unchanged and can still be called directly.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        function.spider_function = SpiderFunction(function, languages, required_columns, prepare)
+        return function
+
+    return decorator
+
+
+class SpiderFunctionRegistry:
+    """
+    Looks up the spider specific functions of a loaded functions module by the name of the spider.
+    Functions which are not decorated with spider_function support all languages and require no extra columns.
+    """
+
+    def __init__(self, module: ModuleType):
+        self.module = module
+        self.functions: Dict[str, Optional[SpiderFunction]] = dict()
+
+    def get(self, spider: str) -> Optional[SpiderFunction]:
+        """Returns the function of the spider or None if the module has none"""
+        if spider not in self.functions:
+            function = getattr(self.module, spider, None)
+            if callable(function):
+                self.functions[spider] = getattr(function, 'spider_function', None) or SpiderFunction(function)
+            else:
+                self.functions[spider] = None
+        return self.functions[spider]
+
+    def __contains__(self, spider: str) -> bool:
+        return self.get(spider) is not None
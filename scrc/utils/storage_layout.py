@@ -0,0 +1,191 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
+
+import pandas as pd
+from sqlalchemy import MetaData, Table
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import bindparam
+
+from scrc.enums.section import Section
+from scrc.utils.log_utils import get_logger
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Connection, Engine
+
+logger = get_logger(__name__)
+
+
+class StorageLayout:
+    """
+    Storage layout of a language table separating the large and the frequently updated columns from the metadata:
+    <lang>_metadata:    the metadata of the decisions (and all the columns not belonging to a stage)
+    <lang>_raw:         the raw html and pdf documents (lz4 compressed if the server supports it)
+    <lang>_<stage>:     one narrow table per stage with the columns it writes (e.g. <lang>_judgments)
+    <lang>:             a view joining them with the original column names, so that all the readers keep working
+    Updating an extracted column therefore only writes a new version of a narrow row instead of the whole decision.
+    Until the table is separated (see separate), everything is stored in the table <lang> as before.
+    """
+    raw_columns = ['html_raw', 'pdf_raw']
+    stage_columns = {
+        'text': ['text'],
+        'sections': [section.value for section in Section],
+        'citations': ['citations'],
+        'judgments': ['judgments'],
+        'lower_court': ['lower_court'],
+        'court_composition': ['court_composition'],
+        'parties': ['parties'],
+    }
+    side_table_fillfactor = 70  # leaves room on the pages for updates without moving the row (HOT updates)
+    _separated_langs: Set[str] = set()  # a separation is never undone, so only the separated languages are cached
+
+    def __init__(self, engine: Engine, lang: str):
+        self.engine = engine
+        self.lang = lang
+        self.base_table = f"{lang}_metadata"
+
+    @classmethod
+    def get_stage(cls, column: str) -> Optional[str]:
+        """Returns the stage (the suffix of the side table) of the column or None if it stays in the metadata table"""
+        if column in cls.raw_columns:
+            return 'raw'
+        for stage, columns in cls.stage_columns.items():
+            if column in columns:
+                return stage
+        if 'num_tokens' in column:  # the token counts of the nlp pipeline runner
+            return 'num_tokens'
+        return None
+
+    def get_side_table(self, stage: str) -> str:
+        return f"{self.lang}_{stage}"
+
+    def get_side_tables(self, conn: Connection) -> List[str]:
+        stages = ['raw'] + list(self.stage_columns.keys()) + ['num_tokens']
+        side_tables = [self.get_side_table(stage) for stage in stages]
+        return [side_table for side_table in side_tables if self.table_exists(conn, side_table)]
+
+    def get_table(self, column: str) -> str:
+        """Returns the table the column is stored in"""
+        if not self.is_separated():
+            return self.lang
+        stage = self.get_stage(column)
+        return self.base_table if stage is None else self.get_side_table(stage)
+
+    def is_separated(self) -> bool:
+        if self.lang not in self._separated_langs:
+            with self.engine.connect() as conn:
+                if self.table_exists(conn, self.base_table):
+                    self._separated_langs.add(self.lang)
+        return self.lang in self._separated_langs
+
+    @staticmethod
+    def table_exists(conn: Connection, table: str) -> bool:
+        return conn.execute(f"SELECT to_regclass('{table}') IS NOT NULL").scalar()
+
+    @staticmethod
+    def get_column_types(conn: Connection, table: str) -> Dict[str, str]:
+        """Returns the columns of the table with their sql types (in the order of the table)"""
+        query = f"SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute " \
+                f"WHERE attrelid = '{table}'::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum"
+        return {name: data_type for name, data_type in conn.execute(query).fetchall()}
+
+    def get_column_definition(self, conn: Connection, column: str, data_type: str) -> str:
+        if column in self.raw_columns and int(conn.execute("SHOW server_version_num").scalar()) >= 140000:
+            # lz4 (postgres 14+) compresses and decompresses the documents much faster than the default pglz
+            return f"{column} {data_type} COMPRESSION lz4"
+        return f"{column} {data_type}"
+
+    def create_side_table(self, conn: Connection, side_table: str) -> None:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {side_table} (id integer PRIMARY KEY) "
+                     f"WITH (fillfactor = {self.side_table_fillfactor})")
+
+    def separate(self) -> None:
+        """
+        Moves the raw documents and the columns of the stages out of the language table into their own tables
+        and replaces the language table with a view. Only the side tables of existing columns are created,
+        the others are created when their columns are added (see add_column).
+        The space of the moved columns is only given back to the os when the metadata table is rewritten (VACUUM FULL).
+        """
+        if self.is_separated():
+            return
+        logger.info(f"Separating the raw documents and the extracted columns of table {self.lang}")
+        with self.engine.begin() as conn:  # everything or nothing
+            column_types = self.get_column_types(conn, self.lang)
+            stages = dict()
+            for column in column_types:
+                if self.get_stage(column) is not None:
+                    stages.setdefault(self.get_stage(column), []).append(column)
+            conn.execute(f"ALTER TABLE {self.lang} RENAME TO {self.base_table}")
+            for stage, columns in stages.items():
+                side_table = self.get_side_table(stage)
+                self.create_side_table(conn, side_table)
+                conn.execute(f"ALTER TABLE {side_table} " + ", ".join(
+                    f"ADD COLUMN {self.get_column_definition(conn, column, column_types[column])}" for column in columns))
+                # decisions without any value in the stage do not need a row
+                has_value = " OR ".join(f"{column} IS NOT NULL" for column in columns)
+                conn.execute(f"INSERT INTO {side_table} (id, {', '.join(columns)}) "
+                             f"SELECT id, {', '.join(columns)} FROM {self.base_table} WHERE {has_value}")
+            moved_columns = [column for columns in stages.values() for column in columns]
+            if moved_columns:
+                conn.execute(f"ALTER TABLE {self.base_table} "
+                             + ", ".join(f"DROP COLUMN {column}" for column in moved_columns))
+            self.create_view(conn)
+        self._separated_langs.add(self.lang)
+        logger.info(f"Finished separating table {self.lang}")
+
+    def create_view(self, conn: Connection) -> None:
+        """(Re)creates the view with the original name and columns of the language table"""
+        columns, joins = ["m.*"], []
+        for i, side_table in enumerate(self.get_side_tables(conn)):
+            side_columns = [column for column in self.get_column_types(conn, side_table) if column != 'id']
+            columns.extend(f"s{i}.{column}" for column in side_columns)
+            joins.append(f"LEFT JOIN {side_table} s{i} ON s{i}.id = m.id")
+        conn.execute(f"DROP VIEW IF EXISTS {self.lang}")
+        conn.execute(f"CREATE VIEW {self.lang} AS SELECT {', '.join(columns)} "
+                     f"FROM {self.base_table} m {' '.join(joins)}")
+
+    def drop_view(self, conn: Connection) -> None:
+        """Drops the view, e.g. to replace the metadata table it depends on (recreate it with create_view)"""
+        conn.execute(f"DROP VIEW IF EXISTS {self.lang}")
+
+    def add_column(self, column: str, data_type: str) -> None:
+        """Adds the column to the table of its stage (creating the side table if necessary) and to the view"""
+        table = self.get_table(column)
+        with self.engine.begin() as conn:
+            if self.table_exists(conn, table) and column in self.get_column_types(conn, table):
+                return
+            if table != self.base_table:
+                self.create_side_table(conn, table)
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {self.get_column_definition(conn, column, data_type)}")
+            self.create_view(conn)
+
+    def update(self, df: pd.DataFrame, columns: List[str]) -> None:
+        """Saves the columns of the df in their tables (inserting the rows missing in the side tables)"""
+        tables = dict()
+        for column in columns:
+            tables.setdefault(self.get_table(column), []).append(column)
+        with self.engine.begin() as conn:
+            for table_name, table_columns in tables.items():
+                table = Table(table_name, MetaData(), autoload_with=conn)
+                records = df[['id'] + table_columns].to_dict('records')
+                if table_name == self.base_table:
+                    records = [dict(record, b_id=record.pop('id')) for record in records]
+                    conn.execute(table.update().where(table.c.id == bindparam('b_id')), records)
+                else:
+                    stmt = insert(table)
+                    stmt = stmt.on_conflict_do_update(index_elements=[table.c.id],
+                                                      set_={column: stmt.excluded[column] for column in table_columns})
+                    conn.execute(stmt, records)
+
+    def insert(self, df: pd.DataFrame) -> None:
+        """Inserts new decisions (with the columns of the original language table) into the separated tables"""
+        with self.engine.begin() as conn:
+            # the ids of the side tables need to be known before inserting into the metadata table
+            ids = conn.execute(f"SELECT nextval(pg_get_serial_sequence('{self.base_table}', 'id')) "
+                               f"FROM generate_series(1, {len(df.index)})").fetchall()
+            df = df.assign(id=[row[0] for row in ids])
+            tables = {self.base_table: []}
+            for column in df.columns:
+                if column != 'id':
+                    tables.setdefault(self.get_table(column), []).append(column)
+            for table, columns in tables.items():
+                df[['id'] + columns].to_sql(table, conn, if_exists="append", index=False)
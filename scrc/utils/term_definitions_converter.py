@@ -1,3 +1,4 @@
+import hashlib
 import json
 from collections import OrderedDict
 from pprint import pprint
@@ -10,8 +11,13 @@ from scrc.utils.log_utils import get_logger
 
 class TermDefinitionsConverter:
     base_dir = ROOT_DIR / 'term_definitions'
+    original_file = base_dir / 'ABR19_Titel_Bundeserlasse.xml'
     languages = ['de', 'fr', 'it', 'rm', 'en', 'es']
 
+    _law_abbreviation_index = None  # cached per process
+    # increased whenever the stored indexes need to be built again (e.g. indexes built from stale term definitions)
+    law_abbreviation_index_version = 2
+
     def __init__(self, ):
         self.logger = get_logger(__name__)
 
@@ -20,14 +26,13 @@ class TermDefinitionsConverter:
         xmldict = xmltodict.parse(original_file.read_text())
         return xmldict['xml']['Eintraege']['Eintrag']
 
-    def extract_term_definitions(self):
+    def extract_term_definitions(self, force=False):
         output_file = self.base_dir / 'term_definitions.json'
-        if output_file.exists():
+        if output_file.exists() and not force:
             self.logger.info(f"The file {output_file} exists already. Please delete it to rerun the extraction.")
             return json.loads(output_file.read_text())
 
-        original_file = self.base_dir / 'ABR19_Titel_Bundeserlasse.xml'
-        content = self.read_original_file(original_file)
+        content = self.read_original_file(self.original_file)
 
         terms = []
         for entry in content:
@@ -59,6 +64,51 @@ class TermDefinitionsConverter:
         self.logger.info("Successfully extracted the term definitions.")
         return terms
 
+    def get_law_abbreviation_index(self):
+        """
+        Returns the index of the law abbreviations which is precomputed once per version of the original xml file.
+        The index is invalidated as soon as the hash of the xml file or the version of the index changes.
+        :return:    a dict containing the mapping from the abbreviations to the term id per language (abbr_to_id)
+        """
+        if TermDefinitionsConverter._law_abbreviation_index is not None:
+            return TermDefinitionsConverter._law_abbreviation_index
+
+        index_file = self.base_dir / 'law_abbreviation_index.json'
+        source_hash = self.get_original_file_hash()
+        index = json.loads(index_file.read_text()) if index_file.exists() else None
+        if index is None or index.get('version') != self.law_abbreviation_index_version \
+                or (source_hash is not None and index['source_hash'] != source_hash):
+            self.logger.info(f"Building the law abbreviation index {index_file}")
+            # the term definitions need to be extracted again, because the stored ones may come from an older xml file
+            # (only the stored ones can be used if the xml file is not available)
+            term_definitions = self.extract_term_definitions(force=source_hash is not None)
+            index = self.build_law_abbreviation_index(term_definitions, source_hash)
+            index_file.write_text(json.dumps(index, ensure_ascii=False))
+
+        TermDefinitionsConverter._law_abbreviation_index = index
+        return index
+
+    def build_law_abbreviation_index(self, term_definitions, source_hash):
+        """
+        Builds the index of the law abbreviations from the term definitions
+        :param term_definitions:    the term definitions as returned by extract_term_definitions
+        :param source_hash:         the hash of the xml file the term definitions were extracted from
+        :return:
+        """
+        abbr_to_id = {lang: dict() for lang in self.languages}
+        for definition in term_definitions:
+            for lang, entries in definition['languages'].items():
+                for entry in entries:
+                    if entry['type'] == 'ab':  # ab stands for abbreviation
+                        abbr_to_id[lang][entry['text']] = definition['id']
+        return {'version': self.law_abbreviation_index_version, 'source_hash': source_hash, 'abbr_to_id': abbr_to_id}
+
+    def get_original_file_hash(self):
+        """Returns the sha256 hash of the original xml file (None if it is not available)"""
+        if not self.original_file.exists():
+            return None
+        return hashlib.sha256(self.original_file.read_bytes()).hexdigest()
+
 
 if __name__ == '__main__':
     term_definitions_extractor = TermDefinitionsConverter()